@@ -2,6 +2,8 @@
 
 import os
 import io
+import asyncio
+import json
 import sys
 from datetime import datetime
 from tools.logger import logger
@@ -16,17 +18,25 @@ start_import = datetime.now()
 from .openai_like_model import (
     inferWithClassic, inferWithEmotions, inferWithMulti, installModel, checkModelInstalled, openaiLikeInfer, requestVersion, ShutdownRequest
 )
-from tools.my_infer import get_multi_ref_template, create_speaker_list, single_infer, multi_infer, pre_infer, get_classic_model_list, classic_infer, get_version, check_installed, install_model, delete_model, openai_like_infer
+from .supervisor import Supervisor, create_router
+from .job_queue import InferenceWorker, SingleFlight, QueueFullError, JobCancelledError, PRIORITY_INTERACTIVE, PRIORITY_BATCH
 from fastapi import FastAPI, File, UploadFile, Request, Response
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.encoders import jsonable_encoder
 import argparse
 import uvicorn
 from pathlib import Path
 import webbrowser
 import signal
+import atexit
 import mimetypes
+import threading
+from collections import OrderedDict
+from importlib import import_module
+from time import perf_counter, time
+from hashlib import md5
 logger.success("模块导入完成，可喜可贺！！！")
 end_import = datetime.now()
 logger.info(f"导入耗时: {end_import - start_import}")
@@ -42,9 +52,132 @@ infer_key: str = ""
 host: str = ""
 port: int = 8000
 ref_audio_path: str = ""
+# 根据请求的格式动态设置MIME类型
+media_type_map = {
+    "mp3": "audio/mpeg",
+    "wav": "audio/wav",
+    "aac": "audio/aac",
+    "ogg": "audio/ogg",
+    "opus": "audio/ogg",
+    "raw": "application/octet-stream"
+}
 
 ### CONSTANTS ###
 
+### ENGINE ###
+
+# 推理模块（torch、GPT_SoVITS）导入很慢，不在启动时导入；load_engine 导入后把这些名字放进本模块的全局变量
+ENGINE_MODULE = "tools.my_infer"
+ENGINE_NAMES = (
+    "get_multi_ref_template", "create_speaker_list", "single_infer", "multi_infer", "multi_infer_stream", "pre_infer",
+    "get_classic_model_list", "classic_infer", "get_version", "check_installed", "install_model", "get_install_status",
+    "wait_install", "preload_voice", "delete_model", "openai_like_infer", "openai_like_infer_stream", "stream_media_types",
+    "get_cache_stats", "get_ref_feature_stats", "get_pool_stats", "get_segment_stats", "get_frontend_stats",
+    "get_memory_stats", "get_output_stats", "serve_output", "get_encoder_stats", "get_metrics", "record_request",
+    "record_coalesced", "StageTimer",
+)
+# 推理模块就绪前这些接口返回 503
+ENGINE_PATHS = (
+    "/version", "/cache_stats", "/metrics", "/encoder_stats", "/template", "/models", "/infer_", "/classic_model_list",
+    "/v1/", "/jobs", "/check_model", "/install_", "/delete_model", "/outputs/",
+)
+
+class EngineState:
+    """ 推理模块的启动进度（pending / importing / initializing / serving / failed）与各预载模型的状态 """
+
+    def __init__(self):
+        self.stage = "pending"
+        self.error = ""
+        self.started = time()
+        self.timings = {}  # 阶段 -> 秒
+        self.voices = OrderedDict()  # 模型 -> {"status": pending / loading / ready / failed, "seconds": float}
+        self.lock = threading.Lock()
+
+    @property
+    def serving(self) -> bool:
+        return self.stage == "serving"
+
+    def mark(self, name: str, start: float) -> None:
+        self.timings[name] = round(perf_counter() - start, 3)
+
+    def set_voice(self, voice: str, status: str, seconds: float = None) -> None:
+        with self.lock:
+            self.voices[voice] = {"status": status, "seconds": None if seconds is None else round(seconds, 3)}
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            voices = {voice: dict(entry) for voice, entry in self.voices.items()}
+        return {
+            "ready": self.serving,
+            "stage": self.stage,
+            "error": self.error,
+            "uptime": round(time() - self.started, 3),
+            "timings": dict(self.timings),
+            "voices": voices,
+            "voices_ready": all(entry["status"] == "ready" for entry in voices.values()),
+        }
+
+engine = EngineState()
+
+def load_engine(*pre_infer_args) -> None:
+    """ 导入推理模块并以 pre_infer_args 初始化 TTS，记录各阶段耗时 """
+    try:
+        engine.stage = "importing"
+        start = perf_counter()
+        module = import_module(ENGINE_MODULE)
+        globals().update({name: getattr(module, name) for name in ENGINE_NAMES})
+        engine.mark("import", start)
+        logger.info(f"推理模块导入耗时: {engine.timings['import']}s")
+        engine.stage = "initializing"
+        start = perf_counter()
+        pre_infer(*pre_infer_args)
+        engine.mark("init", start)
+        engine.stage = "serving"
+        logger.success(f"推理模块已就绪，初始化耗时: {engine.timings['init']}s")
+    except Exception as e:
+        engine.stage = "failed"
+        engine.error = str(e)
+        logger.error(f"推理模块启动失败: {e}")
+        raise
+
+def preload_voices(voices: list[str], background: bool) -> None:
+    """ 预载模型并记录各自的就绪状态；background 为 True 时交给推理线程排在交互请求之后执行 """
+    for voice in voices:
+        engine.set_voice(voice, "pending")
+    for voice in voices:
+        engine.set_voice(voice, "loading")
+        start = perf_counter()
+        if background:
+            try:
+                job = inference_worker.submit(preload_voice, voice, priority=PRIORITY_BATCH, wait=False)
+            except QueueFullError:
+                engine.set_voice(voice, "failed", perf_counter() - start)
+                logger.warning(f"推理队列已满，跳过预载: {voice}")
+                continue
+            job.done.wait()
+            ok = job.status == "done" and job.result
+        else:
+            ok = preload_voice(voice)
+        engine.set_voice(voice, "ready" if ok else "failed", perf_counter() - start)
+
+def warm_start(pre_infer_args: tuple, voices: list[str]) -> None:
+    """ 端口绑定后在后台导入推理模块，之后依次预载模型 """
+    def run():
+        try:
+            load_engine(*pre_infer_args)
+        except Exception:
+            return
+        preload_voices(voices, background=True)
+        logger.success(f"预载完成，启动到全部就绪耗时: {time() - engine.started:.2f}s")
+    threading.Thread(target=run, name="gsvi-warm-start", daemon=True).start()
+
+### ENGINE ###
+
+# 推理工作线程：GPU 推理都在这里串行执行，事件循环不再被阻塞
+inference_worker = InferenceWorker()
+# 固定种子的相同请求在合成中时合并为一次
+single_flight = SingleFlight()
+
 APP = FastAPI()
 APP.add_middleware(
     CORSMiddleware,
@@ -68,6 +201,13 @@ async def global_exception_handler(request: Request, exc: Exception) -> JSONResp
 
 ### MIDDLEWARES ###
 
+@APP.middleware("http")
+async def wait_for_engine(request: Request, call_next) -> Response:
+    if not engine.serving and request.url.path.startswith(ENGINE_PATHS):
+        content = {"msg": "服务正在启动，请稍后再试" if engine.stage != "failed" else "推理模块启动失败，请查看终端", "stage": engine.stage}
+        return JSONResponse(content=content, status_code=503, headers={"Retry-After": "2"})
+    return await call_next(request)
+
 @APP.middleware("http")
 async def log_request(request: Request, call_next) -> Response:
     req_from = f"({request.client.host}:{request.client.port})" if request.client else "UNKNOWN"
@@ -83,12 +223,37 @@ async def log_request(request: Request, call_next) -> Response:
 async def root():
     return {"message": "This is a TTS inference API. If you see this page, it means the server is running."}
 
+# 启动进度与各预载模型的就绪状态；指定 voice（版本/模型名）时只看该模型是否已预载
+@APP.get("/ready")
+async def ready(voice: str = ""):
+    state = engine.to_dict()
+    if voice:
+        ok = engine.serving and state["voices"].get(voice, {}).get("status") == "ready"
+    else:
+        ok = engine.serving
+    return JSONResponse(content={"msg": "服务已就绪" if ok else "服务正在启动", **state}, status_code=200 if ok else 503)
+
 # 获取支持的版本号
 @APP.get("/version")
 async def version():
     versions = get_version()
     return {"msg": "获取版本号成功", "support_versions": versions}
 
+# 获取合成缓存统计
+@APP.get("/cache_stats")
+async def cache_stats():
+    return {"msg": "获取缓存统计成功", "synth_cache": get_cache_stats(), "ref_features": get_ref_feature_stats(), "segments": get_segment_stats(), "frontend": get_frontend_stats(), "weight_pool": get_pool_stats(), "memory": get_memory_stats(), "outputs": get_output_stats()}
+
+# Prometheus 指标：各阶段耗时直方图（按版本与格式区分）与缓存计数
+@APP.get("/metrics")
+async def prometheus_metrics():
+    return Response(content=get_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# 获取音频编码统计
+@APP.get("/encoder_stats")
+async def encoder_stats():
+    return {"msg": "获取编码统计成功", "encoders": get_encoder_stats()}
+
 # 获取多人对话模板
 @APP.post("/template")
 async def template(model: requestVersion):
@@ -101,47 +266,160 @@ async def speaker_list(model: requestVersion):
     model_list, msg = create_speaker_list(model.version)
     return {"msg": msg, "models": model_list}
 
-# 根据情感进行推理
-@APP.post("/infer_single")
-async def infer_emotion(model: inferWithEmotions):
+### INFERENCE JOBS ###
+
+class BufferResponse(Response):
+    """ 响应体直接使用编码好的缓冲区（memoryview），不再复制成 bytes """
+
+    def render(self, content) -> memoryview:
+        return memoryview(content)
+
+def coalesce_key(endpoint: str, model, seed: int) -> str:
+    """ 固定种子时相同参数的请求结果相同，可以合并为一次合成；随机种子时返回空字符串 """
+    if seed == -1:
+        return ""
+    payload = json.dumps([endpoint, jsonable_encoder(model)], sort_keys=True, ensure_ascii=False)
+    return md5(payload.encode("utf-8")).hexdigest()
+
+def share_result(result) -> Response:
+    """ 合并请求的结果：每个等待方各自一个响应对象，共用同一块音频缓冲区 """
+    headers = {"X-Coalesced": "1"}
+    if isinstance(result, Response):
+        return BufferResponse(content=result.body, status_code=result.status_code, media_type=result.media_type, headers=headers)
+    return JSONResponse(content=result, headers=headers)
+
+async def dispatch(func, *args, priority: int = PRIORITY_INTERACTIVE, wait: bool = True, endpoint: str = "", version: str = "", media_type: str = "", timing: bool = False, coalesce: str = ""):
+    """
+    把推理交给工作线程；队列已满返回 429，wait 为 False 时立即返回任务 ID 供 /jobs/{job_id} 轮询。
+    各阶段耗时记入 /metrics，timing 为 True 时同时以 X-Timing 响应头（毫秒）返回。
+    coalesce 为 coalesce_key 的结果，相同键的请求正在合成时直接等待它的结果（响应头带 X-Coalesced）。
+    """
+    if not coalesce or not wait:
+        return await submit_job(func, *args, priority=priority, wait=wait, endpoint=endpoint, version=version, media_type=media_type, timing=timing)
+    coalesced, result = await single_flight.run(coalesce, lambda: submit_job(func, *args, priority=priority, endpoint=endpoint, version=version, media_type=media_type, timing=timing))
+    if not coalesced:
+        return result
+    record_coalesced(endpoint)
+    return share_result(result)
+
+async def submit_job(func, *args, priority: int = PRIORITY_INTERACTIVE, wait: bool = True, endpoint: str = "", version: str = "", media_type: str = "", timing: bool = False):
+    timer = StageTimer(trace_memory=timing)
+    start = perf_counter()
+    try:
+        job = inference_worker.submit(timer.run, func, *args, priority=priority, wait=wait)
+    except QueueFullError as e:
+        return JSONResponse(content={"msg": "推理队列已满，请稍后再试", "queue_depth": e.depth}, status_code=429)
+    if not wait:
+        return JSONResponse(content={"msg": "任务已加入队列", "job_id": job.id, "queue_depth": inference_worker.depth()}, status_code=202)
     try:
-        if model.app_key != infer_key and infer_key != "":
-            msg = "app_key错误"
+        result = await job.future
+    except JobCancelledError:
+        return JSONResponse(content={"msg": "任务已取消", "job_id": job.id}, status_code=409)
+    timer.add("queue_wait", job.started - job.created)
+    timer.add("total", perf_counter() - start)
+    record_request(endpoint, timer, version, media_type)
+    if timing:
+        headers = {"X-Timing": timer.header()}
+        if timer.memory:
+            headers["X-Memory"] = timer.memory_header()
+        if isinstance(result, Response):
+            result.headers.update(headers)
+        else:
+            result = JSONResponse(content=result, headers=headers)
+    return result
+
+def run_infer_single(model: inferWithEmotions) -> dict:
+    try:
+        audio_path, msg = single_infer(model.model_name, model.prompt_text_lang, model.emotion, model.text, model.text_lang, model.top_k, model.top_p, model.temperature, model.text_split_method, model.batch_size, model.batch_threshold, model.split_bucket, model.speed_facter, model.fragment_interval, model.media_type, model.parallel_infer, model.repetition_penalty, model.seed, model.sample_steps, model.if_sr, model.version)
+        if audio_path == "":
             audio_url = ""
         else:
-            audio_path, msg = single_infer(model.model_name, model.prompt_text_lang, model.emotion, model.text, model.text_lang, model.top_k, model.top_p, model.temperature, model.text_split_method, model.batch_size, model.batch_threshold, model.split_bucket, model.speed_facter, model.fragment_interval, model.media_type, model.parallel_infer, model.repetition_penalty, model.seed, model.sample_steps, model.if_sr, model.version)
-            if audio_path == "":
-                audio_url = ""
+            if model.dl_url == "":
+                audio_url = f"http://{host}:{port}/{audio_path}"
             else:
-                if model.dl_url == "":
-                    audio_url = f"http://{host}:{port}/{audio_path}"
-                else:
-                    audio_url = f"{model.dl_url}/{audio_path}"
+                audio_url = f"{model.dl_url}/{audio_path}"
     except Exception as e:
         print(e)
         msg = "参数错误"
         audio_url = ""
     return {"msg": msg, "audio_url": audio_url}
 
-# 根据多人对话模板进行推理
-@APP.post("/infer_multi")
-async def infer_multi(model: inferWithMulti):
+def run_infer_multi(model: inferWithMulti) -> dict:
     try:
-        if model.app_key != infer_key and infer_key != "":
-            msg = "app_key错误"
-            archive_url = ""
+        archive_path, msg = multi_infer(model.content, model.top_k, model.top_p, model.temperature, model.text_split_method, model.batch_size, model.batch_threshold, model.split_bucket, model.fragment_interval, model.media_type, model.parallel_infer, model.repetition_penalty, model.seed, model.sample_steps, model.if_sr)  
+        if model.dl_url == "":
+            archive_url = f"http://{host}:{port}/{archive_path}"
         else:
-            archive_path, msg = multi_infer(model.content, model.top_k, model.top_p, model.temperature, model.text_split_method, model.batch_size, model.batch_threshold, model.split_bucket, model.fragment_interval, model.media_type, model.parallel_infer, model.repetition_penalty, model.seed, model.sample_steps, model.if_sr)  
-            if model.dl_url == "":
-                archive_url = f"http://{host}:{port}/{archive_path}"
-            else:
-                archive_url = f"{model.dl_url}/{archive_path}"
+            archive_url = f"{model.dl_url}/{archive_path}"
     except Exception as e:
         print(e)
         msg = "参数错误"
         archive_url = ""
     return {"msg": msg, "archive_url": archive_url}
 
+def run_infer_classic(model: inferWithClassic) -> dict:
+    try:
+        audio_path, msg = classic_infer(model.gpt_model_name, model.sovits_model_name, model.ref_audio_path, model.prompt_text, model.prompt_text_lang, model.text, model.text_lang, model.top_k, model.top_p, model.temperature, model.text_split_method, model.batch_size, model.batch_threshold, model.split_bucket, model.speed_facter, model.fragment_interval, model.seed, model.media_type, model.parallel_infer, model.repetition_penalty, model.sample_steps, model.if_sr, model.version)
+        if audio_path == "":
+            audio_url = ""
+        else:
+            if model.dl_url == "":
+                audio_url = f"http://{host}:{port}/{audio_path}"
+            else:
+                audio_url = f"{model.dl_url}/{audio_path}"
+    except Exception as e:
+        print(e)
+        msg = "参数错误"
+        audio_url = ""
+    return {"msg": msg, "audio_url": audio_url}
+
+def run_openai_like_infer(model: openaiLikeInfer):
+    audio_byte, msg = openai_like_infer(model.model, model.input, model.voice, model.response_format, model.speed, model.other_params)
+    if audio_byte is None:
+        return {
+            "error": {
+                "message": msg,
+                "type": "processing_error",
+                "param": "unknown",
+                "code": "processing_failed"
+            }
+        }
+    response_media_type = media_type_map.get(model.response_format, "audio/wav") # 默认为wav
+    return BufferResponse(content=audio_byte, media_type=response_media_type)
+
+### INFERENCE JOBS ###
+
+# 根据情感进行推理
+@APP.post("/infer_single")
+async def infer_emotion(model: inferWithEmotions, wait: bool = True, timing: bool = False):
+    if model.app_key != infer_key and infer_key != "":
+        return {"msg": "app_key错误", "audio_url": ""}
+    return await dispatch(run_infer_single, model, wait=wait, endpoint="infer_single", version=model.version, media_type=model.media_type, timing=timing, coalesce=coalesce_key("infer_single", model, model.seed))
+
+# 根据多人对话模板进行推理
+@APP.post("/infer_multi")
+async def infer_multi(model: inferWithMulti, wait: bool = True, timing: bool = False, stream: bool = False):
+    if model.app_key != infer_key and infer_key != "":
+        return {"msg": "app_key错误", "archive_url": ""}
+    if stream:
+        # 边合成边下载 zip：每合成完一句就把这一句追加到压缩包并推送给客户端
+        archive_stream, archive_path, msg = multi_infer_stream(model.content, model.top_k, model.top_p, model.temperature, model.text_split_method, model.batch_size, model.batch_threshold, model.split_bucket, model.fragment_interval, model.media_type, model.parallel_infer, model.repetition_penalty, model.seed, model.sample_steps, model.if_sr)
+        if archive_stream is None:
+            return {"msg": msg, "archive_url": ""}
+        try:
+            _, chunks = await inference_worker.stream(archive_stream, priority=PRIORITY_BATCH)
+        except QueueFullError as e:
+            archive_stream.close()
+            return JSONResponse(content={"msg": "推理队列已满，请稍后再试", "queue_depth": e.depth}, status_code=429)
+        archive_url = f"{model.dl_url or f'http://{host}:{port}'}/{archive_path}"
+        headers = {
+            "Content-Disposition": f'attachment; filename="{Path(archive_path).name}"',
+            "X-Archive-Url": archive_url,
+        }
+        return StreamingResponse(chunks, media_type="application/zip", headers=headers)
+    # 多人对话每行可指定不同版本，版本标签统一记为 mixed
+    return await dispatch(run_infer_multi, model, priority=PRIORITY_BATCH, wait=wait, endpoint="infer_multi", version="mixed", media_type=model.media_type, timing=timing, coalesce=coalesce_key("infer_multi", model, model.seed))
+
 # 获取经典模型列表
 @APP.post("/classic_model_list")
 async def classic_model_list(model: requestVersion):
@@ -156,32 +434,18 @@ async def classic_model_list(model: requestVersion):
 
 # 经典模式推理
 @APP.post("/infer_classic")
-async def infer_classic(model: inferWithClassic):
-    try:
-        if model.app_key != infer_key and infer_key != "":
-            msg = "app_key错误"
-            audio_url = ""
-        else:
-            audio_path, msg = classic_infer(model.gpt_model_name, model.sovits_model_name, model.ref_audio_path, model.prompt_text, model.prompt_text_lang, model.text, model.text_lang, model.top_k, model.top_p, model.temperature, model.text_split_method, model.batch_size, model.batch_threshold, model.split_bucket, model.speed_facter, model.fragment_interval, model.seed, model.media_type, model.parallel_infer, model.repetition_penalty, model.sample_steps, model.if_sr, model.version)
-            if audio_path == "":
-                audio_url = ""
-            else:
-                if model.dl_url == "":
-                    audio_url = f"http://{host}:{port}/{audio_path}"
-                else:
-                    audio_url = f"{model.dl_url}/{audio_path}"
-    except Exception as e:
-        print(e)
-        msg = "参数错误"
-        audio_url = ""
-    return {"msg": msg, "audio_url": audio_url}
+async def infer_classic(model: inferWithClassic, wait: bool = True, timing: bool = False):
+    if model.app_key != infer_key and infer_key != "":
+        return {"msg": "app_key错误", "audio_url": ""}
+    return await dispatch(run_infer_classic, model, wait=wait, endpoint="infer_classic", version=model.version, media_type=model.media_type, timing=timing, coalesce=coalesce_key("infer_classic", model, model.seed))
 
 # OpenAI风格的推理接口
 @APP.post("/v1/audio/speech")
 # OpenAI风格的推理接口
 @APP.post("/v1/audio/speech")
-async def openai_like_infer_func(model: openaiLikeInfer):
+async def openai_like_infer_func(model: openaiLikeInfer, stream: bool = False, timing: bool = False):
     try:
+        stream = stream or getattr(model, "stream", False)
         if model.other_params.app_key != infer_key and infer_key != "":
             return {
                 "error": {
@@ -191,9 +455,10 @@ async def openai_like_infer_func(model: openaiLikeInfer):
                     "code": "invalid_app_key"
                 }
             }
-        else:
-            audio_byte, msg = openai_like_infer(model.model, model.input, model.voice, model.response_format, model.speed, model.other_params)
-            if audio_byte is None:
+        elif stream and model.response_format in stream_media_types():
+            # 流式输出：每切出一句就推送一段，首包延迟从整句降到首句
+            audio_stream, msg = openai_like_infer_stream(model.model, model.input, model.voice, model.response_format, model.speed, model.other_params)
+            if audio_stream is None:
                 return {
                     "error": {
                         "message": msg,
@@ -202,17 +467,23 @@ async def openai_like_infer_func(model: openaiLikeInfer):
                         "code": "processing_failed"
                     }
                 }
-            else:
-                # 根据请求的格式动态设置MIME类型
-                media_type_map = {
-                    "mp3": "audio/mpeg",
-                    "wav": "audio/wav",
-                    "aac": "audio/aac",
-                    "ogg": "audio/ogg",
-                    "raw": "application/octet-stream"
-                }
-                response_media_type = media_type_map.get(model.response_format, "audio/wav") # 默认为wav
-                return Response(content=audio_byte, media_type=response_media_type)
+            try:
+                _, chunks = await inference_worker.stream(audio_stream)
+            except QueueFullError as e:
+                audio_stream.close()
+                return JSONResponse(content={
+                    "error": {
+                        "message": "推理队列已满，请稍后再试",
+                        "type": "rate_limit_error",
+                        "param": "queue_depth",
+                        "code": "queue_full",
+                        "queue_depth": e.depth
+                    }
+                }, status_code=429)
+            return StreamingResponse(chunks, media_type=media_type_map.get(model.response_format, "audio/wav"))
+        else:
+            version = model.model.split("-")[1] if "-" in model.model else model.model
+            return await dispatch(run_openai_like_infer, model, endpoint="speech", version=version, media_type=model.response_format, timing=timing, coalesce=coalesce_key("speech", model, model.other_params.seed))
 
     except Exception as e:
         print(e)
@@ -225,6 +496,26 @@ async def openai_like_infer_func(model: openaiLikeInfer):
             }
         }
 
+# 查询推理队列
+@APP.get("/jobs")
+async def job_queue_stats():
+    return {"msg": "获取队列状态成功", **inference_worker.stats(), "coalescing": single_flight.stats()}
+
+# 查询推理任务状态
+@APP.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = inference_worker.get(job_id)
+    if job is None:
+        return JSONResponse(content={"msg": "任务不存在或已过期"}, status_code=404)
+    return {"msg": "获取任务状态成功", **job.to_dict(inference_worker.position(job))}
+
+# 取消推理任务
+@APP.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    if inference_worker.cancel(job_id):
+        return {"msg": "已取消任务", "job_id": job_id}
+    return JSONResponse(content={"msg": "任务不存在或已结束", "job_id": job_id}, status_code=404)
+
 # 检查模型是否安装
 @APP.post("/check_model")
 async def check_model(model: checkModelInstalled):
@@ -235,15 +526,39 @@ async def check_model(model: checkModelInstalled):
         installed = False
     return {"installed": installed}
 
-# 安装模型
+def preload_installed(voice: str) -> None:
+    """ 安装完成后把新模型交给推理线程载入常驻池，首次合成不用再读盘 """
+    try:
+        inference_worker.submit(preload_voice, voice, priority=PRIORITY_BATCH, wait=False)
+    except QueueFullError:
+        logger.warning(f"推理队列已满，跳过预载: {voice}")
+
+# 安装模型：在后台下载、解压与校验，立即返回任务 ID；wait 为 True 时等待安装结束（不阻塞其他请求）
 @APP.post("/install_model")
-async def install_model_func(model: installModel):
+async def install_model_func(model: installModel, wait: bool = False, sha256: str = ""):
     try:
-        msg = install_model(model.version, model.category, model.language, model.model_name, model.dl_url)
+        job, msg = install_model(model.version, model.category, model.language, model.model_name, model.dl_url, sha256, preload_installed)
     except Exception as e:
         print(e)
-        msg = "安装失败"
-    return {"msg": msg}
+        return {"msg": "安装失败"}
+    if job is None:
+        return {"msg": msg}
+    if wait:
+        job = await asyncio.to_thread(wait_install, job["job_id"])
+        msg = job["msg"]
+    return {"msg": msg, "job_id": job["job_id"], "status": job["status"]}
+
+# 查询模型安装进度
+@APP.get("/install_status")
+async def install_status_list():
+    return {"msg": "获取安装任务成功", "jobs": get_install_status()}
+
+@APP.get("/install_status/{job_id}")
+async def install_status(job_id: str):
+    job = get_install_status(job_id)
+    if job is None:
+        return JSONResponse(content={"msg": "安装任务不存在或已过期"}, status_code=404)
+    return {"msg": "获取安装进度成功", **job}
 
 # 删除模型
 @APP.post("/delete_model")
@@ -266,10 +581,14 @@ async def shutdown(model: ShutdownRequest):
         return {"msg": "密码错误"}
 
 # 下载生成结果
-APP.mount("/outputs", StaticFiles(directory="outputs"), name="outputs")
-@APP.get("/outputs/{result_path}")
+# 下载合成结果，经由输出文件索引记录访问时间，供后台按 TTL 清理
+@APP.get("/outputs/{result_path:path}")
 async def download(result_path: str):
-    return FileResponse(f"outputs/{result_path}")
+    # 解析路径与统计文件大小都会访问磁盘，放到线程池中执行
+    file_path = await asyncio.to_thread(serve_output, result_path)
+    if file_path == "":
+        return JSONResponse(content={"msg": "文件不存在或已过期"}, status_code=404)
+    return FileResponse(file_path)
 
 # 上传参考音频到指定目录
 @APP.post("/upload")
@@ -297,22 +616,63 @@ async def redirect_to_index(request: Request, call_next):
     
 
 def main() -> None:
-    global infer_key, host, port, ref_audio_path
+    global infer_key, host, port, ref_audio_path, inference_worker
     parser = argparse.ArgumentParser(description="TTS Inference API")
     parser.add_argument("-s","--host", type=str, default="0.0.0.0", help="主机地址")
     parser.add_argument("-p","--port", type=int, default=8000, help="端口")
     parser.add_argument("-k","--key", type=str, default="", help="推理密钥")
     parser.add_argument("-c","--config", type=str, default="./GPT_SoVITS/configs/tts_infer.yaml", help="配置文件路径")
     parser.add_argument("-r","--ref_audio", type=str, default="./custom_refs", help="参考音频路径")
+    parser.add_argument("--preload", type=str, nargs="*", default=[], help="启动时预载的模型，格式为 版本/模型名")
+    parser.add_argument("--ref_cache_disk", action="store_true", help="参考音频特征缓存同时写入 cache/ref_features")
+    parser.add_argument("--segment_cache", action="store_true", help="固定种子时按句合成并缓存，只改了部分句子的文本只重新合成改动的句子")
+    parser.add_argument("--output_ttl", type=float, default=7 * 24, help="outputs/ 中文件的保留时间（小时），超过该时间未被下载的文件会被清理")
+    parser.add_argument("--output_max_gb", type=float, default=5, help="outputs/ 总大小上限（GB）")
+    parser.add_argument("--max_queue", type=int, default=32, help="推理队列最大排队数，超出时返回 429")
+    parser.add_argument("--warm_start", action="store_true", help="先绑定端口再在后台导入推理模块、预载 --preload 中的模型，进度见 /ready")
+    parser.add_argument("--workers", type=int, default=1, help="推理进程数，大于 1 时主进程只负责按模型转发请求，适合多核 CPU 推理")
+    parser.add_argument("--worker_base_port", type=int, default=0, help="推理进程监听的起始端口（仅 127.0.0.1），默认为 端口+1")
+    parser.add_argument("--threads", type=int, default=0, help="每个推理进程的 CPU 线程数，默认按核心数平均分配")
+    # 以下两个参数由主进程传给推理进程，无需手动指定
+    parser.add_argument("--worker_id", type=int, default=-1, help=argparse.SUPPRESS)
+    parser.add_argument("--worker_port", type=int, default=0, help=argparse.SUPPRESS)
     args = parser.parse_args()
     
-    logger.info(f"服务即将启动，将运行在: http://127.0.0.1:{port}")
     infer_key = args.key
     host = args.host
     port = args.port
     ref_audio_path = args.ref_audio
-        
-    pre_infer(args.config, ref_audio_path)
 
+    if args.workers > 1 and args.worker_id < 0:
+        run_supervisor(args)
+        return
+
+    logger.info(f"服务即将启动，将运行在: http://127.0.0.1:{port}")
+    pre_infer_args = (args.config, ref_audio_path, [], args.ref_cache_disk, args.segment_cache, args.output_ttl * 3600, int(args.output_max_gb * 1024 ** 3), args.threads, args.worker_id <= 0)
+    inference_worker = InferenceWorker(max_queue=args.max_queue)
+    if args.warm_start:
+        # 先绑定端口，推理模块与预载在后台进行，进度见 /ready
+        inference_worker.start()
+        warm_start(pre_infer_args, args.preload)
+    else:
+        load_engine(*pre_infer_args)
+        preload_voices(args.preload, background=False)
+        inference_worker.start()
+
+    if args.worker_id >= 0:
+        # 推理进程只监听本机端口，返回的下载地址仍指向主进程
+        uvicorn.run(app=APP, host="127.0.0.1", port=args.worker_port, log_level="critical")
+        return
+    webbrowser.open(f"http://127.0.0.1:{port}")
+    uvicorn.run(app=APP, host=host, port=port, log_level="critical")
+
+def run_supervisor(args: argparse.Namespace) -> None:
+    """ 多进程部署：启动 N 个推理进程，主进程按模型亲和转发请求 """
+    threads = args.threads or max(1, (os.cpu_count() or 1) // args.workers)
+    command = [sys.executable, "-c", f"from {__name__} import main; main()", *sys.argv[1:]]
+    supervisor = Supervisor(command, args.workers, args.worker_base_port or port + 1, threads)
+    supervisor.start()
+    atexit.register(supervisor.stop)
+    logger.info(f"服务即将启动，将运行在: http://127.0.0.1:{port}，推理进程数: {args.workers}")
     webbrowser.open(f"http://127.0.0.1:{port}")
-    uvicorn.run(app=APP, host=host, port=port, log_level="critical")
\ No newline at end of file
+    uvicorn.run(app=create_router(supervisor, origin), host=host, port=port, log_level="critical")
\ No newline at end of file
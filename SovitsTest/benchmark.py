@@ -0,0 +1,733 @@
+""" GSVI压力测试：按设定的并发、文本长度分布与说话人组合请求各推理接口，输出延迟分位数、首包时间、实时率与缓存命中率（JSON） """
+
+import argparse
+import json
+import os
+import random
+import shlex
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import requests
+
+# 用于拼接合成文本的语料
+CORPUS = [
+    "今天的天气真不错，我们一起去公园散步吧。",
+    "功夫不负有心人，我们终于成功了！",
+    "请把桌上的文件整理好，下午开会要用。",
+    "这条路一直往前走，第二个路口右转就到了。",
+    "你听说了吗？新开的那家店味道特别好。",
+    "无论遇到什么困难，都不要轻易放弃。",
+    "晚上记得早点休息，明天还要早起赶车。",
+    "窗外下起了小雨，空气里都是泥土的味道。",
+]
+
+# 文本长度档位（字数范围）
+TEXT_LENGTHS = {
+    "short": (8, 20),
+    "medium": (40, 80),
+    "long": (150, 300),
+}
+
+ENDPOINTS = {
+    "speech": "/v1/audio/speech",
+    "single": "/infer_single",
+    "multi": "/infer_multi",
+}
+
+INFER_PARAMS = {
+    "top_k": 10,
+    "top_p": 1.0,
+    "temperature": 1.0,
+    "text_split_method": "按标点符号切",
+    "batch_size": 1,
+    "batch_threshold": 0.75,
+    "split_bucket": True,
+    "fragment_interval": 0.3,
+    "parallel_infer": True,
+    "repetition_penalty": 1.35,
+    "sample_steps": 16,
+    "if_sr": False,
+}
+
+### WORKLOAD ###
+
+def parse_mix(mix: str, choices) -> dict:
+    """ 解析 "名称:权重,名称:权重" 形式的分布 """
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition(":")
+        name = name.strip()
+        if name not in choices:
+            raise ValueError(f"未知选项: {name}，可选: {', '.join(choices)}")
+        weights[name] = float(weight or 1)
+    return weights
+
+def weighted_choice(rng: random.Random, weights: dict) -> str:
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+def make_text(rng: random.Random, length: int) -> str:
+    text = ""
+    while len(text) < length:
+        text += rng.choice(CORPUS)
+    text = text[:length]
+    return text if text[-1] in "。！？" else text + "。"
+
+def build_request(rng: random.Random, args, voices: list[str]) -> dict:
+    endpoint = weighted_choice(rng, args.endpoint_mix)
+    bucket = weighted_choice(rng, args.length_mix)
+    text = make_text(rng, rng.randint(*TEXT_LENGTHS[bucket]))
+    voice = rng.choice(voices)
+    if endpoint == "speech":
+        payload = {
+            "model": f"tts-{args.version}",
+            "input": text,
+            "voice": voice,
+            "response_format": args.media_type,
+            "speed": 1.0,
+            "other_params": {
+                "app_key": args.key,
+                "text_lang": "中文",
+                "prompt_lang": args.prompt_lang,
+                "emotion": args.emotion,
+                "seed": args.seed,
+                **INFER_PARAMS,
+            },
+        }
+    elif endpoint == "single":
+        payload = {
+            "app_key": args.key,
+            "dl_url": "",
+            "version": args.version,
+            "model_name": voice,
+            "prompt_text_lang": args.prompt_lang,
+            "emotion": args.emotion,
+            "text": text,
+            "text_lang": "中文",
+            "speed_facter": 1.0,
+            "media_type": args.media_type,
+            "seed": args.seed,
+            **INFER_PARAMS,
+        }
+    else:
+        # 多人对话：2~4 句，每句随机说话人
+        lines = []
+        for _ in range(rng.randint(2, 4)):
+            line_text = make_text(rng, rng.randint(*TEXT_LENGTHS[bucket]))
+            lines.append("|".join([args.version, rng.choice(voices), "中文", args.prompt_lang, args.emotion, "1.0", line_text]))
+        text = "".join(line.rsplit("|", 1)[1] for line in lines)
+        payload = {
+            "app_key": args.key,
+            "dl_url": "",
+            "content": "‖".join(lines),
+            "media_type": args.media_type,
+            "seed": args.seed,
+            **INFER_PARAMS,
+        }
+    return {"endpoint": endpoint, "bucket": bucket, "voice": voice, "chars": len(text), "payload": payload}
+
+### MEASURE ###
+
+def wav_duration(data: bytes):
+    """ 根据 fmt 块的码率与 data 块的实际字节数计算时长，兼容流式 WAV 头中未知的数据长度 """
+    if len(data) < 12 or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        return None
+    offset = 12
+    byte_rate = 0
+    while offset + 8 <= len(data):
+        chunk_id = data[offset:offset + 4]
+        chunk_size = int.from_bytes(data[offset + 4:offset + 8], "little")
+        if chunk_id == b"fmt ":
+            byte_rate = int.from_bytes(data[offset + 16:offset + 20], "little")
+        elif chunk_id == b"data":
+            if byte_rate == 0:
+                return None
+            return (len(data) - offset - 8) / byte_rate
+        offset += 8 + chunk_size
+    return None
+
+def resolve_url(base_url: str, url: str) -> str:
+    """ 服务端可能返回 0.0.0.0 等地址，统一换成压测使用的地址 """
+    return f"{base_url}/{url.split('/', 3)[3]}"
+
+session_local = threading.local()
+
+def get_session() -> requests.Session:
+    if not hasattr(session_local, "session"):
+        session_local.session = requests.Session()
+    return session_local.session
+
+def send(base_url: str, request: dict, args) -> dict:
+    record = {key: request[key] for key in ("endpoint", "bucket", "voice", "chars")}
+    record.update({"ok": False, "status": 0, "latency": None, "ttfb": None, "audio_seconds": None, "rtf": None})
+    url = base_url + ENDPOINTS[request["endpoint"]]
+    if request["endpoint"] == "speech" and args.stream:
+        url += "?stream=true"
+    session = get_session()
+    start = time.perf_counter()
+    try:
+        with session.post(url, json=request["payload"], stream=True, timeout=args.timeout) as response:
+            body = bytearray()
+            for chunk in response.iter_content(chunk_size=4096):
+                if record["ttfb"] is None:
+                    record["ttfb"] = time.perf_counter() - start
+                body.extend(chunk)
+            record["latency"] = time.perf_counter() - start
+            record["status"] = response.status_code
+            content_type = response.headers.get("Content-Type", "")
+    except requests.exceptions.RequestException as e:
+        record["error"] = str(e)
+        return record
+    if record["status"] != 200:
+        record["error"] = bytes(body[:200]).decode("utf-8", "replace")
+        return record
+
+    if request["endpoint"] == "speech":
+        record["ok"] = content_type.startswith("audio/") or content_type == "application/octet-stream"
+        audio = bytes(body)
+    else:
+        result = json.loads(body)
+        audio_url = result.get("audio_url", result.get("archive_url", ""))
+        record["ok"] = audio_url != ""
+        if not record["ok"]:
+            record["error"] = result.get("msg", "")
+        audio = None
+        # 单人合成返回的是音频地址，下载不计入延迟
+        if record["ok"] and request["endpoint"] == "single" and args.media_type == "wav":
+            audio = get_session().get(resolve_url(base_url, audio_url), timeout=args.timeout).content
+    if audio is not None and args.media_type == "wav":
+        record["audio_seconds"] = wav_duration(audio)
+        if record["audio_seconds"]:
+            record["rtf"] = record["latency"] / record["audio_seconds"]
+    return record
+
+def percentile(values: list[float], p: float):
+    if not values:
+        return None
+    values = sorted(values)
+    rank = (len(values) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+def distribution(values: list[float], scale: float = 1.0) -> dict:
+    values = [v * scale for v in values if v is not None]
+    if not values:
+        return {}
+    return {
+        "p50": round(percentile(values, 50), 3),
+        "p95": round(percentile(values, 95), 3),
+        "p99": round(percentile(values, 99), 3),
+        "mean": round(sum(values) / len(values), 3),
+        "max": round(max(values), 3),
+    }
+
+def summarize(records: list[dict]) -> dict:
+    ok = [r for r in records if r["ok"]]
+    return {
+        "requests": len(records),
+        "ok": len(ok),
+        "errors": len(records) - len(ok),
+        "rejected": sum(1 for r in records if r["status"] == 429),
+        "latency_ms": distribution([r["latency"] for r in ok], 1000),
+        "ttfb_ms": distribution([r["ttfb"] for r in ok], 1000),
+        "rtf": distribution([r["rtf"] for r in ok]),
+        "audio_seconds": round(sum(r["audio_seconds"] or 0 for r in ok), 3),
+    }
+
+def cache_snapshot(base_url: str) -> dict:
+    try:
+        return requests.get(f"{base_url}/cache_stats", timeout=10).json()
+    except (requests.exceptions.RequestException, ValueError):
+        return {}
+
+def cache_delta(before: dict, after: dict) -> dict:
+    """ 只统计本次压测期间的命中与未命中 """
+    delta = {}
+    for name in ("synth_cache", "ref_features", "weight_pool", "frontend"):
+        if not after.get(name):
+            continue
+        hits = after[name].get("hits", 0) - before.get(name, {}).get("hits", 0)
+        misses = after[name].get("misses", 0) - before.get(name, {}).get("misses", 0)
+        delta[name] = {"hits": hits, "misses": misses, "hit_rate": round(hits / (hits + misses), 4) if hits + misses else None}
+    return delta
+
+def fetch_voices(base_url: str, version: str) -> list[str]:
+    response = requests.post(f"{base_url}/models", json={"version": version}, timeout=30)
+    return list(response.json().get("models", {}).keys())
+
+def run_benchmark(base_url: str, args) -> dict:
+    rng = random.Random(args.rng_seed)
+    voices = args.voices or fetch_voices(base_url, args.version)
+    if not voices:
+        raise RuntimeError(f"{args.version} 下没有可用的说话人")
+    workload = [build_request(rng, args, voices) for _ in range(args.requests)]
+
+    for request in workload[:args.warmup]:
+        send(base_url, request, args)
+    before = cache_snapshot(base_url)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        records = list(executor.map(lambda request: send(base_url, request, args), workload))
+    wall = time.perf_counter() - start
+    after = cache_snapshot(base_url)
+
+    report = {
+        "config": {
+            "base_url": base_url,
+            "stub": args.stub,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "endpoints": args.endpoint_mix,
+            "text_lengths": args.length_mix,
+            "voices": voices,
+            "version": args.version,
+            "media_type": args.media_type,
+            "stream": args.stream,
+            "seed": args.seed,
+            "rng_seed": args.rng_seed,
+        },
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(records) / wall, 3) if wall else None,
+        "overall": summarize(records),
+        "endpoints": {name: summarize([r for r in records if r["endpoint"] == name]) for name in args.endpoint_mix},
+        "text_lengths": {name: summarize([r for r in records if r["bucket"] == name]) for name in args.length_mix},
+        "cache": cache_delta(before, after),
+    }
+    errors = [r["error"] for r in records if r.get("error")]
+    if errors:
+        report["sample_errors"] = errors[:5]
+    return report
+
+### COLD START ###
+
+def measure_cold_start(base_url: str, args, start: float) -> dict:
+    """
+    从服务启动（start，perf_counter）起计时：端口可连接、推理模块就绪、第一段音频返回、各预载模型就绪的耗时（秒）。
+    第一段音频用第一个说话人的短句 /v1/audio/speech 请求，服务未就绪（503）时重试。
+    """
+    result = {"port_seconds": None, "ready_seconds": None, "first_audio_seconds": None, "voices": {}}
+    deadline = start + args.timeout
+    session = get_session()
+    while time.perf_counter() < deadline:
+        try:
+            response = session.get(f"{base_url}/ready", timeout=5)
+        except requests.exceptions.RequestException:
+            time.sleep(0.05)
+            continue
+        if result["port_seconds"] is None:
+            result["port_seconds"] = round(time.perf_counter() - start, 3)
+        if response.status_code == 200:
+            result["ready_seconds"] = round(time.perf_counter() - start, 3)
+            break
+        time.sleep(0.05)
+
+    voices = args.voices or fetch_voices(base_url, args.version)
+    probe_args = argparse.Namespace(**{**vars(args), "endpoint_mix": {"speech": 1}, "length_mix": {"short": 1}, "stream": False})
+    request = build_request(random.Random(args.rng_seed), probe_args, voices[:1])
+    while time.perf_counter() < deadline:
+        record = send(base_url, request, probe_args)
+        if record["ok"]:
+            result["first_audio_seconds"] = round(time.perf_counter() - start, 3)
+            result["first_audio_latency"] = round(record["latency"], 3)
+            break
+        time.sleep(0.05)
+
+    # 预载的模型（--preload）逐个就绪，未预载的模型不会出现在 /ready 中
+    pending = None
+    while time.perf_counter() < deadline:
+        try:
+            state = session.get(f"{base_url}/ready", timeout=5).json()
+        except (requests.exceptions.RequestException, ValueError):
+            time.sleep(0.05)
+            continue
+        pending = [voice for voice, entry in state.get("voices", {}).items() if entry["status"] in ("pending", "loading")]
+        for voice, entry in state.get("voices", {}).items():
+            if voice not in result["voices"] and entry["status"] in ("ready", "failed"):
+                result["voices"][voice] = {"status": entry["status"], "ready_seconds": round(time.perf_counter() - start, 3), "load_seconds": entry["seconds"]}
+        if not pending:
+            result["server_timings"] = state.get("timings", {})
+            break
+        time.sleep(0.05)
+    return result
+
+def launch_server(args):
+    """ 以 --server_cmd 启动待测服务，返回进程与启动时刻 """
+    start = time.perf_counter()
+    process = subprocess.Popen(shlex.split(args.server_cmd, posix=os.name != "nt"))
+    return process, start
+
+### STUB SERVER ###
+# 用固定耗时的假 TTS 替换 GPT_SoVITS，服务端其余部分（队列、缓存、编码）照常运行，CPU 上即可得到可复现的结果。
+# torch、整合包的 config / tools.logger 与 gsvi_server 中不在本目录的模块也一并换成最小实现，
+# GSVI.py、my_infer.py 等直接从本文件所在目录导入，不需要 torch 与整合包
+
+STUB_SAMPLE_RATE = 32000
+STUB_SECONDS_PER_CHAR = 0.18  # 每个字对应的音频时长
+STUB_EMOTIONS = {"默认": "这是一段用于测试的参考音频。", "开心": "今天真是太开心了！"}
+
+def install_stub_tts(char_ms: float, ref_ms: float, load_ms: float) -> None:
+    from types import SimpleNamespace
+    import numpy as np
+
+    class TTS_Config:
+        def __init__(self, config_path=None):
+            self.device = "cpu"
+            self.is_half = False
+            self.version = "v4"
+            self.t2s_weights_path = ""
+            self.vits_weights_path = ""
+            self.sampling_rate = STUB_SAMPLE_RATE
+
+    class TextPreprocessor:
+        def segment_and_extract_feature_for_text(self, text, language, version):
+            return [], None, text
+
+    class TTS:
+        def __init__(self, configs):
+            self.configs = configs
+            self.t2s_model = None
+            self.vits_model = None
+            self.text_preprocessor = TextPreprocessor()
+            self.prompt_cache = {
+                "ref_audio_path": None, "prompt_semantic": None, "refer_spec": [], "prompt_text": None,
+                "prompt_lang": None, "phones": None, "bert_features": None, "norm_text": None, "aux_ref_audio_paths": [],
+            }
+
+        def init_t2s_weights(self, weights_path):
+            time.sleep(load_ms / 1000)
+            # my_infer 会给 t2s_model.model.infer_panel 与 vits_model.decode 套上计时
+            self.t2s_model = SimpleNamespace(model=SimpleNamespace())
+            self.configs.t2s_weights_path = weights_path
+
+        def init_vits_weights(self, weights_path):
+            time.sleep(load_ms / 1000)
+            self.vits_model = SimpleNamespace()
+            self.configs.vits_weights_path = weights_path
+
+        def set_ref_audio(self, ref_audio_path):
+            time.sleep(ref_ms / 1000)
+            self.prompt_cache["ref_audio_path"] = ref_audio_path
+
+        def run(self, inputs):
+            if inputs["ref_audio_path"] != self.prompt_cache["ref_audio_path"]:
+                self.set_ref_audio(inputs["ref_audio_path"])
+            if inputs["prompt_text"] != self.prompt_cache["prompt_text"]:
+                self.prompt_cache["prompt_text"] = inputs["prompt_text"]
+                self.prompt_cache["prompt_lang"] = inputs["prompt_lang"]
+            rng = np.random.default_rng(inputs["seed"])
+            pieces = [p for p in inputs["text"].replace("！", "。").replace("？", "。").split("。") if p]
+            silence = np.zeros(int(STUB_SAMPLE_RATE * inputs["fragment_interval"]), dtype=np.int16)
+            fragments = []
+            for piece in pieces:
+                time.sleep(len(piece) * char_ms / 1000)
+                samples = int(len(piece) * STUB_SECONDS_PER_CHAR / inputs["speed_factor"] * STUB_SAMPLE_RATE)
+                audio = (rng.standard_normal(samples) * 1000).astype(np.int16)
+                if inputs.get("return_fragment"):
+                    yield STUB_SAMPLE_RATE, np.concatenate([audio, silence])
+                else:
+                    fragments += [audio, silence]
+            if not inputs.get("return_fragment"):
+                yield STUB_SAMPLE_RATE, np.concatenate(fragments) if fragments else silence
+
+    module = stub_module("GPT_SoVITS.TTS_infer_pack.TTS")
+    module.TTS = TTS
+    module.TTS_Config = TTS_Config
+
+    def split_sentences(text):
+        for mark in "。！？!?.":
+            text = text.replace(mark, mark + "\n")
+        return "\n".join(line for line in text.split("\n") if line.strip())
+
+    segmentation = stub_module("GPT_SoVITS.TTS_infer_pack.text_segmentation_method")
+    segmentation.splits = {"，", "。", "？", "！", ",", ".", "?", "!", "~", ":", "：", "—", "…"}
+    segmentation.get_method = lambda name: (lambda text: text) if name == "cut0" else split_sentences
+
+def stub_module(name: str, path: str = None):
+    """ 注册一个空模块（及其上级包），path 不为空时作为包从该目录导入子模块 """
+    import types
+    parent, _, child = name.rpartition(".")
+    if parent and parent not in sys.modules:
+        stub_module(parent)
+    module = types.ModuleType(name)
+    module.__path__ = [path] if path else []
+    sys.modules[name] = module
+    if parent:
+        setattr(sys.modules[parent], child, module)
+    return module
+
+def install_stub_torch() -> None:
+    """ my_infer 只用到显存统计、no_grad、save / load 与 nn.Module 的类型判断 """
+    import pickle
+    from contextlib import nullcontext
+
+    torch = stub_module("torch")
+    torch.cuda = stub_module("torch.cuda")
+    torch.cuda.is_available = lambda: False
+    torch.cuda.empty_cache = lambda: None
+    torch.cuda.memory_reserved = lambda *args: 0
+    torch.cuda.max_memory_allocated = lambda *args: 0
+    torch.cuda.reset_peak_memory_stats = lambda *args: None
+    torch.cuda.current_device = lambda: 0
+    torch.nn = stub_module("torch.nn")
+    torch.nn.Module = type("Module", (), {})
+    torch.Tensor = type("Tensor", (), {})
+    torch.no_grad = nullcontext
+    torch.set_num_threads = lambda threads: None
+
+    def save(obj, path):
+        with open(path, "wb") as output:
+            pickle.dump(obj, output)
+
+    def load(path, **kwargs):
+        with open(path, "rb") as source:
+            return pickle.load(source)
+
+    torch.save = save
+    torch.load = load
+
+def install_stub_bundle(gsvi_dir: Path) -> None:
+    """ 整合包中的 config、tools.logger、gsvi_server.exec_hook 与 gsvi_server.openai_like_model """
+    import logging
+    import traceback
+    from pydantic import BaseModel
+
+    config = stub_module("config")
+    config.is_half = False
+    config.infer_device = "cpu"
+    config.force_half_infer = False
+    config.force_gpu_infer = False
+
+    logging.addLevelName(25, "SUCCESS")
+    logging.addLevelName(5, "TRACE")
+    stub_logger = logging.getLogger("gsvi-stub")
+    stub_logger.success = lambda msg, *args, **kwargs: stub_logger.log(25, msg, *args, **kwargs)
+    stub_logger.trace = lambda msg, *args, **kwargs: stub_logger.log(5, msg, *args, **kwargs)
+    # tools 与 gsvi_server 指向本目录：tools.my_infer、gsvi_server.GSVI 等从这里导入
+    stub_module("tools", str(gsvi_dir))
+    stub_module("tools.logger").logger = stub_logger
+    stub_module("gsvi_server", str(gsvi_dir))
+    exec_hook = stub_module("gsvi_server.exec_hook")
+    exec_hook.set_exechook = lambda: None
+    exec_hook.ExtractException = lambda exc_type, exc, tb: "".join(traceback.format_exception(exc_type, exc, tb))
+
+    class InferParams(BaseModel):
+        top_k: int = 10
+        top_p: float = 1.0
+        temperature: float = 1.0
+        text_split_method: str = "按标点符号切"
+        batch_size: int = 1
+        batch_threshold: float = 0.75
+        split_bucket: bool = True
+        fragment_interval: float = 0.3
+        parallel_infer: bool = True
+        repetition_penalty: float = 1.35
+        sample_steps: int = 16
+        if_sr: bool = False
+        seed: int = -1
+
+    class requestVersion(BaseModel):
+        version: str = "v4"
+
+    class inferWithEmotions(InferParams):
+        app_key: str = ""
+        dl_url: str = ""
+        version: str = "v4"
+        model_name: str = ""
+        prompt_text_lang: str = "中文"
+        emotion: str = "默认"
+        text: str = ""
+        text_lang: str = "中文"
+        speed_facter: float = 1.0
+        media_type: str = "wav"
+
+    class inferWithMulti(InferParams):
+        app_key: str = ""
+        dl_url: str = ""
+        content: str = ""
+        media_type: str = "wav"
+
+    class inferWithClassic(InferParams):
+        app_key: str = ""
+        dl_url: str = ""
+        version: str = "v4"
+        gpt_model_name: str = ""
+        sovits_model_name: str = ""
+        ref_audio_path: str = ""
+        prompt_text: str = ""
+        prompt_text_lang: str = "中文"
+        text: str = ""
+        text_lang: str = "中文"
+        speed_facter: float = 1.0
+        media_type: str = "wav"
+
+    class otherParams(InferParams):
+        app_key: str = ""
+        text_lang: str = "中文"
+        prompt_lang: str = "中文"
+        emotion: str = "默认"
+
+    class openaiLikeInfer(BaseModel):
+        model: str = "tts-v4"
+        input: str = ""
+        voice: str = ""
+        response_format: str = "wav"
+        speed: float = 1.0
+        other_params: otherParams = otherParams()
+
+    class checkModelInstalled(BaseModel):
+        version: str = "v4"
+        category: str = ""
+        language: str = ""
+        model_name: str = ""
+
+    class installModel(checkModelInstalled):
+        dl_url: str = ""
+
+    class ShutdownRequest(BaseModel):
+        password: str = ""
+
+    models = stub_module("gsvi_server.openai_like_model")
+    for model in (requestVersion, inferWithEmotions, inferWithMulti, inferWithClassic, otherParams, openaiLikeInfer, checkModelInstalled, installModel, ShutdownRequest):
+        setattr(models, model.__name__, model)
+
+    try:
+        import pyfiglet  # noqa: F401
+    except ImportError:
+        stub_module("pyfiglet").print_figlet = lambda text, *args, **kwargs: print(text)
+
+def install_stub_modules(char_ms: float, ref_ms: float, load_ms: float) -> None:
+    """ 不依赖 torch 与整合包即可导入 gsvi_server.GSVI 与 tools.my_infer """
+    install_stub_torch()
+    install_stub_bundle(Path(__file__).resolve().parent)
+    install_stub_tts(char_ms, ref_ms, load_ms)
+
+def write_stub_wav(path: Path, seconds: float = 3.0) -> None:
+    import wave
+    path.parent.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(path.name)
+    frames = bytes(rng.getrandbits(8) for _ in range(int(STUB_SAMPLE_RATE * seconds) * 2))
+    with wave.open(str(path), "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(STUB_SAMPLE_RATE)
+        wav_file.writeframes(frames)
+
+def prepare_stub_workspace(workspace: Path, version: str, voices: list[str]) -> None:
+    for directory in ("outputs", "cache", "gsvi_ui", "custom_refs"):
+        (workspace / directory).mkdir(parents=True, exist_ok=True)
+    index_path = workspace / "gsvi_ui" / "index.html"
+    if not index_path.exists():
+        index_path.write_text("<!doctype html><title>GSVI</title>", encoding="utf-8")
+    for voice in voices:
+        speaker_dir = workspace / "models" / version / voice
+        speaker_dir.mkdir(parents=True, exist_ok=True)
+        (speaker_dir / f"{voice}.ckpt").write_bytes(b"stub")
+        (speaker_dir / f"{voice}.pth").write_bytes(b"stub")
+        for emotion, prompt_text in STUB_EMOTIONS.items():
+            wav_path = speaker_dir / "reference_audios" / "中文" / "emotions" / f"【{emotion}】{prompt_text}.wav"
+            if not wav_path.exists():
+                write_stub_wav(wav_path)
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_stub_server(args) -> str:
+    """ 在当前进程内用假 TTS 启动 GSVI，返回服务地址 """
+    workspace = Path(args.workspace).resolve()
+    if not args.voices:
+        args.voices = [f"stub_{i}" for i in range(args.stub_voices)]
+    prepare_stub_workspace(workspace, args.version, args.voices)
+    install_stub_modules(args.stub_char_ms, args.stub_ref_ms, args.stub_load_ms)
+    os.chdir(workspace)
+
+    # 冷启动从导入 GSVI 开始计时，不含生成假模型的时间
+    args.launch_time = time.perf_counter()
+    import uvicorn
+    from gsvi_server import GSVI as gsvi
+    from gsvi_server.job_queue import InferenceWorker
+
+    port = free_port()
+    gsvi.host = "127.0.0.1"
+    gsvi.port = port
+    gsvi.inference_worker = InferenceWorker(max_queue=args.max_queue)
+    gsvi.inference_worker.start()
+    pre_infer_args = ("", "custom_refs", [])
+    if args.cold_start:
+        # 与 --warm_start 相同：先绑定端口，推理模块与预载在后台进行
+        gsvi.warm_start(pre_infer_args, [f"{args.version}/{voice}" for voice in args.voices])
+    else:
+        gsvi.load_engine(*pre_infer_args)
+    server = uvicorn.Server(uvicorn.Config(app=gsvi.APP, host="127.0.0.1", port=port, log_level="critical"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+def main():
+    parser = argparse.ArgumentParser(description="GSVI 压力测试")
+    parser.add_argument("-u", "--url", type=str, default="http://127.0.0.1:8000", help="服务地址（--stub 时忽略）")
+    parser.add_argument("-k", "--key", type=str, default="", help="推理密钥")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="并发数")
+    parser.add_argument("-n", "--requests", type=int, default=50, help="请求总数")
+    parser.add_argument("--warmup", type=int, default=0, help="正式计时前先串行发送的请求数")
+    parser.add_argument("--endpoints", type=str, default="speech:6,single:3,multi:1", help="接口分布，可选 speech / single / multi")
+    parser.add_argument("--text_lengths", type=str, default="short:5,medium:4,long:1", help="文本长度分布，可选 short / medium / long")
+    parser.add_argument("--voices", type=str, nargs="*", default=[], help="参与压测的说话人，默认取该版本全部说话人")
+    parser.add_argument("--version", type=str, default="v4", help="模型版本")
+    parser.add_argument("--emotion", type=str, default="默认", help="情感")
+    parser.add_argument("--prompt_lang", type=str, default="中文", help="参考音频语言")
+    parser.add_argument("--media_type", type=str, default="wav", help="音频格式，仅 wav 可计算实时率")
+    parser.add_argument("--stream", action="store_true", help="/v1/audio/speech 使用流式输出")
+    parser.add_argument("--seed", type=int, default=-1, help="推理种子，固定种子时可命中合成缓存")
+    parser.add_argument("--rng_seed", type=int, default=0, help="生成请求序列的随机种子，相同种子得到相同的请求序列")
+    parser.add_argument("--timeout", type=float, default=600, help="单个请求超时（秒）")
+    parser.add_argument("-o", "--output", type=str, default="", help="结果 JSON 保存路径，默认只打印")
+    parser.add_argument("--stub", action="store_true", help="在本进程内用假 TTS 启动服务，无需 GPU 与模型")
+    parser.add_argument("--workspace", type=str, default="benchmark_workspace", help="--stub：假模型与输出所在目录")
+    parser.add_argument("--stub_voices", type=int, default=3, help="--stub：未指定 --voices 时生成的说话人数")
+    parser.add_argument("--stub_char_ms", type=float, default=20, help="--stub：每个字的合成耗时（毫秒）")
+    parser.add_argument("--stub_ref_ms", type=float, default=150, help="--stub：处理一条参考音频的耗时（毫秒）")
+    parser.add_argument("--stub_load_ms", type=float, default=300, help="--stub：加载一个模型的耗时（毫秒）")
+    parser.add_argument("--max_queue", type=int, default=256, help="--stub：推理队列上限")
+    parser.add_argument("--cold_start", action="store_true", help="先测量从启动服务到第一段音频的耗时；--stub 时以 warm start 方式启动，否则需要 --server_cmd")
+    parser.add_argument("--server_cmd", type=str, default="", help="--cold_start：启动待测服务的命令（在 -u 地址上监听），压测结束后结束该进程")
+    args = parser.parse_args()
+    if args.cold_start and not args.stub and not args.server_cmd:
+        parser.error("--cold_start 需要 --stub 或 --server_cmd")
+    args.endpoint_mix = parse_mix(args.endpoints, ENDPOINTS)
+    args.length_mix = parse_mix(args.text_lengths, TEXT_LENGTHS)
+
+    # 输出路径相对于启动目录，--stub 会切换工作目录
+    output_path = Path(args.output).resolve() if args.output else None
+    process = None
+    start = time.perf_counter()
+    if args.stub:
+        base_url = start_stub_server(args)
+        start = args.launch_time
+    else:
+        base_url = args.url.rstrip("/")
+        if args.server_cmd:
+            process, start = launch_server(args)
+    try:
+        cold_start = measure_cold_start(base_url, args, start) if args.cold_start else None
+        report = run_benchmark(base_url, args)
+    finally:
+        if process is not None:
+            process.terminate()
+    if cold_start is not None:
+        report["cold_start"] = cold_start
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    if output_path is not None:
+        output_path.write_text(text, encoding="utf-8")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+""" GSVI推理任务队列：所有占用 GPU 的推理都交给单独的工作线程串行执行，事件循环只负责排队与等待 """
+
+import asyncio
+import itertools
+import queue
+import threading
+from collections import OrderedDict
+from time import time
+from uuid import uuid4
+from tools.logger import logger
+
+# 数值越小越先执行
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+
+STREAM_END = object()
+
+
+class QueueFullError(Exception):
+    """ 推理队列已满 """
+
+    def __init__(self, depth: int):
+        super().__init__(f"推理队列已满（{depth}）")
+        self.depth = depth
+
+
+class JobCancelledError(Exception):
+    """ 任务在执行前被取消 """
+
+
+class Job:
+    """ 一次推理任务 """
+
+    def __init__(self, func, args, kwargs, priority: int):
+        self.id = uuid4().hex
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.seq = 0
+        self.status = "queued"  # queued / running / done / failed / cancelled
+        self.result = None
+        self.error = ""
+        self.created = time()
+        self.started = None
+        self.finished = None
+        self.cancel_event = threading.Event()
+        # 结束（完成、失败或取消）时置位，供事件循环之外的线程等待
+        self.done = threading.Event()
+        self.future = None
+        self.loop = None
+
+    def to_dict(self, position: int = None) -> dict:
+        info = {
+            "job_id": self.id,
+            "status": self.status,
+            "priority": self.priority,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "error": self.error,
+        }
+        if position is not None:
+            info["position"] = position
+        # 只有可序列化的结果（接口返回的字典）才附带给轮询方
+        if self.status == "done" and isinstance(self.result, dict):
+            info["result"] = self.result
+        return info
+
+
+class InferenceWorker:
+    """ 单线程推理工作者，带有界优先级队列、任务状态查询与取消 """
+
+    def __init__(self, max_queue: int = 32, history: int = 256):
+        self.max_queue = max_queue
+        self.history = history
+        self.queue = queue.PriorityQueue(maxsize=max_queue)
+        self.sequence = itertools.count()
+        self.jobs = OrderedDict()  # job_id -> Job，保留最近 history 个任务
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self) -> None:
+        if self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self.loop_forever, name="gsvi-infer-worker", daemon=True)
+        self.thread.start()
+        logger.info(f"推理工作线程已启动，队列上限: {self.max_queue}")
+
+    def depth(self) -> int:
+        return self.queue.qsize()
+
+    def submit(self, func, *args, priority: int = PRIORITY_INTERACTIVE, wait: bool = True, **kwargs) -> Job:
+        """ 提交任务，队列已满时抛出 QueueFullError；wait 为 True 时需在事件循环内调用，之后可 await job.future """
+        job = Job(func, args, kwargs, priority)
+        if wait:
+            job.loop = asyncio.get_running_loop()
+            job.future = job.loop.create_future()
+        return self.enqueue(job)
+
+    def enqueue(self, job: Job) -> Job:
+        job.seq = next(self.sequence)
+        try:
+            self.queue.put_nowait((job.priority, job.seq, job))
+        except queue.Full:
+            raise QueueFullError(self.depth())
+        with self.lock:
+            self.jobs[job.id] = job
+            while len(self.jobs) > self.history:
+                oldest_id, oldest = next(iter(self.jobs.items()))
+                if oldest.status in ("queued", "running"):
+                    break
+                self.jobs.pop(oldest_id)
+        return job
+
+    async def run(self, func, *args, priority: int = PRIORITY_INTERACTIVE, **kwargs):
+        """ 提交并等待结果 """
+        job = self.submit(func, *args, priority=priority, wait=True, **kwargs)
+        return await job.future
+
+    async def stream(self, chunks, priority: int = PRIORITY_INTERACTIVE):
+        """ 在工作线程中推进同步生成器，把产出的字节转交给事件循环逐段发送 """
+        loop = asyncio.get_running_loop()
+        channel = asyncio.Queue()
+        # 先建好任务再入队，工作线程执行 pump 时 job 一定已经绑定
+        job = Job(None, (), {}, priority)
+
+        def pump():
+            try:
+                for chunk in chunks:
+                    if job.cancel_event.is_set():
+                        break
+                    loop.call_soon_threadsafe(channel.put_nowait, chunk)
+            finally:
+                chunks.close()
+
+        def finish(future):
+            # 完成、失败与排队中被取消都会走到这里；之前投递的字节按顺序排在结束标记前面
+            future.exception()  # 客户端已断开时也算取走了异常，不再告警
+            if job.status == "cancelled":
+                # 排队中被取消的任务不会再执行，生成器由这里关闭
+                chunks.close()
+            channel.put_nowait(STREAM_END)
+
+        job.func = pump
+        job.loop = loop
+        job.future = loop.create_future()
+        job.future.add_done_callback(finish)
+        self.enqueue(job)
+
+        async def iterate():
+            try:
+                while True:
+                    item = await channel.get()
+                    if item is STREAM_END:
+                        break
+                    yield item
+                error = job.future.exception()
+                if error is not None:
+                    raise error
+            finally:
+                # 客户端断开时停止继续合成
+                self.cancel(job.id)
+
+        return job, iterate()
+
+    def get(self, job_id: str):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def position(self, job: Job):
+        """ 排队中的任务前面还有几个任务 """
+        if job.status != "queued":
+            return None
+        with self.queue.mutex:
+            return sum(1 for priority, seq, other in self.queue.queue
+                       if other.status == "queued" and (priority, seq) < (job.priority, job.seq))
+
+    def cancel(self, job_id: str) -> bool:
+        """ 取消排队中的任务；正在执行的任务只会被标记，流式任务会在下一段前停止 """
+        # queued -> cancelled 与工作线程的 queued -> running 在同一把锁下判断并切换，两者只有一个成功
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.status not in ("queued", "running"):
+                return False
+            job.cancel_event.set()
+            cancelled = job.status == "queued"
+            if cancelled:
+                job.status = "cancelled"
+                job.finished = time()
+        if cancelled:
+            job.done.set()
+            self.resolve(job, error=JobCancelledError("任务已取消"))
+        return True
+
+    def resolve(self, job: Job, result=None, error: Exception = None) -> None:
+        if job.future is None:
+            return
+
+        def set_future():
+            if job.future.done():
+                return
+            if error is not None:
+                job.future.set_exception(error)
+            else:
+                job.future.set_result(result)
+
+        try:
+            job.loop.call_soon_threadsafe(set_future)
+        except RuntimeError:
+            # 事件循环已关闭（服务正在退出），无人等待结果
+            pass
+
+    def loop_forever(self) -> None:
+        while True:
+            _, _, job = self.queue.get()
+            with self.lock:
+                if job.status != "queued":
+                    # 已被取消
+                    continue
+                job.status = "running"
+                job.started = time()
+            try:
+                job.result = job.func(*job.args, **job.kwargs)
+                job.status = "done"
+                self.resolve(job, result=job.result)
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+                logger.error(f"推理任务 {job.id} 执行失败: {e}")
+                self.resolve(job, error=e)
+            finally:
+                job.finished = time()
+                job.done.set()
+
+    def stats(self) -> dict:
+        with self.lock:
+            statuses = [job.status for job in self.jobs.values()]
+        return {
+            "queue_depth": self.depth(),
+            "max_queue": self.max_queue,
+            "running": statuses.count("running"),
+            "queued": statuses.count("queued"),
+        }
+
+
+class SingleFlight:
+    """ 相同键的请求在执行中时，后来者不再提交新任务，而是等待同一个结果；只在事件循环内使用 """
+
+    def __init__(self):
+        self.inflight = {}  # key -> asyncio.Task
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def run(self, key: str, factory):
+        """ 返回 (是否合并到已有请求, 结果)，factory 为返回协程的函数 """
+        task = self.inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return True, await asyncio.shield(task)
+        # 任务独立于发起的请求运行：发起方断开连接时，其他等待方照常拿到结果
+        task = asyncio.ensure_future(factory())
+        self.inflight[key] = task
+        self.leaders += 1
+        task.add_done_callback(lambda done: self.finish(key, done))
+        return False, await asyncio.shield(task)
+
+    def finish(self, key: str, task: asyncio.Task) -> None:
+        if self.inflight.get(key) is task:
+            self.inflight.pop(key)
+        # 所有等待方都已断开时避免 "exception was never retrieved" 警告
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        return {
+            "inflight_keys": len(self.inflight),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+        }
@@ -6,10 +6,18 @@ sys.path.append(now_dir)
 sys.path.append("%s/GPT_SoVITS" % (now_dir))
 
 import subprocess
+import atexit
+import json
+import copy
+import itertools
+import threading
 import numpy as np
 import soundfile as sf
 import torch
 import gc
+import tracemalloc
+import zipfile
+import queue
 from gsvi_server.openai_like_model import otherParams
 from tools.logger import logger
 from GPT_SoVITS.TTS_infer_pack.TTS import TTS, TTS_Config
@@ -18,18 +26,42 @@ from pathlib import Path
 from re import split
 from io import BytesIO
 from random import choice, randint
-from hashlib import md5
-from time import time
+from hashlib import md5, sha256
+from time import time, perf_counter, sleep
 from datetime import datetime
+from collections import OrderedDict
+from contextlib import contextmanager
 from pydub import AudioSegment
-from shutil import move, rmtree
+from shutil import rmtree, copyfileobj
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError
+from uuid import uuid4
 from config import is_half, infer_device, force_half_infer, force_gpu_infer
-from GPT_SoVITS.TTS_infer_pack.text_segmentation_method import get_method
+from GPT_SoVITS.TTS_infer_pack.text_segmentation_method import get_method, splits
 
 #===============推理预备================
-# 持久化模型
+# 持久化模型（当前激活的权重路径）
 loaded_gpt_model = ""
 loaded_sovits_model = ""
+# 合成结果缓存、权重常驻池与参考音频特征缓存，在 pre_infer 中初始化
+synth_cache = None
+weight_pool = None
+ref_feature_cache = None
+# 分句缓存，仅在启用 segment_cache 模式时初始化
+segment_cache = None
+# outputs/ 输出文件索引，在 pre_infer 中初始化
+output_store = None
+# 文本前端（切分、音素与 BERT 特征）缓存，在 pre_infer 中初始化
+frontend_cache = None
+# 接口参数到 TTS 参数的映射
+LANG_CODES = dict(zip(
+    ["中文","英语","日语","粤语","韩语","中英混合","日英混合","粤英混合","韩英混合","多语种混合","多语种混合(粤语)"],
+    ["all_zh","en","all_ja","all_yue","all_ko","zh","ja","yue","ko","auto","auto_yue"],
+))
+CUT_METHODS = dict(zip(
+    ["不切","凑四句一切","凑50字一切","按中文句号。切","按英文句号.切","按标点符号切"],
+    ["cut0","cut1","cut2","cut3","cut4","cut5"],
+))
 
 def create_weight_dirs():
     gpt_dirs = ["GPT_weights", "GPT_weights_v2", "GPT_weights_v3", "GPT_weights_v4", "GPT_weights_v2Pro", "GPT_weights_v2ProPlus"]
@@ -40,7 +72,14 @@ def create_weight_dirs():
     for sovits_dir in sovits_dirs:
         Path(sovits_dir).mkdir(parents=True, exist_ok=True)
     
-def pre_infer(config_path: str, ref_audio_path: str) -> None:
+def pre_infer(config_path: str, ref_audio_path: str, preload_voices: list[str] = None, ref_cache_on_disk: bool = False, segment_cache_enabled: bool = False, output_ttl: float = None, output_max_bytes: int = None, threads: int = 0, manage_outputs: bool = True) -> None:
+    """
+    preload_voices 为 "版本/模型名" 列表，启动时预先载入权重常驻池并预处理其全部情感参考音频；
+    ref_cache_on_disk 为 True 时参考音频特征同时写入 cache/ref_features，重启后仍可复用；
+    segment_cache_enabled 为 True 时固定种子的请求按句合成并缓存每一句；
+    output_ttl / output_max_bytes 为 outputs/ 的保留时间（秒）与总大小上限，由后台线程定期清理，不传时使用默认值；
+    threads 为 CPU 推理的线程数（0 为不限制），manage_outputs 为 False 时不保存输出文件索引也不清理（多进程部署时只由一个推理进程负责）。
+    """
     global tts_config, tts_pipeline
     create_weight_dirs()
     if config_path in [None, ""]:
@@ -68,40 +107,1457 @@ def pre_infer(config_path: str, ref_audio_path: str) -> None:
     Path("outputs").mkdir(parents=True, exist_ok=True)
     Path("cache").mkdir(parents=True, exist_ok=True)
     
+    global synth_cache, weight_pool, ref_feature_cache, segment_cache, output_store, frontend_cache
+    if threads:
+        torch.set_num_threads(threads)
+        logger.info(f"CPU 推理线程数: {threads}")
+    output_store = OutputStore(ttl=output_ttl or OUTPUT_TTL_SECONDS, max_bytes=output_max_bytes or OUTPUT_MAX_BYTES)
+    if manage_outputs:
+        output_store.start()
+    synth_cache = SynthCache()
+    output_store.on_remove(synth_cache.forget_path)
     tts_pipeline = TTS(tts_config)
+    frontend_cache = FrontendCache()
+    frontend_cache.attach(tts_pipeline.text_preprocessor)
+    instrument_pipeline()
+    weight_pool = WeightPool()
+    ref_feature_cache = RefFeatureCache(on_disk=ref_cache_on_disk)
+    if segment_cache_enabled:
+        segment_cache = SegmentCache()
+        logger.info("已启用分句缓存")
+    model_index.start(get_version())
+    for voice in preload_voices or []:
+        preload_voice(voice)
+
+def preload_voice(voice: str) -> bool:
+    """ 把 "版本/模型名" 的权重载入常驻池并预处理其全部情感参考音频；会切换当前权重，只能在推理线程中调用 """
+    try:
+        version, model_name = voice.split("/", 1)
+    except ValueError:
+        logger.warning(f"预载模型格式应为 版本/模型名: {voice}")
+        return False
+    gpt_model, sovits_model = get_model_path(model_name, version)
+    if gpt_model == "" or sovits_model == "":
+        logger.warning(f"预载模型不存在: {voice}")
+        return False
+    logger.info(f"预载模型: {voice}")
+    load_weights(gpt_model, sovits_model)
+    warm_ref_features(model_name, version)
+    return True
     
     
 def load_weights(gpt, sovits):
     global loaded_gpt_model, loaded_sovits_model
     if gpt != "" and gpt != loaded_gpt_model:
-        logger.info(f"正在加载 GPT 模型: {gpt}")
-        tts_pipeline.init_t2s_weights(gpt)
+        with stage("load_gpt"):
+            weight_pool.activate("gpt", gpt)
         loaded_gpt_model = gpt
     if sovits != "" and sovits != loaded_sovits_model:
-        logger.info(f"正在加载 SoVITS 模型: {sovits}")
-        tts_pipeline.init_vits_weights(sovits)
+        with stage("load_sovits"):
+            weight_pool.activate("sovits", sovits)
         loaded_sovits_model = sovits
 
-    
-#===============推理函数================
+
+#===============性能统计================
+# 每次请求的各阶段耗时记在 StageTimer 中（可作为 X-Timing 响应头返回），同时汇总进直方图供 /metrics 抓取
+METRIC_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+MEMORY_BUCKETS = tuple(2 ** n * 1024 ** 2 for n in range(0, 15, 2))  # 1 MB ~ 16 GB
+timing_local = threading.local()
+
+class StageTimer:
+    """
+    一次请求内各阶段的耗时（秒），同一阶段多次进入时累加。
+    trace_memory 为 True 时才统计内存峰值（tracemalloc 开销不小，只在请求带 ?timing=true 时开启），
+    不传时沿用当前线程已绑定的外层计时器的设置。
+    """
+
+    def __init__(self, trace_memory: bool = None):
+        if trace_memory is None:
+            parent = getattr(timing_local, "timer", None)
+            trace_memory = parent is not None and parent.trace_memory
+        self.trace_memory = trace_memory
+        self.stages = OrderedDict()
+        self.memory = OrderedDict()  # 名称 -> 峰值字节数
+
+    def add(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def peak(self, name: str, nbytes: int) -> None:
+        self.memory[name] = max(self.memory.get(name, 0), nbytes)
+
+    @contextmanager
+    def bind(self):
+        """ 在当前线程内把 stage() 记到本计时器，退出时并入外层计时器 """
+        parent = getattr(timing_local, "timer", None)
+        timing_local.timer = self
+        try:
+            yield self
+        finally:
+            timing_local.timer = parent
+            if parent is not None:
+                for name, seconds in self.stages.items():
+                    parent.add(name, seconds)
+                for name, nbytes in self.memory.items():
+                    parent.peak(name, nbytes)
+
+    def run(self, func, *args, **kwargs):
+        with self.bind():
+            return func(*args, **kwargs)
+
+    def header(self) -> str:
+        return ", ".join(f"{name}={seconds * 1000:.1f}" for name, seconds in self.stages.items())
+
+    def memory_header(self) -> str:
+        return ", ".join(f"{name}={nbytes / 1024 ** 2:.2f}MB" for name, nbytes in self.memory.items())
+
+@contextmanager
+def stage(name: str):
+    timer = getattr(timing_local, "timer", None)
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        if timer is not None:
+            timer.add(name, perf_counter() - start)
+
+@contextmanager
+def measure_peak(name: str):
+    """
+    用 tracemalloc 统计一段代码的 Python 堆峰值（含 numpy 数组），只在计时器要求统计内存时开启，已在统计中时不重复开启。
+    tracemalloc 是整个进程范围的，峰值也包含这段时间内其他线程的分配。
+    """
+    timer = getattr(timing_local, "timer", None)
+    if timer is None or not timer.trace_memory or tracemalloc.is_tracing():
+        yield
+        return
+    tracemalloc.start()
+    try:
+        yield
+    finally:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        timer.peak(name, peak)
+
+def instrument(obj, attr: str, name: str) -> None:
+    """ 给 TTS 内部方法套上计时，对象上没有该方法（版本不同）时跳过 """
+    func = getattr(obj, attr, None)
+    if func is None or getattr(func, "gsvi_stage", None) is not None:
+        return
+
+    def timed(*args, **kwargs):
+        with stage(name):
+            return func(*args, **kwargs)
+
+    timed.gsvi_stage = name
+    setattr(obj, attr, timed)
+
+def instrument_pipeline() -> None:
+    """ TTS.run 内部的文本预处理、T2S 解码与声码器阶段；权重重新加载后模型对象会换新，需要再次调用 """
+    instrument(tts_pipeline, "set_ref_audio", "ref_audio")
+    instrument(tts_pipeline.text_preprocessor, "preprocess", "text_preprocess")
+    instrument(tts_pipeline, "using_vocoder_synthesis", "vocoder")
+    instrument(tts_pipeline, "using_vocoder_synthesis_batched_infer", "vocoder")
+    if getattr(tts_pipeline, "t2s_model", None) is not None:
+        instrument(tts_pipeline.t2s_model.model, "infer_panel", "t2s")
+    if getattr(tts_pipeline, "vits_model", None) is not None:
+        instrument(tts_pipeline.vits_model, "decode", "vocoder")
+
+class Metrics:
+    """ Prometheus 文本格式的直方图与计数器 """
+
+    def __init__(self, buckets: tuple = METRIC_BUCKETS):
+        self.buckets = buckets
+        self.histograms = {}  # name -> {"help": str, "series": {labels: [bucket_counts, sum, count]}}
+        self.counters = {}  # name -> {"help": str, "series": {labels: value}}
+        self.lock = threading.Lock()
+
+    def observe(self, name: str, help_text: str, labels: dict, value: float, buckets: tuple = None) -> None:
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            histogram = self.histograms.setdefault(name, {"help": help_text, "buckets": buckets or self.buckets, "series": {}})
+            entry = histogram["series"].setdefault(key, [[0] * len(histogram["buckets"]), 0.0, 0])
+            for i, bound in enumerate(histogram["buckets"]):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def inc(self, name: str, help_text: str, labels: dict = None, value: float = 1) -> None:
+        key = tuple(sorted((labels or {}).items()))
+        with self.lock:
+            series = self.counters.setdefault(name, {"help": help_text, "series": {}})["series"]
+            series[key] = series.get(key, 0) + value
+
+    def observe_stages(self, timer: StageTimer, version: str, media_type: str) -> None:
+        version, media_type = metric_version(version), metric_format(media_type)
+        for name, seconds in timer.stages.items():
+            self.observe("gsvi_stage_seconds", "推理各阶段耗时", {"stage": name, "version": version, "format": media_type}, seconds)
+        for name, nbytes in timer.memory.items():
+            self.observe("gsvi_peak_memory_bytes", "单次推理的内存峰值", {"kind": name, "version": version, "format": media_type}, nbytes, MEMORY_BUCKETS)
+
+    @staticmethod
+    def escape_label(value) -> str:
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    @classmethod
+    def format_labels(cls, labels) -> str:
+        if not labels:
+            return ""
+        pairs = ",".join(f'{k}="{cls.escape_label(v)}"' for k, v in labels)
+        return "{" + pairs + "}"
+
+    def render(self) -> str:
+        lines = []
+        with self.lock:
+            for name, counter in self.counters.items():
+                lines += [f"# HELP {name} {counter['help']}", f"# TYPE {name} counter"]
+                for labels, value in counter["series"].items():
+                    lines.append(f"{name}{self.format_labels(labels)} {value}")
+            for name, histogram in self.histograms.items():
+                lines += [f"# HELP {name} {histogram['help']}", f"# TYPE {name} histogram"]
+                for labels, (counts, total, count) in histogram["series"].items():
+                    for bound, bucket_count in zip(histogram["buckets"], counts):
+                        lines.append(f"{name}_bucket{self.format_labels(labels + (('le', bound),))} {bucket_count}")
+                    lines.append(f"{name}_bucket{self.format_labels(labels + (('le', '+Inf'),))} {count}")
+                    lines.append(f"{name}_sum{self.format_labels(labels)} {total}")
+                    lines.append(f"{name}_count{self.format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+def pipeline_version() -> str:
+    try:
+        return str(tts_pipeline.configs.version)
+    except NameError:
+        return ""
+
+# version 与 format 来自请求参数，只保留已知取值，避免任意字符串撑大指标的序列数
+def metric_version(version: str) -> str:
+    return version if version in get_version() or version == "mixed" else "other"
+
+def metric_format(media_type: str) -> str:
+    return media_type if media_type in AUDIO_ENCODERS else "other"
+
+
+#===============内存管理================
+# 不再每句都 gc.collect() + empty_cache()：只在显存 / 内存越过高水位，或推理空闲一段时间后才回收
+MEMORY_CUDA_HIGH_WATER = 0.85  # 显存保留量占总显存的比例
+MEMORY_RSS_GROWTH = 512 * 1024 ** 2  # 距上次完整回收进程常驻内存增长超过该值时回收
+MEMORY_IDLE_SECONDS = 10  # 推理空闲超过该秒数后做一次回收
+
+def process_rss() -> int:
+    """ 当前进程常驻内存字节数，无法获取时返回 0 """
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+class MemoryManager:
+    """ 按高水位与空闲时间决定何时回收内存，每次决定都写入日志 """
+
+    def __init__(self, cuda_high_water: float = MEMORY_CUDA_HIGH_WATER, rss_growth: int = MEMORY_RSS_GROWTH, idle_seconds: float = MEMORY_IDLE_SECONDS):
+        self.cuda_high_water = cuda_high_water
+        self.rss_growth = rss_growth
+        self.idle_seconds = idle_seconds
+        self.active = 0
+        self.dirty = False  # 上次回收后是否有过推理
+        self.last_activity = time()
+        self.rss_baseline = process_rss()
+        self.collections = {}  # 原因 -> 次数
+        self.skipped = 0
+        # 空闲回收在锁内进行，新推理的 enter() 会等回收结束；collect 内部会再次取锁
+        self.lock = threading.RLock()
+        self.idle_thread = None
+
+    def enter(self) -> None:
+        with self.lock:
+            self.active += 1
+            self.dirty = True
+            if self.idle_thread is None:
+                self.idle_thread = threading.Thread(target=self.idle_loop, name="gsvi-memory-idle", daemon=True)
+                self.idle_thread.start()
+
+    def leave(self) -> None:
+        with self.lock:
+            self.active -= 1
+            self.last_activity = time()
+
+    @contextmanager
+    def track(self):
+        self.enter()
+        try:
+            yield
+        finally:
+            self.leave()
+
+    def cuda_pressure(self):
+        """ 显存保留量越过高水位时返回 (已保留, 总量)，否则返回 None """
+        if not torch.cuda.is_available():
+            return None
+        reserved = torch.cuda.memory_reserved()
+        total = torch.cuda.get_device_properties(torch.cuda.current_device()).total_memory
+        if reserved > total * self.cuda_high_water:
+            return reserved, total
+        return None
+
+    def after_infer(self) -> None:
+        """ 每次推理结束后调用：未越过高水位时什么都不做 """
+        pressure = self.cuda_pressure()
+        if pressure is not None:
+            reserved, total = pressure
+            self.collect(f"显存保留 {reserved / 1024 ** 3:.2f} GB 超过高水位 {total * self.cuda_high_water / 1024 ** 3:.2f} GB", full_gc=False)
+            return
+        rss = process_rss()
+        if rss and rss - self.rss_baseline > self.rss_growth:
+            self.collect(f"常驻内存 {rss / 1024 ** 3:.2f} GB，较上次回收增长超过 {self.rss_growth / 1024 ** 2:.0f} MB")
+            return
+        self.skipped += 1
+        logger.debug(f"内存管理：未越过高水位，跳过回收（常驻内存 {rss / 1024 ** 3:.2f} GB）")
+
+    def collect(self, reason: str, full_gc: bool = True) -> None:
+        start = perf_counter()
+        actions = []
+        if full_gc:
+            collected = gc.collect()
+            actions.append(f"完整 GC 回收对象 {collected} 个")
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+            actions.append("释放显存缓存")
+        with self.lock:
+            self.dirty = False
+            self.rss_baseline = process_rss()
+            kind = "idle" if reason == "空闲" else "high_water"
+            self.collections[kind] = self.collections.get(kind, 0) + 1
+        metrics.inc("gsvi_memory_collections_total", "内存回收次数", {"reason": kind})
+        logger.info(f"内存管理：{reason}，{'，'.join(actions) or '无需处理'}，耗时 {(perf_counter() - start) * 1000:.1f} ms")
+
+    def idle_loop(self) -> None:
+        while True:
+            sleep(max(self.idle_seconds / 2, 0.5))
+            with self.lock:
+                # 判断与回收在同一把锁内，回收期间不会有推理开始
+                if self.active == 0 and self.dirty and time() - self.last_activity >= self.idle_seconds:
+                    self.collect("空闲")
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "rss_bytes": process_rss(),
+            "rss_baseline": self.rss_baseline,
+            "cuda_reserved_bytes": torch.cuda.memory_reserved() if torch.cuda.is_available() else 0,
+            "collections": dict(self.collections),
+            "skipped": self.skipped,
+        }
+
+memory_manager = MemoryManager()
+
+
+#===============权重常驻池================
+WEIGHT_POOL_MAX_MODELS = 4  # 每类（GPT / SoVITS）最多常驻的权重套数
+WEIGHT_POOL_MAX_BYTES = 6 * 1024 ** 3  # 常驻权重参数总字节上限
+
+# GPT 权重只影响这些状态，其余状态（版本、采样率等）由 SoVITS 权重决定
+T2S_STATE_ATTRS = ("t2s_model",)
+T2S_CONFIG_ATTRS = ("t2s_weights_path", "hz", "max_sec")
+VITS_STATE_ATTRS = ("vits_model", "model_version", "is_v2pro", "sv_model", "vocoder", "vocoder_configs")
+# 与权重无关、切换时不能回滚的配置
+SHARED_CONFIG_ATTRS = ("device", "is_half")
+
+def module_bytes(obj) -> int:
+    """ 统计 nn.Module 参数与缓冲区占用的字节数 """
+    if not isinstance(obj, torch.nn.Module):
+        return 0
+    tensors = list(obj.parameters()) + list(obj.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+def copy_state(value):
+    """ 快照中的可变容器（配置字典、语言列表等）深拷贝，模型与张量按引用保留 """
+    if isinstance(value, (dict, list, set)):
+        return copy.deepcopy(value)
+    return value
+
+class WeightPool:
+    """ 权重常驻池：同时保留多套 GPT / SoVITS 权重，切换最近用过的音色时不再读盘 """
+
+    def __init__(self, max_models: int = WEIGHT_POOL_MAX_MODELS, max_bytes: int = WEIGHT_POOL_MAX_BYTES):
+        self.max_models = max_models
+        self.max_bytes = max_bytes
+        self.pools = {"gpt": OrderedDict(), "sovits": OrderedDict()}  # path -> {"state", "configs", "bytes", "used"}
+        self.clock = itertools.count()  # 两类共用的使用序号，按字节淘汰时比较谁更久未用
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def snapshot(self, kind: str) -> dict:
+        if kind == "gpt":
+            state = {attr: getattr(tts_pipeline, attr) for attr in T2S_STATE_ATTRS if hasattr(tts_pipeline, attr)}
+            configs = {attr: getattr(tts_pipeline.configs, attr) for attr in T2S_CONFIG_ATTRS if hasattr(tts_pipeline.configs, attr)}
+        else:
+            state = {attr: getattr(tts_pipeline, attr) for attr in VITS_STATE_ATTRS if hasattr(tts_pipeline, attr)}
+            excluded = T2S_CONFIG_ATTRS + SHARED_CONFIG_ATTRS
+            configs = {k: v for k, v in vars(tts_pipeline.configs).items() if k not in excluded}
+        total_bytes = sum(module_bytes(value) for value in state.values())
+        # 之后切换到别的权重时流水线会原地修改这些容器，快照必须持有自己的副本
+        state = {attr: copy_state(value) for attr, value in state.items()}
+        configs = {attr: copy_state(value) for attr, value in configs.items()}
+        return {"state": state, "configs": configs, "bytes": total_bytes, "used": next(self.clock)}
+
+    def restore(self, entry: dict) -> None:
+        for attr, value in entry["state"].items():
+            setattr(tts_pipeline, attr, copy_state(value))
+        for attr, value in entry["configs"].items():
+            setattr(tts_pipeline.configs, attr, copy_state(value))
+
+    def activate(self, kind: str, path: str) -> None:
+        with self.lock:
+            entries = self.pools[kind]
+            if path in entries:
+                self.hits += 1
+                entries.move_to_end(path)
+                entries[path]["used"] = next(self.clock)
+                self.restore(entries[path])
+                logger.info(f"从常驻池切换 {kind.upper()} 模型: {path}")
+                return
+            self.misses += 1
+            logger.info(f"正在加载 {'GPT' if kind == 'gpt' else 'SoVITS'} 模型: {path}")
+            if kind == "gpt":
+                tts_pipeline.init_t2s_weights(path)
+            else:
+                tts_pipeline.init_vits_weights(path)
+            instrument_pipeline()
+            entries[path] = self.snapshot(kind)
+            self.evict(keep=path)
+
+    def total_bytes(self) -> int:
+        return sum(entry["bytes"] for entries in self.pools.values() for entry in entries.values())
+
+    def evict(self, keep: str) -> None:
+        evicted = False
+        for kind, entries in self.pools.items():
+            while len(entries) > self.max_models:
+                # 刚激活的权重不淘汰，其余按最久未用的顺序淘汰
+                self.drop(kind, next(p for p in entries if p != keep))
+                evicted = True
+        while self.total_bytes() > self.max_bytes:
+            # 两类合在一起挑最久未用的一项；每类最后一项是流水线当前使用的权重，不淘汰
+            candidates = [(entry["used"], kind, path) for kind, entries in self.pools.items()
+                          for path, entry in list(entries.items())[:-1] if path != keep]
+            if not candidates:
+                break
+            _, kind, path = min(candidates)
+            self.drop(kind, path)
+            evicted = True
+        if evicted and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def drop(self, kind: str, path: str) -> None:
+        self.pools[kind].pop(path)
+        self.evictions += 1
+        logger.info(f"权重常驻池淘汰 {kind.upper()} 模型: {path}")
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "gpt": list(self.pools["gpt"].keys()),
+                "sovits": list(self.pools["sovits"].keys()),
+                "total_bytes": self.total_bytes(),
+                "max_bytes": self.max_bytes,
+                "max_models": self.max_models,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+#===============输出文件管理================
+# outputs/ 下的文件由 OutputStore 统一登记：按 TTL 与总大小清理，下载时记录最近访问时间
+OUTPUT_INDEX = "cache/outputs_index.json"
+OUTPUT_TTL_SECONDS = 7 * 24 * 3600  # 超过该时间未被下载（或创建后从未下载）的文件会被清理
+OUTPUT_MAX_BYTES = 5 * 1024 ** 3  # outputs/ 总大小上限，超出后按最近访问时间从旧到新清理
+OUTPUT_SWEEP_SECONDS = 600  # 后台清理间隔
+OUTPUT_SAVE_SECONDS = 30  # 索引有变化时的落盘间隔
+
+def path_size(path: Path) -> int:
+    if path.is_dir():
+        return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+    try:
+        return path.stat().st_size
+    except OSError:
+        return 0
+
+class OutputStore:
+    """ 输出文件索引：相对路径 -> {"md5", "size", "created", "last_served"}，相同音频只保存一份 """
+
+    def __init__(self, root: str = "outputs", index_path: str = OUTPUT_INDEX, ttl: float = OUTPUT_TTL_SECONDS, max_bytes: int = OUTPUT_MAX_BYTES):
+        self.root = Path(root)
+        self.index_path = Path(index_path)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.entries = {}
+        self.total_bytes = 0
+        self.removed = 0
+        self.dirty = False
+        self.lock = threading.Lock()
+        self.sweeper = None
+        self.listeners = []  # 文件删除后的回调，参数为相对路径
+        self.load()
+
+    def load(self) -> None:
+        if self.index_path.exists():
+            try:
+                self.entries = json.loads(self.index_path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                logger.warning(f"输出文件索引损坏，将重新扫描: {self.index_path}")
+                self.entries = {}
+        # 丢掉已不存在的条目
+        self.entries = {path: entry for path, entry in self.entries.items() if Path(path).exists()}
+        self.adopt()
+        logger.info(f"已登记输出文件 {len(self.entries)} 个，共 {self.total_bytes / 1024 ** 2:.1f} MB")
+
+    def adopt(self) -> None:
+        """ 登记索引之外的文件（以修改时间作为创建时间），包括旧版本留下的和其他推理进程写入的 """
+        for path in self.root.iterdir() if self.root.exists() else []:
+            key = path.as_posix()
+            # 以 . 开头的是正在删除的文件（见 detach）
+            if key not in self.entries and not key.endswith(".part") and not path.name.startswith("."):
+                mtime = path.stat().st_mtime
+                self.entries[key] = {"md5": "", "size": path_size(path), "created": mtime, "last_served": None}
+        self.total_bytes = sum(entry["size"] for entry in self.entries.values())
+        self.dirty = True
+
+    def save(self) -> None:
+        with self.lock:
+            if not self.dirty:
+                return
+            payload = json.dumps(self.entries, ensure_ascii=False)
+            self.dirty = False
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.index_path.with_suffix(".tmp")
+        tmp_path.write_text(payload, encoding="utf-8")
+        tmp_path.replace(self.index_path)
+
+    def add(self, audio: bytes, media_type: str) -> str:
+        """ 以内容 md5 命名写入 outputs/，相同内容只写一次 """
+        digest = md5(audio).hexdigest()
+        audio_path = f"{self.root.as_posix()}/{digest}.{media_type}"
+        with self.lock:
+            entry = self.entries.get(audio_path)
+            if entry is not None and Path(audio_path).exists():
+                # 已有的文件又交给了新的请求，刷新访问时间，清理线程不会在客户端下载前删掉它
+                entry["last_served"] = time()
+                self.dirty = True
+                return audio_path
+        # 在锁外写入隐藏的临时文件再改名，写盘期间下载不用等锁，也不会读到写了一半的文件
+        target = Path(audio_path)
+        partial = target.with_name(f".{target.name}.writing-{uuid4().hex}")
+        partial.write_bytes(audio)
+        partial.replace(target)
+        with self.lock:
+            self.register(audio_path, digest, len(audio))
+        return audio_path
+
+    def add_path(self, path: str) -> str:
+        """ 登记已写入 outputs/ 的文件或目录（如多人对话的压缩包） """
+        with self.lock:
+            self.register(Path(path).as_posix(), "", path_size(Path(path)))
+        return path
+
+    def register(self, path: str, digest: str, size: int) -> None:
+        old = self.entries.get(path)
+        if old is not None:
+            self.total_bytes -= old["size"]
+        self.entries[path] = {"md5": digest, "size": size, "created": time(), "last_served": None}
+        self.total_bytes += size
+        self.dirty = True
+
+    def serve(self, result_path: str) -> str:
+        """ 下载前解析路径并记录访问时间，路径越界或文件不存在时返回空字符串 """
+        root = self.root.resolve()
+        file_path = (root / result_path).resolve()
+        if root not in file_path.parents or not file_path.is_file():
+            return ""
+        relative = file_path.relative_to(root)
+        key = f"{self.root.as_posix()}/{relative.as_posix()}"
+        # 目录内的文件（如 conv_xxx/ 下的单句音频）记到目录条目上
+        keys = (key, f"{self.root.as_posix()}/{relative.parts[0]}")
+        with self.lock:
+            entry = next((self.entries[k] for k in keys if k in self.entries), None)
+            if entry is not None:
+                entry["last_served"] = time()
+                self.dirty = True
+                return str(file_path)
+        # 索引外的文件在锁外统计大小再登记
+        size = path_size(file_path)
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = {"md5": "", "size": size, "created": time(), "last_served": None}
+                self.total_bytes += size
+            self.entries[key]["last_served"] = time()
+            self.dirty = True
+        return str(file_path)
+
+    def on_remove(self, callback) -> None:
+        self.listeners.append(callback)
+
+    def remove(self, path: str) -> None:
+        with self.lock:
+            trash = self.detach(path)
+        self.discard([(path, trash)])
+
+    def detach(self, path: str) -> Path:
+        """
+        在锁内从索引中摘除并改名为同目录下的隐藏文件，返回改名后的路径（不存在时为 None）。
+        真正的删除（大目录的 rmtree 可能很慢）由 discard 在锁外完成，期间下载与写入不受影响。
+        """
+        entry = self.entries.pop(path, None)
+        if entry is not None:
+            self.total_bytes -= entry["size"]
+            self.removed += 1
+            self.dirty = True
+        target = Path(path)
+        trash = target.with_name(f".{target.name}.deleting-{uuid4().hex}")
+        try:
+            target.rename(trash)
+        except OSError:
+            return None
+        return trash
+
+    def discard(self, detached: list) -> None:
+        for path, trash in detached:
+            if trash is not None:
+                self.delete(trash)
+            for callback in self.listeners:
+                try:
+                    callback(path)
+                except Exception as e:
+                    logger.error(f"输出文件删除回调失败 {path}: {e}")
+
+    @staticmethod
+    def delete(target: Path) -> None:
+        if target.is_dir():
+            rmtree(target, ignore_errors=True)
+        else:
+            target.unlink(missing_ok=True)
+
+    def sweep(self) -> int:
+        """ 先清理过期文件，再按最近访问时间清理到总大小以内，返回清理的文件数 """
+        now = time()
+        detached = []
+        with self.lock:
+            self.adopt()
+            last_used = lambda item: item[1]["last_served"] or item[1]["created"]
+            for path, _ in [item for item in self.entries.items() if now - last_used(item) > self.ttl]:
+                detached.append((path, self.detach(path)))
+            for path, _ in sorted(self.entries.items(), key=last_used):
+                if self.total_bytes <= self.max_bytes:
+                    break
+                detached.append((path, self.detach(path)))
+        removed = len(detached)
+        # 上次删除中途退出留下的隐藏文件，以及写入中途退出留下的过期临时文件
+        pending = {trash for _, trash in detached}
+        for leftover in self.root.glob(".*.deleting-*") if self.root.exists() else []:
+            if leftover not in pending:
+                self.delete(leftover)
+        for leftover in self.root.glob(".*.writing-*") if self.root.exists() else []:
+            try:
+                if now - leftover.stat().st_mtime > self.ttl:
+                    leftover.unlink()
+            except OSError:
+                pass
+        self.discard(detached)
+        if removed:
+            logger.info(f"已清理输出文件 {removed} 个，剩余 {self.total_bytes / 1024 ** 2:.1f} MB")
+        self.save()
+        return removed
+
+    def start(self) -> None:
+        if self.sweeper is not None:
+            return
+        self.sweeper = threading.Thread(target=self.sweep_forever, name="gsvi-output-sweeper", daemon=True)
+        self.sweeper.start()
+        atexit.register(self.save)
+
+    def sweep_forever(self) -> None:
+        last_sweep = 0.0
+        while True:
+            if time() - last_sweep >= OUTPUT_SWEEP_SECONDS:
+                last_sweep = time()
+                try:
+                    self.sweep()
+                except Exception as e:
+                    logger.error(f"清理输出文件失败: {e}")
+            else:
+                self.save()
+            sleep(OUTPUT_SAVE_SECONDS)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "total_bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "removed": self.removed,
+            }
+
+def save_output(audio: bytes, media_type: str) -> str:
+    """ 写入 outputs/ 并登记到输出文件索引 """
+    return output_store.add(audio, media_type)
+
+
+#===============合成缓存================
+SYNTH_CACHE_INDEX = "cache/synth_cache.jsonl"
+SYNTH_CACHE_MAX_BYTES = 2 * 1024 ** 3  # 缓存音频总大小上限，超出后按 LRU 淘汰
+SYNTH_CACHE_COMPACT_RECORDS = 4096  # 索引记录数超过该值且超过现存条目数两倍时重写索引
+
+def file_signature(file_path: str) -> list:
+    """ 文件签名（路径、大小、修改时间），文件被替换后缓存键随之变化 """
+    try:
+        stat = Path(file_path).stat()
+        return [file_path, stat.st_size, stat.st_mtime_ns]
+    except OSError:
+        return [file_path, 0, 0]
+
+class FileLock:
+    """ 跨进程的排他文件锁（Windows 用 msvcrt，其余系统用 fcntl），同一进程内的线程另由线程锁互斥 """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.thread_lock = threading.Lock()
+        self.handle = None
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            handle = open(self.path, "a+b")
+            try:
+                self.lock_handle(handle)
+            except BaseException:
+                handle.close()
+                raise
+        except BaseException:
+            self.thread_lock.release()
+            raise
+        self.handle = handle
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        try:
+            self.unlock_handle(self.handle)
+        finally:
+            self.handle.close()
+            self.handle = None
+            self.thread_lock.release()
+
+    @staticmethod
+    def lock_handle(handle) -> None:
+        if os.name == "nt":
+            import msvcrt
+            handle.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+                    return
+                except OSError:
+                    sleep(0.05)
+        import fcntl
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+
+    @staticmethod
+    def unlock_handle(handle) -> None:
+        if os.name == "nt":
+            import msvcrt
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+            return
+        import fcntl
+        fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+class SynthCache:
+    """
+    持久化合成缓存：键为 infer_dict 与权重文件的规范化哈希，值为 outputs/ 下的音频文件。
+    索引为只追加的 JSON Lines（put / evict 记录），多进程部署时各推理进程共用：
+    追加与重写都持有跨进程文件锁，本地未命中时只读取上次读到的位置之后新增的记录。
+    """
+
+    def __init__(self, index_path: str = SYNTH_CACHE_INDEX, max_bytes: int = SYNTH_CACHE_MAX_BYTES):
+        self.index_path = Path(index_path)
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> {"path": str, "size": int}，越靠后越新
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.index_inode = None  # 重写索引会换新文件，inode 变化时从头读取
+        self.index_offset = 0
+        self.index_records = 0
+        self.file_lock = FileLock(f"{index_path}.lock")
+        # evict 持锁删除输出文件时会经由 OutputStore 的删除回调再次进入 forget_path
+        self.lock = threading.RLock()
+        self.migrate()
+        self.load()
+        logger.info(f"已载入合成缓存 {len(self.entries)} 条，共 {self.total_bytes / 1024 ** 2:.1f} MB")
+
+    @staticmethod
+    def make_key(infer_dict: dict, media_type: str, weights: tuple[str, str]) -> str:
+        payload = {
+            "infer": infer_dict,
+            "media_type": media_type,
+            "ref_audio": file_signature(infer_dict["ref_audio_path"]),
+            "gpt": file_signature(weights[0]),
+            "sovits": file_signature(weights[1]),
+        }
+        canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return md5(canonical.encode("utf-8")).hexdigest()
+
+    def migrate(self) -> None:
+        """ 旧版本的索引为整份 JSON（cache/synth_cache.json），转成追加记录后删除 """
+        legacy = self.index_path.with_suffix(".json")
+        if not legacy.exists():
+            return
+        with self.file_lock:
+            try:
+                records = json.loads(legacy.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                records = []
+            if not self.index_path.exists():
+                self.append([{"op": "put", "key": key, **entry} for key, entry in records if Path(entry["path"]).exists()])
+            legacy.unlink(missing_ok=True)
+
+    def apply(self, record: dict) -> None:
+        old = self.entries.pop(record["key"], None)
+        if old is not None:
+            self.total_bytes -= old["size"]
+        if record["op"] == "put":
+            self.entries[record["key"]] = {"path": record["path"], "size": record["size"]}
+            self.total_bytes += record["size"]
+
+    def load(self) -> None:
+        """ 读取索引中本进程还没读过的记录；索引被其他进程重写过时从头读取 """
+        try:
+            stat = self.index_path.stat()
+        except OSError:
+            return
+        if stat.st_ino != self.index_inode or stat.st_size < self.index_offset:
+            self.entries.clear()
+            self.total_bytes = 0
+            self.index_inode = stat.st_ino
+            self.index_offset = 0
+            self.index_records = 0
+        if stat.st_size == self.index_offset:
+            return
+        try:
+            with open(self.index_path, "rb") as index_file:
+                index_file.seek(self.index_offset)
+                data = index_file.read()
+        except OSError:
+            return
+        # 只处理完整的行，其他进程正在写的最后一行下次再读
+        complete = data[:data.rfind(b"\n") + 1]
+        self.index_offset += len(complete)
+        for line in complete.splitlines():
+            try:
+                self.apply(json.loads(line))
+                self.index_records += 1
+            except (ValueError, KeyError, TypeError):
+                logger.warning(f"合成缓存索引中有损坏的记录，已忽略: {self.index_path}")
+
+    def append(self, records: list[dict]) -> None:
+        """ 追加记录，需持有文件锁；追加前先读入其他进程的新记录，记录过多时重写为现存条目 """
+        if not records:
+            return
+        self.load()
+        payload = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode("utf-8")
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.index_path, "ab") as index_file:
+            index_file.write(payload)
+        stat = self.index_path.stat()
+        self.index_inode = stat.st_ino
+        self.index_offset = stat.st_size
+        self.index_records += len(records)
+        if self.index_records > max(SYNTH_CACHE_COMPACT_RECORDS, 2 * len(self.entries)):
+            self.compact()
+
+    def compact(self) -> None:
+        tmp_path = self.index_path.with_suffix(f".{os.getpid()}.tmp")
+        lines = [json.dumps({"op": "put", "key": key, **entry}, ensure_ascii=False) + "\n" for key, entry in self.entries.items()]
+        try:
+            tmp_path.write_text("".join(lines), encoding="utf-8")
+            tmp_path.replace(self.index_path)
+        except OSError as e:
+            # Windows 上其他进程恰好打开着索引时无法替换，下次追加时再试
+            logger.warning(f"重写合成缓存索引失败: {e}")
+            tmp_path.unlink(missing_ok=True)
+            return
+        stat = self.index_path.stat()
+        self.index_inode = stat.st_ino
+        self.index_offset = stat.st_size
+        self.index_records = len(lines)
+
+    def get(self, key: str):
+        with self.lock:
+            if key not in self.entries:
+                self.load()
+            entry = self.entries.get(key)
+            if entry is not None and Path(entry["path"]).exists():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return Path(entry["path"]).read_bytes()
+            if entry is not None:
+                self.entries.pop(key)
+                self.total_bytes -= entry["size"]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, audio: bytes, media_type: str) -> str:
+        with self.lock:
+            audio_path = save_output(audio, media_type)
+            with self.file_lock:
+                self.load()
+                old = self.entries.pop(key, None)
+                if old is not None:
+                    self.total_bytes -= old["size"]
+                self.entries[key] = {"path": audio_path, "size": len(audio)}
+                self.total_bytes += len(audio)
+                evicted = self.evict()
+                self.append([{"op": "put", "key": key, "path": audio_path, "size": len(audio)}]
+                            + [{"op": "evict", "key": evicted_key} for evicted_key, _ in evicted])
+            # 删除文件会回调 forget_path 并再次取文件锁，放在锁外进行
+            for path in {entry["path"] for _, entry in evicted}:
+                # 不同键可能对应同一份音频，仍被引用时保留文件
+                if not any(e["path"] == path for e in self.entries.values()):
+                    output_store.remove(path)
+            return audio_path
+
+    def evict(self) -> list:
+        evicted = []
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            key, entry = self.entries.popitem(last=False)
+            self.total_bytes -= entry["size"]
+            self.evictions += 1
+            evicted.append((key, entry))
+        return evicted
+
+    def forget_path(self, path: str) -> None:
+        """ OutputStore 删除文件后的回调：去掉指向该文件的条目并记入索引，total_bytes 随之更新 """
+        with self.lock:
+            with self.file_lock:
+                self.load()
+                keys = [key for key, entry in self.entries.items() if entry["path"] == path]
+                for key in keys:
+                    self.total_bytes -= self.entries.pop(key)["size"]
+                self.append([{"op": "evict", "key": key} for key in keys])
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "total_bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+#===============参考音频特征缓存================
+# TTS 只记得上一次用过的参考音频；这里按内容缓存每条参考音频预处理后的 prompt_cache，
+# 切换情感时直接装回，TTS.run 会跳过 set_ref_audio 与参考文本的音素/BERT 提取
+REF_FEATURE_CACHE_DIR = "cache/ref_features"
+REF_FEATURE_CACHE_MAX_ENTRIES = 512
+
+def tensor_bytes(value) -> int:
+    if isinstance(value, torch.Tensor):
+        return value.numel() * value.element_size()
+    if isinstance(value, (list, tuple)):
+        return sum(tensor_bytes(item) for item in value)
+    return 0
+
+class RefFeatureCache:
+    """ 参考音频特征缓存：键为 (参考音频内容 md5, 参考文本, 参考语言, 模型版本, SoVITS 权重) """
+
+    def __init__(self, cache_dir: str = REF_FEATURE_CACHE_DIR, on_disk: bool = False, max_entries: int = REF_FEATURE_CACHE_MAX_ENTRIES):
+        self.cache_dir = Path(cache_dir)
+        self.on_disk = on_disk
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> prompt_cache 快照
+        self.wav_hashes = {}  # 文件签名 -> 内容 md5，避免每次请求都重新读取参考音频
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.lock = threading.Lock()
+        if on_disk:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def wav_hash(self, wav_path: str) -> str:
+        signature = tuple(file_signature(wav_path))
+        digest = self.wav_hashes.get(signature)
+        if digest is None:
+            digest = md5(Path(wav_path).read_bytes()).hexdigest()
+            self.wav_hashes[signature] = digest
+        return digest
+
+    def make_key(self, ref_audio_path: str, prompt_text: str, prompt_lang: str) -> str:
+        payload = [
+            self.wav_hash(ref_audio_path),
+            (prompt_text or "").strip("\n"),
+            prompt_lang,
+            tts_pipeline.configs.version,
+            file_signature(loaded_sovits_model),
+        ]
+        return md5(json.dumps(payload, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def restore(self, key: str, ref_audio_path: str) -> bool:
+        """ 命中时把特征装回 tts_pipeline.prompt_cache；未命中时清空，让本次推理按当前权重重新提取 """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            elif self.on_disk:
+                entry = self.load(key)
+            if entry is None:
+                self.misses += 1
+                tts_pipeline.prompt_cache["ref_audio_path"] = None
+                tts_pipeline.prompt_cache["prompt_text"] = None
+                return False
+            self.hits += 1
+        tts_pipeline.prompt_cache.update({k: list(v) if isinstance(v, list) else v for k, v in entry.items()})
+        tts_pipeline.prompt_cache["ref_audio_path"] = ref_audio_path
+        return True
+
+    def capture(self, key: str) -> None:
+        """ 推理结束后记录 TTS 刚算出的特征 """
+        if tts_pipeline.prompt_cache.get("ref_audio_path") is None:
+            return
+        entry = {k: list(v) if isinstance(v, list) else v for k, v in tts_pipeline.prompt_cache.items()}
+        with self.lock:
+            self.entries[key] = entry
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        if self.on_disk and not (self.cache_dir / f"{key}.pt").exists():
+            try:
+                tmp_path = self.cache_dir / f"{key}.tmp"
+                torch.save(entry, tmp_path)
+                tmp_path.replace(self.cache_dir / f"{key}.pt")
+            except Exception as e:
+                logger.warning(f"参考音频特征写入磁盘失败: {e}")
+
+    def load(self, key: str):
+        feature_path = self.cache_dir / f"{key}.pt"
+        if not feature_path.exists():
+            return None
+        try:
+            entry = torch.load(feature_path, map_location=tts_pipeline.configs.device)
+        except Exception as e:
+            logger.warning(f"参考音频特征缓存损坏，已忽略: {feature_path} ({e})")
+            return None
+        self.disk_hits += 1
+        self.entries[key] = entry
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return entry
+
+    def warm(self, ref_audio_path: str, prompt_text: str, prompt_lang: str) -> bool:
+        """ 不做合成，只按 TTS.run 的方式预处理一条参考音频并记录 """
+        key = self.make_key(ref_audio_path, prompt_text, prompt_lang)
+        with self.lock:
+            if key in self.entries or (self.on_disk and self.load(key) is not None):
+                return False
+        with torch.no_grad():
+            tts_pipeline.set_ref_audio(ref_audio_path)
+            prompt_text = (prompt_text or "").strip("\n")
+            if prompt_text:
+                if prompt_text[-1] not in splits:
+                    prompt_text += "。" if prompt_lang != "en" else "."
+                phones, bert_features, norm_text = tts_pipeline.text_preprocessor.segment_and_extract_feature_for_text(
+                    prompt_text, prompt_lang, tts_pipeline.configs.version
+                )
+                tts_pipeline.prompt_cache.update({
+                    "prompt_text": prompt_text,
+                    "prompt_lang": prompt_lang,
+                    "phones": phones,
+                    "bert_features": bert_features,
+                    "norm_text": norm_text,
+                })
+        self.capture(key)
+        return True
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "total_bytes": sum(tensor_bytes(list(entry.values())) for entry in self.entries.values()),
+                "max_entries": self.max_entries,
+                "on_disk": self.on_disk,
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+def warm_ref_features(model_name: str, version: str) -> int:
+    """ 预处理说话人 reference_audios 下全部情感参考音频，返回新缓存的条数 """
+    gpt_model, sovits_model = get_model_path(model_name, version)
+    if sovits_model == "":
+        return 0
+    load_weights(gpt_model, sovits_model)
+    warmed = 0
+    speaker = model_index.speakers(version).get(model_name, {})
+    for lang, lang_entry in speaker.get("langs", {}).items():
+        if lang not in LANG_CODES:
+            continue
+        for emotion, (ref_audio_path, prompt_text) in lang_entry["emotions"].items():
+            try:
+                warmed += ref_feature_cache.warm(ref_audio_path, prompt_text, LANG_CODES[lang])
+            except Exception as e:
+                logger.warning(f"预处理参考音频失败 {ref_audio_path}: {e}")
+    logger.info(f"已预处理 {version}/{model_name} 的参考音频 {warmed} 条")
+    return warmed
+
+
+#===============分句缓存================
+# 可选模式（启动参数 --segment_cache）：固定种子时按 text_split_method 切句后逐句合成并缓存，
+# 只改了一句的回复再次合成时，其余句子直接取缓存
+SEGMENT_CACHE_MAX_BYTES = 512 * 1024 ** 2  # 缓存 PCM 总大小上限，超出后按 LRU 淘汰
+# 与分句无关、不参与缓存键的推理参数
+SEGMENT_KEY_EXCLUDED = ("text", "text_split_method", "seed", "return_fragment")
+
+class SegmentCache:
+    """ 分句缓存：键为 (单句文本, 说话人权重, 参考音频, 种子, 其余推理参数)，值为该句的 PCM """
+
+    def __init__(self, max_bytes: int = SEGMENT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (采样率, np.ndarray)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def split(infer_dict: dict) -> list[str]:
+        """ 与 TTS 相同的切分函数，切分结果按行分隔 """
+        text = get_method(infer_dict["text_split_method"])(infer_dict["text"])
+        return [segment for segment in text.split("\n") if segment.strip()]
+
+    @staticmethod
+    def make_key(segment: str, infer_dict: dict, weights: tuple[str, str], seed: int) -> str:
+        payload = {
+            "segment": segment,
+            "params": {k: v for k, v in infer_dict.items() if k not in SEGMENT_KEY_EXCLUDED},
+            "seed": seed,
+            "ref_audio": file_signature(infer_dict["ref_audio_path"]),
+            "gpt": file_signature(weights[0]),
+            "sovits": file_signature(weights[1]),
+        }
+        canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return md5(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, sr: int, audio: np.ndarray) -> None:
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[1].nbytes
+            self.entries[key] = (sr, audio)
+            self.total_bytes += audio.nbytes
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def synthesize(self, infer_dict: dict, weights: tuple[str, str]) -> tuple[int, np.ndarray]:
+        """
+        逐句取缓存或合成后拼接。TTS 会在每个片段末尾补 fragment_interval 的静音，
+        所以直接拼接即得到句间间隔为 fragment_interval 的整段音频。
+        只用于固定种子的请求，随机种子每次都应得到不同的音色与语气。
+        """
+        seed = infer_dict["seed"]
+        pieces = []
+        sr = None
+        for segment in self.split(infer_dict):
+            with stage("segment_lookup"):
+                key = self.make_key(segment, infer_dict, weights, seed)
+                cached = self.get(key)
+            metrics.inc("gsvi_segment_cache_total", "分句缓存查询次数", {"result": "miss" if cached is None else "hit"})
+            if cached is None:
+                segment_dict = {**infer_dict, "text": segment, "text_split_method": "cut0"}
+                cached = next(tts_pipeline.run(segment_dict))
+                self.put(key, *cached)
+            segment_sr, audio = cached
+            if sr is not None and segment_sr != sr:
+                raise ValueError(f"分句采样率不一致: {sr} / {segment_sr}")
+            sr = segment_sr
+            pieces.append(audio)
+        if not pieces:
+            # 切分后没有可合成的句子（如纯标点），交给 TTS 按原样处理
+            return next(tts_pipeline.run(infer_dict))
+        return sr, np.concatenate(pieces)
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "total_bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+#===============文本前端缓存================
+# TTS 每次都从头切分文本并逐句做 G2P 与 BERT 特征提取；同一句话（含参考文本）再次出现时直接取结果
+FRONTEND_CACHE_MAX_BYTES = 128 * 1024 ** 2  # BERT 特征（位于推理设备上）总大小上限，超出后按 LRU 淘汰
+FRONTEND_CACHE_MAX_ENTRIES = 8192
+SEGMENTATION_CACHE_MAX_ENTRIES = 1024
+
+class FrontendCache:
+    """ 文本前端缓存：(单句, 语言, 版本) -> (音素, BERT 特征, 规范化文本)，(文本, 语言, 切分方法) -> 切分结果 """
+
+    def __init__(self, max_bytes: int = FRONTEND_CACHE_MAX_BYTES, max_entries: int = FRONTEND_CACHE_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.features = OrderedDict()  # key -> ((phones, bert_features, norm_text), 字节数)
+        self.segments = OrderedDict()  # key -> 切分后的句子列表
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.segment_hits = 0
+        self.segment_misses = 0
+        self.lock = threading.Lock()
+
+    def attach(self, preprocessor) -> None:
+        """ 替换 TextPreprocessor 上的切分与特征提取方法，preprocess 内部经由 self 调用，同样会走缓存 """
+        extract = getattr(preprocessor, "segment_and_extract_feature_for_text", None)
+        if extract is not None and not getattr(extract, "gsvi_cached", False):
+            def cached_extract(*args, **kwargs):
+                return self.extract(extract, *args, **kwargs)
+            cached_extract.gsvi_cached = True
+            preprocessor.segment_and_extract_feature_for_text = cached_extract
+        segment = getattr(preprocessor, "pre_seg_text", None)
+        if segment is not None and not getattr(segment, "gsvi_cached", False):
+            def cached_segment(*args, **kwargs):
+                return self.segment(segment, *args, **kwargs)
+            cached_segment.gsvi_cached = True
+            preprocessor.pre_seg_text = cached_segment
+
+    @staticmethod
+    def make_key(args: tuple, kwargs: dict) -> tuple:
+        return args + tuple(sorted(kwargs.items()))
+
+    def extract(self, func, *args, **kwargs):
+        key = self.make_key(args, kwargs)
+        with self.lock:
+            entry = self.features.get(key)
+            if entry is not None:
+                self.features.move_to_end(key)
+                self.hits += 1
+        if entry is not None:
+            metrics.inc("gsvi_frontend_cache_total", "文本前端缓存查询次数", {"kind": "features", "result": "hit"})
+            return entry[0]
+        metrics.inc("gsvi_frontend_cache_total", "文本前端缓存查询次数", {"kind": "features", "result": "miss"})
+        result = func(*args, **kwargs)
+        phones, bert_features = result[0], result[1]
+        if phones is None:
+            # 提取失败（如文本全是标点）时不缓存
+            with self.lock:
+                self.misses += 1
+            return result
+        size = tensor_bytes(bert_features)
+        with self.lock:
+            self.misses += 1
+            old = self.features.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[1]
+            self.features[key] = (result, size)
+            self.total_bytes += size
+            while (self.total_bytes > self.max_bytes or len(self.features) > self.max_entries) and len(self.features) > 1:
+                _, (_, evicted_size) = self.features.popitem(last=False)
+                self.total_bytes -= evicted_size
+                self.evictions += 1
+        return result
+
+    def segment(self, func, *args, **kwargs) -> list[str]:
+        key = self.make_key(args, kwargs)
+        with self.lock:
+            texts = self.segments.get(key)
+            if texts is not None:
+                self.segments.move_to_end(key)
+                self.segment_hits += 1
+        if texts is not None:
+            metrics.inc("gsvi_frontend_cache_total", "文本前端缓存查询次数", {"kind": "segments", "result": "hit"})
+            # 返回副本，调用方可能修改列表
+            return list(texts)
+        metrics.inc("gsvi_frontend_cache_total", "文本前端缓存查询次数", {"kind": "segments", "result": "miss"})
+        texts = func(*args, **kwargs)
+        with self.lock:
+            self.segment_misses += 1
+            self.segments[key] = list(texts)
+            while len(self.segments) > SEGMENTATION_CACHE_MAX_ENTRIES:
+                self.segments.popitem(last=False)
+        return texts
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            segment_lookups = self.segment_hits + self.segment_misses
+            return {
+                "entries": len(self.features),
+                "total_bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "segment_entries": len(self.segments),
+                "segment_hits": self.segment_hits,
+                "segment_misses": self.segment_misses,
+                "segment_hit_rate": self.segment_hits / segment_lookups if segment_lookups else 0.0,
+            }
+
+
+#===============音频编码================
+# 编码器按优先级注册：优先进程内编码（libsndfile），不可用时退回预热的 ffmpeg 进程
+FFMPEG_SPARE_PROCESSES = 1  # 每种 (编码参数, 采样率) 预先启动的 ffmpeg 进程数
+
+def sndfile_supports(sf_format: str, subtype: str = None) -> bool:
+    """ 当前 libsndfile 是否支持写出指定格式 """
+    if sf_format not in sf.available_formats():
+        return False
+    return subtype is None or subtype in sf.available_subtypes(sf_format)
+
+class FFmpegPool:
+    """
+    预热的 ffmpeg 进程池。每个进程只编码一段音频（流边界无法在同一进程里安全切分），
+    但取用时立即在后台补充下一个，进程启动耗时不再落在请求路径上。
+    """
+
+    def __init__(self, spare: int = FFMPEG_SPARE_PROCESSES):
+        self.spare = spare
+        self.ready = {}  # 命令行 -> 已启动、等待输入的进程列表
+        self.lock = threading.Lock()
+        self.closed = False
+        atexit.register(self.close)
+
+    @staticmethod
+    def spawn(cmd: tuple) -> subprocess.Popen:
+        return subprocess.Popen(list(cmd), stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def refill(self, cmd: tuple) -> None:
+        # 检查与补充在同一把锁内完成，并发的补充线程不会各自看到缺口而多启动进程
+        with self.lock:
+            if self.closed:
+                return
+            processes = self.ready.setdefault(cmd, [])
+            processes[:] = [p for p in processes if p.poll() is None]
+            while len(processes) < self.spare:
+                processes.append(self.spawn(cmd))
+
+    def acquire(self, cmd: tuple) -> subprocess.Popen:
+        with self.lock:
+            processes = self.ready.setdefault(cmd, [])
+            process = processes.pop() if processes else None
+        # 预热的进程可能已被系统结束
+        if process is None or process.poll() is not None:
+            process = self.spawn(cmd)
+        threading.Thread(target=self.refill, args=(cmd,), daemon=True).start()
+        return process
+
+    def encode(self, cmd: list[str], pcm: bytes) -> bytes:
+        process = self.acquire(tuple(cmd))
+        out, _ = process.communicate(input=pcm)
+        return out
+
+    def close(self) -> None:
+        with self.lock:
+            self.closed = True
+            processes = [p for procs in self.ready.values() for p in procs]
+            self.ready.clear()
+        for process in processes:
+            process.kill()
+
+ffmpeg_pool = FFmpegPool()
+
 def pack_ogg(io_buffer:BytesIO, data:np.ndarray, rate:int):
     with sf.SoundFile(io_buffer, mode='w', samplerate=rate, channels=1, format='ogg') as audio_file:
         audio_file.write(data)
     return io_buffer
 
 
-def pack_raw(io_buffer:BytesIO, data:np.ndarray, rate:int):
-    io_buffer.write(data.tobytes())
+def pack_opus(io_buffer:BytesIO, data:np.ndarray, rate:int):
+    with sf.SoundFile(io_buffer, mode='w', samplerate=rate, channels=1, format='OGG', subtype='OPUS') as audio_file:
+        audio_file.write(data)
     return io_buffer
 
 
+def wav_header(rate: int, data_bytes: int = None, channels: int = 1, sample_width: int = 2) -> bytes:
+    """ 44 字节 PCM WAV 头，data_bytes 为 None 时按流式惯例填 0xFFFFFFFF """
+    riff_size = 0xFFFFFFFF if data_bytes is None else 36 + data_bytes
+    data_size = 0xFFFFFFFF if data_bytes is None else data_bytes
+    byte_rate = rate * channels * sample_width
+    return (
+        b"RIFF" + riff_size.to_bytes(4, "little") + b"WAVE"
+        + b"fmt " + (16).to_bytes(4, "little") + (1).to_bytes(2, "little")
+        + channels.to_bytes(2, "little") + rate.to_bytes(4, "little")
+        + byte_rate.to_bytes(4, "little") + (channels * sample_width).to_bytes(2, "little")
+        + (sample_width * 8).to_bytes(2, "little")
+        + b"data" + data_size.to_bytes(4, "little")
+    )
+
+def pcm_buffer(data: np.ndarray, header: bytes = b"") -> memoryview:
+    """
+    在一块预分配的内存里写入头部与 16 位采样，波形只转换/复制一次。
+    浮点波形按 32768 缩放、向下取整后裁剪，与 libsndfile 写 PCM_16 的结果一致。
+    """
+    samples = data.reshape(-1)
+    buffer = bytearray(len(header) + samples.size * 2)
+    buffer[:len(header)] = header
+    view = np.frombuffer(buffer, dtype="<i2", offset=len(header))
+    if np.issubdtype(samples.dtype, np.floating):
+        np.copyto(view, np.clip(np.floor(samples * 32768.0), -32768, 32767), casting="unsafe")
+    else:
+        np.copyto(view, samples, casting="unsafe")
+    return memoryview(buffer)
+
+def pack_raw(io_buffer:BytesIO, data:np.ndarray, rate:int):
+    return pcm_buffer(data)
+
+
 def pack_wav(io_buffer:BytesIO, data:np.ndarray, rate:int):
-    io_buffer = BytesIO()
-    sf.write(io_buffer, data, rate, format='wav')
+    return pcm_buffer(data, wav_header(rate, data.size * 2))
+
+def pack_mp3_sndfile(io_buffer:BytesIO, data:np.ndarray, rate:int):
+    """ 进程内 MP3 编码，需要 libsndfile >= 1.1 """
+    with sf.SoundFile(io_buffer, mode='w', samplerate=rate, channels=1, format='MP3', subtype='MPEG_LAYER_III') as audio_file:
+        audio_file.write(data)
     return io_buffer
 
 def pack_aac(io_buffer:BytesIO, data:np.ndarray, rate:int):
-    process = subprocess.Popen([
+    out = ffmpeg_pool.encode([
         'ffmpeg',
         '-f', 's16le',  # 输入16位有符号小端整数PCM
         '-ar', str(rate),  # 设置采样率
@@ -112,14 +1568,29 @@ def pack_aac(io_buffer:BytesIO, data:np.ndarray, rate:int):
         '-vn',  # 不包含视频
         '-f', 'adts',  # 输出AAC数据流格式
         'pipe:1'  # 将输出写入管道
-    ], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    out, _ = process.communicate(input=data.tobytes())
+    ], data.tobytes())
+    io_buffer.write(out)
+    return io_buffer
+
+def pack_opus_ffmpeg(io_buffer:BytesIO, data:np.ndarray, rate:int):
+    out = ffmpeg_pool.encode([
+        'ffmpeg',
+        '-f', 's16le',
+        '-ar', str(rate),
+        '-ac', '1',
+        '-i', 'pipe:0',
+        '-c:a', 'libopus',  # libopus 会自动重采样到 48kHz
+        '-b:a', '96k',
+        '-vn',
+        '-f', 'ogg',
+        'pipe:1'
+    ], data.tobytes())
     io_buffer.write(out)
     return io_buffer
 
 def pack_mp3(io_buffer:BytesIO, data:np.ndarray, rate:int):
     """
-    将 PCM 音频数据打包为 MP3 格式并写入 BytesIO 对象。
+    将 PCM 音频数据打包为 MP3 格式并写入 BytesIO 对象（ffmpeg 实现）。
 
     Args:
         io_buffer (BytesIO): 要写入 MP3 数据的 BytesIO 对象。
@@ -129,7 +1600,8 @@ def pack_mp3(io_buffer:BytesIO, data:np.ndarray, rate:int):
     Returns:
         BytesIO: 包含 MP3 数据的 BytesIO 对象。
     """
-    process = subprocess.Popen([
+    # 将 NumPy 数组转换为字节流作为 ffmpeg 的输入
+    out = ffmpeg_pool.encode([
         'ffmpeg',
         '-f', 's16le',  # 输入16位有符号小端整数PCM
         '-ar', str(rate),  # 设置采样率
@@ -140,42 +1612,69 @@ def pack_mp3(io_buffer:BytesIO, data:np.ndarray, rate:int):
         '-vn',  # 不包含视频
         '-f', 'mp3',  # 输出格式更改为 MP3
         'pipe:1'  # 将输出写入管道
-    ], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-    # 将 NumPy 数组转换为字节流作为 ffmpeg 的输入
-    out, _ = process.communicate(input=data.tobytes())
+    ], data.tobytes())
 
     io_buffer.write(out)
     return io_buffer
 
-def pack_audio(io_buffer:BytesIO, data:np.ndarray, rate:int, media_type:str):
-    if media_type == "ogg":
-        io_buffer = pack_ogg(io_buffer, data, rate)
-    elif media_type == "aac":
-        io_buffer = pack_aac(io_buffer, data, rate)
-    elif media_type == "wav":
-        io_buffer = pack_wav(io_buffer, data, rate)
-    elif media_type == "mp3":
-        io_buffer = pack_mp3(io_buffer, data, rate)
+# media_type -> [(编码器名称, 编码函数, 可用性检查)]，按顺序选第一个可用的
+AUDIO_ENCODERS = {
+    "ogg": [("sndfile", pack_ogg, lambda rate: True)],
+    # Opus 只接受 8/12/16/24/48 kHz，其余采样率（如 32kHz）交给 ffmpeg 重采样
+    "opus": [("sndfile", pack_opus, lambda rate: rate in (8000, 12000, 16000, 24000, 48000) and sndfile_supports("OGG", "OPUS")), ("ffmpeg", pack_opus_ffmpeg, lambda rate: True)],
+    "wav": [("pcm", pack_wav, lambda rate: True)],
+    "mp3": [("sndfile", pack_mp3_sndfile, lambda rate: sndfile_supports("MP3")), ("ffmpeg", pack_mp3, lambda rate: True)],
+    "aac": [("ffmpeg", pack_aac, lambda rate: True)],
+    "raw": [("raw", pack_raw, lambda rate: True)],
+}
+encode_stats = {}  # media_type -> {"encoder", "count", "total_ms", "max_ms"}
+encode_stats_lock = threading.Lock()
+
+def register_encoder(media_type: str, name: str, encoder, available=lambda rate: True, first: bool = True) -> None:
+    """ 注册自定义编码器，first 为 True 时优先于已有编码器；编码函数可返回写好的 BytesIO 或任意字节缓冲区 """
+    encoders = AUDIO_ENCODERS.setdefault(media_type, [])
+    if first:
+        encoders.insert(0, (name, encoder, available))
     else:
-        io_buffer = pack_raw(io_buffer, data, rate)
-    io_buffer.seek(0)
-    return io_buffer
+        encoders.append((name, encoder, available))
+
+def select_encoder(media_type: str, rate: int):
+    for name, encoder, available in AUDIO_ENCODERS.get(media_type, AUDIO_ENCODERS["raw"]):
+        if available(rate):
+            return name, encoder
+    return "raw", pack_raw
 
-def tts_infer(text, text_lang, ref_audio_path, prompt_text, prompt_lang, top_k, top_p, temperature, text_split_method, batch_size, batch_threshold, split_bucket, speed_facter, fragment_interval, seed, media_type, parallel_infer, repetition_penalty, sample_steps, if_sr):
-    t_lang = ["all_zh","en","all_ja","all_yue","all_ko","zh","ja","yue","ko","auto","auto_yue"][["中文","英语","日语","粤语","韩语","中英混合","日英混合","粤英混合","韩英混合","多语种混合","多语种混合(粤语)"].index(text_lang)]
-    p_lang = ["all_zh","en","all_ja","all_yue","all_ko","zh","ja","yue","ko","auto","auto_yue"][["中文","英语","日语","粤语","韩语","中英混合","日英混合","粤英混合","韩英混合","多语种混合","多语种混合(粤语)"].index(prompt_lang)]
-    cut_method = ["cut0","cut1","cut2","cut3","cut4","cut5"][["不切","凑四句一切","凑50字一切","按中文句号。切","按英文句号.切","按标点符号切"].index(text_split_method)]
+def record_encode(media_type: str, encoder_name: str, elapsed_ms: float) -> None:
+    with encode_stats_lock:
+        stats = encode_stats.setdefault(media_type, {"encoder": encoder_name, "count": 0, "total_ms": 0.0, "max_ms": 0.0})
+        stats["encoder"] = encoder_name
+        stats["count"] += 1
+        stats["total_ms"] += elapsed_ms
+        stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+
+def pack_audio(io_buffer:BytesIO, data:np.ndarray, rate:int, media_type:str) -> memoryview:
+    """ 编码并返回结果缓冲区的 memoryview，不再 getvalue() 复制一份 """
+    encoder_name, encoder = select_encoder(media_type, rate)
+    start = perf_counter()
+    with measure_peak("pack_audio"):
+        packed = encoder(io_buffer, data, rate)
+        packed = packed.getbuffer() if isinstance(packed, BytesIO) else memoryview(packed)
+    record_encode(media_type, encoder_name, (perf_counter() - start) * 1000)
+    return packed
+
+#===============推理函数================
+def build_infer_dict(text, text_lang, ref_audio_path, prompt_text, prompt_lang, top_k, top_p, temperature, text_split_method, batch_size, batch_threshold, split_bucket, speed_facter, fragment_interval, seed, parallel_infer, repetition_penalty, sample_steps, if_sr):
+    """ 将接口参数转换为 TTS.run 所需的推理字典 """
     infer_dict = {
         "text": text,
-        "text_lang": t_lang,
+        "text_lang": LANG_CODES[text_lang],
         "ref_audio_path": ref_audio_path,
         "prompt_text": prompt_text,
-        "prompt_lang": p_lang,
+        "prompt_lang": LANG_CODES[prompt_lang],
         "top_k": top_k,
         "top_p": top_p,
         "temperature": temperature,
-        "text_split_method": cut_method,
+        "text_split_method": CUT_METHODS[text_split_method],
         "batch_size": batch_size,
         "batch_threshold": batch_threshold,
         "split_bucket": split_bucket,
@@ -187,20 +1686,384 @@ def tts_infer(text, text_lang, ref_audio_path, prompt_text, prompt_lang, top_k,
         "sample_steps": sample_steps,
         "if_sr": if_sr
     }
-    with torch.no_grad():
-        tts_gen = tts_pipeline.run(infer_dict)
-        sr, audio = next(tts_gen)
-        torch.cuda.empty_cache()
-        gc.collect()
-    audio = pack_audio(BytesIO(), audio, sr, media_type).getvalue()
-    
+    return infer_dict
+
+def tts_infer(text, text_lang, ref_audio_path, prompt_text, prompt_lang, top_k, top_p, temperature, text_split_method, batch_size, batch_threshold, split_bucket, speed_facter, fragment_interval, seed, media_type, parallel_infer, repetition_penalty, sample_steps, if_sr, weights=("", ""), use_cache=False):
+    """
+    合成一段语音并按 media_type 打包，返回编码结果（bytes 或 memoryview，均可直接写文件 / 作为响应体）。
+    weights 为 (GPT 模型路径, SoVITS 模型路径)，未命中缓存时才加载；
+    use_cache 仅应在种子固定时开启，否则相同参数的结果本就不同。
+    """
+    timer = StageTimer()
+    if torch.cuda.is_available():
+        torch.cuda.reset_peak_memory_stats()
+    try:
+        with timer.bind():
+            return run_tts_infer(text, text_lang, ref_audio_path, prompt_text, prompt_lang, top_k, top_p, temperature, text_split_method, batch_size, batch_threshold, split_bucket, speed_facter, fragment_interval, seed, media_type, parallel_infer, repetition_penalty, sample_steps, if_sr, weights, use_cache)
+    finally:
+        if torch.cuda.is_available():
+            timer.peak("cuda", torch.cuda.max_memory_allocated())
+        metrics.observe_stages(timer, pipeline_version(), media_type)
+
+def run_tts_infer(text, text_lang, ref_audio_path, prompt_text, prompt_lang, top_k, top_p, temperature, text_split_method, batch_size, batch_threshold, split_bucket, speed_facter, fragment_interval, seed, media_type, parallel_infer, repetition_penalty, sample_steps, if_sr, weights, use_cache):
+    with stage("build_infer_dict"):
+        infer_dict = build_infer_dict(text, text_lang, ref_audio_path, prompt_text, prompt_lang, top_k, top_p, temperature, text_split_method, batch_size, batch_threshold, split_bucket, speed_facter, fragment_interval, seed, parallel_infer, repetition_penalty, sample_steps, if_sr)
+    cache_key = ""
+    if use_cache and synth_cache is not None:
+        with stage("cache_lookup"):
+            cache_key = synth_cache.make_key(infer_dict, media_type, weights)
+            cached_audio = synth_cache.get(cache_key)
+        if cached_audio is not None:
+            logger.info(f"命中合成缓存: {cache_key}")
+            return cached_audio
+    load_weights(*weights)
+    with stage("ref_features"):
+        ref_key = ref_feature_cache.make_key(ref_audio_path, infer_dict["prompt_text"], infer_dict["prompt_lang"])
+        ref_hit = ref_feature_cache.restore(ref_key, ref_audio_path)
+    # synthesize 包含 TTS.run 内部的 ref_audio / text_preprocess / t2s / vocoder 阶段
+    with torch.no_grad(), memory_manager.track():
+        with stage("synthesize"):
+            if segment_cache is not None and use_cache:
+                sr, audio = segment_cache.synthesize(infer_dict, weights)
+            else:
+                tts_gen = tts_pipeline.run(infer_dict)
+                sr, audio = next(tts_gen)
+        with stage("cleanup"):
+            memory_manager.after_infer()
+    if not ref_hit:
+        ref_feature_cache.capture(ref_key)
+    with stage("pack_audio"):
+        audio = pack_audio(BytesIO(), audio, sr, media_type)
+    if cache_key:
+        with stage("cache_store"):
+            synth_cache.put(cache_key, audio, media_type)
+
     return audio
 
+#===============流式推理================
+def wav_stream_header(rate: int, channels: int = 1, sample_width: int = 2) -> bytes:
+    """ 流式 WAV 头，数据长度未知，按惯例填 0xFFFFFFFF """
+    return wav_header(rate, None, channels, sample_width)
+
+class DrainBuffer:
+    """ soundfile 的写入目标：只保留尚未发送的字节，位置按整个流的偏移计算 """
+
+    def __init__(self):
+        self.pending = BytesIO()
+        self.offset = 0    # 已经取走的字节数
+        self.position = 0
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, pos: int, whence: int = 0) -> int:
+        end = self.offset + len(self.pending.getbuffer())
+        base = {0: 0, 1: self.position, 2: end}[whence]
+        self.position = max(base + pos, 0)
+        return self.position
+
+    def write(self, data) -> int:
+        # 回写已经发出的部分（例如 mp3 收尾时改写文件头）只能丢弃
+        skip = max(self.offset - self.position, 0)
+        if skip < len(data):
+            self.pending.seek(self.position + skip - self.offset)
+            self.pending.write(data[skip:])
+        self.position += len(data)
+        return len(data)
+
+    def read(self, size: int = -1) -> bytes:
+        if self.position < self.offset:
+            return b""
+        self.pending.seek(self.position - self.offset)
+        data = self.pending.read(size)
+        self.position += len(data)
+        return data
+
+    def take(self) -> bytes:
+        data = self.pending.getvalue()
+        self.offset += len(data)
+        self.pending.seek(0)
+        self.pending.truncate(0)
+        return data
+
+MP3_BITRATES = {  # (MPEG-1, MPEG-2/2.5) Layer III 码率表，单位 kbps
+    True: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    False: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+# 流式 mp3 使用固定码率：去掉 Xing/Info 帧后，播放器按首帧码率和数据长度估算时长，只有固定码率时才准确
+MP3_STREAM_COMPRESSION_LEVEL = 0.8  # libsndfile 的压缩等级，32kHz 单声道约 96kbps
+
+def mp3_info_frame_length(data: bytes):
+    """
+    开头的 Xing/Info 帧长度：不是该帧时返回 0，数据还不够判断时返回 None。
+    libsndfile 打开文件时先写一个全零的占位帧，关闭时才回写总帧数；流式输出时占位帧已经发出，
+    只能整帧去掉，否则播放器会按占位帧提前结束。
+    """
+    if len(data) < 4:
+        return None
+    if data[0] != 0xFF or data[1] & 0xE6 != 0xE2:  # 帧同步 + Layer III
+        return 0
+    version = (data[1] >> 3) & 3
+    bitrate_index, rate_index = data[2] >> 4, (data[2] >> 2) & 3
+    if version == 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return 0
+    bitrate = MP3_BITRATES[version == 3][bitrate_index] * 1000
+    sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+    length = (144 if version == 3 else 72) * bitrate // sample_rate + ((data[2] >> 1) & 1)
+    if len(data) < length:
+        return None
+    # 标签紧跟在 side info 之后，位置取决于版本与声道数，在帧的前 40 字节内查找即可
+    tag = data[4:40]
+    return length if not any(tag) or b"Xing" in tag or b"Info" in tag else 0
+
+class StreamEncoder:
+    """ 增量编码器：逐段写入 PCM，每次返回已经可以发送的字节 """
+
+    def __init__(self, media_type: str, rate: int):
+        self.media_type = media_type
+        self.rate = rate
+        self.sound_file = None
+        self.head = b"" if media_type == "mp3" else None  # mp3 开头尚未确认是否为 Xing/Info 帧的字节
+        if media_type in ("ogg", "mp3"):
+            self.buffer = DrainBuffer()
+            if media_type == "ogg":
+                self.sound_file = sf.SoundFile(self.buffer, mode="w", samplerate=rate, channels=1, format="OGG", subtype="VORBIS")
+            else:
+                self.sound_file = sf.SoundFile(self.buffer, mode="w", samplerate=rate, channels=1, format="MP3", subtype="MPEG_LAYER_III",
+                                               bitrate_mode="CONSTANT", compression_level=MP3_STREAM_COMPRESSION_LEVEL)
+
+    def header(self) -> bytes:
+        if self.media_type == "wav":
+            return wav_stream_header(self.rate)
+        return b""
+
+    def drain(self, final: bool = False) -> bytes:
+        # 取走后清空缓冲，长时间的流不会在内存中累积整段音频
+        data = self.buffer.take()
+        if self.head is None:
+            return data
+        self.head += data
+        length = mp3_info_frame_length(self.head)
+        if length is None and not final:
+            return b""
+        data, self.head = self.head[length or 0:], None
+        return data
+
+    def write(self, data: np.ndarray) -> bytes:
+        if self.sound_file is None:
+            return data.tobytes()
+        self.sound_file.write(data)
+        return self.drain()
+
+    def close(self) -> bytes:
+        if self.sound_file is None:
+            return b""
+        self.sound_file.close()
+        return self.drain(final=True)
+
+def stream_media_types() -> list[str]:
+    """ 支持流式输出的格式，mp3 需要 libsndfile >= 1.1 与 soundfile >= 0.12（固定码率） """
+    media_types = ["raw", "wav", "ogg"]
+    if sndfile_supports("MP3") and tuple(int(part) for part in sf.__version__.split(".")[:2]) >= (0, 12):
+        media_types.append("mp3")
+    return media_types
+
+def tts_infer_stream(text, text_lang, ref_audio_path, prompt_text, prompt_lang, top_k, top_p, temperature, text_split_method, batch_size, batch_threshold, split_bucket, speed_facter, fragment_interval, seed, media_type, parallel_infer, repetition_penalty, sample_steps, if_sr, weights=("", "")):
+    """ 流式合成：按 text_split_method 切分出的片段逐段产出已编码的音频字节 """
+    # 生成器在 yield 之间会交出线程，计时器只在每一步内绑定
+    timer = StageTimer()
+    start = perf_counter()
+    with timer.bind():
+        with stage("build_infer_dict"):
+            infer_dict = build_infer_dict(text, text_lang, ref_audio_path, prompt_text, prompt_lang, top_k, top_p, temperature, text_split_method, batch_size, batch_threshold, split_bucket, speed_facter, fragment_interval, seed, parallel_infer, repetition_penalty, sample_steps, if_sr)
+        infer_dict["return_fragment"] = True
+        load_weights(*weights)
+        with stage("ref_features"):
+            ref_key = ref_feature_cache.make_key(ref_audio_path, infer_dict["prompt_text"], infer_dict["prompt_lang"])
+            ref_hit = ref_feature_cache.restore(ref_key, ref_audio_path)
+    tts_gen = tts_pipeline.run(infer_dict)
+    encoder = None
+    memory_manager.enter()
+    try:
+        while True:
+            # 生成器可能在不同线程中被推进，no_grad 只包住单步
+            with timer.bind(), torch.no_grad(), stage("synthesize"):
+                fragment = next(tts_gen, None)
+            if fragment is None:
+                break
+            if not ref_hit:
+                # 产出第一段时参考音频已处理完毕
+                ref_feature_cache.capture(ref_key)
+                ref_hit = True
+            sr, audio = fragment
+            with timer.bind(), stage("pack_audio"):
+                if encoder is None:
+                    encoder = StreamEncoder(media_type, sr)
+                    header = encoder.header()
+                    timer.add("first_chunk", perf_counter() - start)
+                else:
+                    header = b""
+                chunk = header + encoder.write(audio)
+            if chunk:
+                yield chunk
+        if encoder is not None:
+            yield encoder.close()
+    finally:
+        tts_gen.close()
+        with timer.bind(), stage("cleanup"):
+            memory_manager.after_infer()
+        memory_manager.leave()
+        metrics.observe_stages(timer, pipeline_version(), media_type)
+
 #===============音频处理================
 def audio_md5(audio):
     audio_md5 = md5(audio).hexdigest()
     return audio_md5
 
+#===============模型索引================
+MODEL_INDEX_RECHECK_SECONDS = 30  # 距上次全量校验超过该秒数时重新比对目录 mtime
+
+def dir_mtime(dir_path: str) -> int:
+    try:
+        return os.stat(dir_path).st_mtime_ns
+    except OSError:
+        return 0
+
+class ModelIndex:
+    """
+    模型索引：版本 → 说话人 → 语言 → 情感 → (参考音频, 参考文本)，以及 GPT / SoVITS 权重路径。
+    启动时在 pre_infer 中为所有版本建好索引，之后由后台线程每 MODEL_INDEX_RECHECK_SECONDS 秒比对一次全部子目录 mtime，有变化时重建；
+    请求路径上只 stat 顶层目录，发现变化时唤醒后台线程，不在请求内遍历目录，也不在持锁时扫描。
+    install_model / delete_model 会直接重建对应版本。
+    """
+
+    def __init__(self):
+        self.versions = {}
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+
+    @staticmethod
+    def top_dirs(version: str) -> list[str]:
+        return [f"models/{version}", f"GPT_weights_{version}", f"SoVITS_weights_{version}"]
+
+    def deep_signature(self, version: str) -> dict:
+        signature = {top: dir_mtime(top) for top in self.top_dirs(version)}
+        for root, dirs, _ in os.walk(f"models/{version}"):
+            for dir_name in dirs:
+                dir_path = os.path.join(root, dir_name)
+                signature[dir_path] = dir_mtime(dir_path)
+        return signature
+
+    def scan(self, version: str) -> dict:
+        speakers = {}
+        speaker_dirs = [Path(p) for p in glob(f"models/{version}/*") if Path(p).is_dir()]
+        for speaker_dir in speaker_dirs:
+            gpt_models = glob(f"{speaker_dir}/*.ckpt")
+            sovits_models = glob(f"{speaker_dir}/*.pth")
+            langs = {}
+            for lang_dir in glob(f"{speaker_dir}/reference_audios/*"):
+                lang = Path(lang_dir).name
+                emotions = {}
+                for audio in glob(f"{lang_dir}/emotions/*.wav"):
+                    audio_name = Path(audio).name.replace(".wav", "")
+                    try:
+                        emotion, emo_text = get_tag_text(audio_name)
+                    except IndexError:
+                        logger.warning(f"参考音频命名不符合【情感】文本.wav 格式，已忽略: {audio}")
+                        continue
+                    emotions[emotion] = (audio, emo_text)
+                randoms = None
+                if Path(f"{lang_dir}/randoms").exists():
+                    randoms = glob(f"{lang_dir}/randoms/*.wav")
+                langs[lang] = {"emotions": emotions, "randoms": randoms}
+            speakers[speaker_dir.name] = {
+                "gpt": gpt_models[0] if len(gpt_models) > 0 else "",
+                "sovits": sovits_models[0] if len(sovits_models) > 0 else "",
+                "langs": langs,
+            }
+
+        # 原版兼容模式使用的模型名 → 路径索引
+        classic_gpt = {}
+        classic_sovits = {}
+        for inst_gpt in glob(f"models/{version}/**/*.ckpt", recursive=True):
+            classic_gpt[f"【GSVI】{Path(inst_gpt).name.replace('.ckpt', '')}"] = inst_gpt
+        for inst_sovits in glob(f"models/{version}/**/*.pth", recursive=True):
+            classic_sovits[f"【GSVI】{Path(inst_sovits).name.replace('.pth', '')}"] = inst_sovits
+        for classic_gpt_model in glob(f"GPT_weights_{version}/*.ckpt"):
+            classic_gpt[f"【经典】{Path(classic_gpt_model).name.replace('.ckpt', '')}"] = classic_gpt_model
+        for classic_sovits_model in glob(f"SoVITS_weights_{version}/*.pth"):
+            classic_sovits[f"【经典】{Path(classic_sovits_model).name.replace('.pth', '')}"] = classic_sovits_model
+        return {"speakers": speakers, "classic_gpt": classic_gpt, "classic_sovits": classic_sovits}
+
+    def refresh(self, version: str) -> dict:
+        """ 在锁外扫描目录，扫描完成后替换索引 """
+        signature = self.deep_signature(version)
+        entry = {
+            "data": self.scan(version),
+            "signature": signature,
+            "shallow": [signature[top] for top in self.top_dirs(version)],
+            "checked": time(),
+        }
+        with self.lock:
+            self.versions[version] = entry
+        return entry["data"]
+
+    def start(self, versions: list[str]) -> None:
+        """ 预先建好各版本的索引并启动后台校验线程 """
+        for version in versions:
+            self.refresh(version)
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self.refresh_loop, name="gsvi-model-index", daemon=True)
+            self.thread.start()
+
+    def refresh_loop(self) -> None:
+        while True:
+            self.wake.wait(MODEL_INDEX_RECHECK_SECONDS)
+            self.wake.clear()
+            with self.lock:
+                entries = list(self.versions.items())
+            for version, entry in entries:
+                try:
+                    if self.deep_signature(version) != entry["signature"]:
+                        logger.info(f"检测到 models/{version} 有变化，重建模型索引")
+                        self.refresh(version)
+                    else:
+                        entry["checked"] = time()
+                except Exception as e:
+                    logger.error(f"重建 models/{version} 的模型索引失败: {e}")
+
+    def get(self, version: str) -> dict:
+        with self.lock:
+            entry = self.versions.get(version)
+        if entry is None:
+            # 未预建的版本（例如不在支持列表中）只在首次访问时同步扫描一次
+            return self.refresh(version)
+        shallow = [dir_mtime(top) for top in self.top_dirs(version)]
+        if shallow != entry["shallow"] or time() - entry["checked"] >= MODEL_INDEX_RECHECK_SECONDS:
+            self.wake.set()
+        return entry["data"]
+
+    def speakers(self, version: str) -> dict:
+        return self.get(version)["speakers"]
+
+    def lang_entry(self, modelname: str, lang: str, version: str) -> dict:
+        speaker = self.speakers(version).get(modelname, {})
+        return speaker.get("langs", {}).get(lang, {"emotions": {}, "randoms": None})
+
+    def invalidate(self, version: str = None) -> None:
+        """ 立即重建指定版本（不传时为全部已索引的版本）的索引 """
+        with self.lock:
+            versions = list(self.versions) if version is None else [version]
+        for name in versions:
+            self.refresh(name)
+
+model_index = ModelIndex()
+
 #===============通用函数================
 
 # 随机种子码
@@ -225,41 +2088,30 @@ def get_tag_text(file_name):
 
 # 获取说话人支持的参考音频语言
 def get_ref_audio_langs(modelname, version):
-    langs = []
-    lang_dir = glob(f"models/{version}/{modelname}/reference_audios/*")
-    for lang in lang_dir:
-        lang_name = Path(lang).name
-        langs.append(lang_name)
-    return langs
+    speaker = model_index.speakers(version).get(modelname, {})
+    return list(speaker.get("langs", {}).keys())
 
 # 根据语言获取参考情感列表
 def get_ref_audios(modelname, lang, version):
-    audios = glob(f"models/{version}/{modelname}/reference_audios/{lang}/emotions/*.wav")
-    audio_list = []
-    for audio in audios:
-        audio_name = Path(audio).name
-        emotion, emo_text = get_tag_text(audio_name)
-        audio_list.append(emotion)
-    if Path(f"models/{version}/{modelname}/reference_audios/{lang}/randoms").exists():
+    lang_entry = model_index.lang_entry(modelname, lang, version)
+    audio_list = list(lang_entry["emotions"].keys())
+    if lang_entry["randoms"] is not None:
         audio_list.append("随机")
     return audio_list
 
 # 获取指定情感的完整参考音频文件名
 def get_ref_audio(modelname: str, lang: str, emotion: str, version: str) -> tuple[str, str]:
-    emo = ""
-    emo_text = ""
-    audios = glob(f"models/{version}/{modelname}/reference_audios/{lang}/emotions/*.wav")
-    for audio in audios:
-        audio_name = str(Path(audio).name).replace(".wav", "")
-        if f"【{emotion}】" in audio_name:
-            emo, emo_text = get_tag_text(audio_name)
-    return emo, emo_text
+    emotions = model_index.lang_entry(modelname, lang, version)["emotions"]
+    if emotion not in emotions:
+        return "", ""
+    _, emo_text = emotions[emotion]
+    return emotion, emo_text
 
 # 随机选择参考音频
 def random_ref_audio(modelname, lang, version):
-    if Path(f"models/{version}/{modelname}/reference_audios/{lang}/randoms").exists():
-        audios = glob(f"models/{version}/{modelname}/reference_audios/{lang}/randoms/*.wav")
-        audio = choice(audios)
+    randoms = model_index.lang_entry(modelname, lang, version)["randoms"]
+    if randoms:
+        audio = choice(randoms)
         lab_content = Path(audio).name.replace(".wav", "")
     else:
         audio = ""
@@ -268,30 +2120,93 @@ def random_ref_audio(modelname, lang, version):
     
 #获取模型路径
 def get_model_path(model_name, version):
-    gpt_models = glob(f"models/{version}/{model_name}/*.ckpt")
-    sovits_models = glob(f"models/{version}/{model_name}/*.pth")
-    gpt_model = gpt_models[0] if len(gpt_models) > 0 else ""
-    sovits_model = sovits_models[0] if len(sovits_models) > 0 else ""
-    return gpt_model, sovits_model
+    speaker = model_index.speakers(version).get(model_name, {})
+    return speaker.get("gpt", ""), speaker.get("sovits", "")
 
 #加载模型
 def load_model(model_name, version):
     gpt_model, sovits_model = get_model_path(model_name, version)
     load_weights(gpt_model, sovits_model)
 
-#移动模型
-def move_model_files(version, categroy, lang, model):
-    model_files = glob(f"cache/{categroy}-{lang}-{model}/**/*", recursive=True)
-    Path(f"models/{version}/{categroy}-{lang}-{model}/reference_audios/{lang}/emotions").mkdir(parents=True, exist_ok=True)
-    for file in model_files:
-        if file.endswith(".wav"):
-            move(file, f"models/{version}/{categroy}-{lang}-{model}/reference_audios/{lang}/emotions")
-            logger.info(f"Moved {file} to models/{version}/{categroy}-{lang}-{model}/reference_audios/{lang}/emotions")
-        elif file.endswith(".log") or file.endswith(".ckpt") or file.endswith(".pth"):
-            move(file, f"models/{version}/{categroy}-{lang}-{model}")
-            logger.info(f"Moved {file} to models/{version}/{categroy}-{lang}-{model}")
-
 #===============接口函数================
+def get_cache_stats() -> dict:
+    """ 获取合成缓存统计 """
+    if synth_cache is None:
+        return {}
+    return synth_cache.stats()
+
+def get_ref_feature_stats() -> dict:
+    """ 获取参考音频特征缓存统计 """
+    if ref_feature_cache is None:
+        return {}
+    return ref_feature_cache.stats()
+
+def get_segment_stats() -> dict:
+    """ 获取分句缓存统计，未启用时为空 """
+    if segment_cache is None:
+        return {}
+    return segment_cache.stats()
+
+def get_frontend_stats() -> dict:
+    """ 获取文本前端缓存统计 """
+    if frontend_cache is None:
+        return {}
+    return frontend_cache.stats()
+
+def get_output_stats() -> dict:
+    """ 获取输出文件统计 """
+    if output_store is None:
+        return {}
+    return output_store.stats()
+
+def serve_output(result_path: str) -> str:
+    """ 解析下载路径并记录访问时间，不存在时返回空字符串 """
+    return output_store.serve(result_path)
+
+def get_memory_stats() -> dict:
+    """ 获取内存管理统计 """
+    return memory_manager.stats()
+
+def get_pool_stats() -> dict:
+    """ 获取权重常驻池统计 """
+    if weight_pool is None:
+        return {}
+    return weight_pool.stats()
+
+def get_encoder_stats() -> dict:
+    """ 获取各格式的编码器与编码耗时统计 """
+    with encode_stats_lock:
+        return {
+            media_type: {**stats, "avg_ms": stats["total_ms"] / stats["count"] if stats["count"] else 0.0}
+            for media_type, stats in encode_stats.items()
+        }
+
+def record_request(endpoint: str, timer: StageTimer, version: str, media_type: str) -> None:
+    """ 记录接口层的排队与总耗时 """
+    labels = {"endpoint": endpoint, "version": metric_version(version), "format": metric_format(media_type)}
+    metrics.inc("gsvi_requests_total", "推理请求数", labels)
+    for name in ("queue_wait", "total"):
+        if name in timer.stages:
+            metrics.observe(f"gsvi_request_{name}_seconds", f"推理请求{'排队' if name == 'queue_wait' else '总'}耗时", labels, timer.stages[name])
+
+def record_coalesced(endpoint: str) -> None:
+    """ 记录合并到进行中的相同请求、未单独合成的请求 """
+    metrics.inc("gsvi_coalesced_requests_total", "合并到进行中相同请求的请求数", {"endpoint": endpoint})
+
+def get_metrics() -> str:
+    """ Prometheus 文本格式的性能统计，附带各缓存的当前计数 """
+    caches = {"synth_cache": get_cache_stats(), "ref_features": get_ref_feature_stats(), "segments": get_segment_stats(), "weight_pool": get_pool_stats(), "frontend": get_frontend_stats()}
+    lines = []
+    for field in ("hits", "misses", "evictions", "entries", "total_bytes", "hit_rate"):
+        values = [(name, stats[field]) for name, stats in caches.items() if field in stats]
+        if not values:
+            continue
+        # 命中、未命中与淘汰次数只增不减，其余为当前值
+        kind = "counter" if field in ("hits", "misses", "evictions") else "gauge"
+        lines.append(f"# TYPE gsvi_cache_{field} {kind}")
+        lines += [f'gsvi_cache_{field}{{cache="{name}"}} {value}' for name, value in values]
+    return metrics.render() + "\n".join(lines) + "\n"
+
 def get_version() -> list[str]:
     """ 获取所有支持版本 """
     versions = ["v2", "v3", "v4", "v2Pro", "v2ProPlus"]
@@ -312,11 +2227,10 @@ def get_multi_ref_template(version: str) -> tuple[list[str], str]:
     if not version_support(version):
         msg = "不支持该版本！"
     else:
-        speakers = glob(f"models/{version}/*")
+        speakers = model_index.speakers(version)
         if len(speakers) == 0:
             msg = "该模型不存在或未设置参考音频"
-        for speaker in speakers:
-            speaker_name = Path(speaker).name
+        for speaker_name in speakers:
             multi_template = f"{version}|{speaker_name}|合成语言|参考语言|情感|语速|#内容请自由发挥‖"
             template_list.append(multi_template)
             msg = "获取成功"
@@ -328,12 +2242,11 @@ def create_speaker_list(version):
     if not version_support(version):
         msg = "不支持该版本！"
     else:
-        speakers = glob(f"models/{version}/*")
+        speakers = model_index.speakers(version)
         if len(speakers) == 0:
             msg = "该模型不存在!"
         else:
-            for speaker in speakers:
-                spk_name = Path(speaker).name
+            for spk_name in speakers:
                 langs = get_ref_audio_langs(spk_name, version)
                 spk_list[spk_name] = {}
                 for lang in langs:
@@ -365,60 +2278,149 @@ def single_infer(modelname, prompt_lang, emotion, text, text_lang, top_k, top_p,
             msg = "请提供合成文本"
             audio_path = ""
         else:
-            load_model(modelname, version)
+            weights = get_model_path(modelname, version)
+            use_cache = seed != -1
             if seed == -1:
                 seed = random_seed()
-            audio = tts_infer(text, text_lang, ref_audio, prompt_text, prompt_lang, top_k, top_p, temperature, text_split_method, batch_size, batch_threshold, split_bucket, speed_facter, fragment_interval, seed, media_type, parallel_infer, repetition_penalty, sample_steps, if_sr)
-            audio_md5 = md5(audio).hexdigest()
-            audio_path = f"outputs/{audio_md5}.{media_type}"
-            Path(audio_path).write_bytes(audio)
+            audio = tts_infer(text, text_lang, ref_audio, prompt_text, prompt_lang, top_k, top_p, temperature, text_split_method, batch_size, batch_threshold, split_bucket, speed_facter, fragment_interval, seed, media_type, parallel_infer, repetition_penalty, sample_steps, if_sr, weights=weights, use_cache=use_cache)
+            with stage("save_output"):
+                audio_path = save_output(audio, media_type)
             msg = "合成成功"
     return audio_path, msg
 
+# 多人对话调度：按 (版本, 模型) 分组，每个说话人只切换一次权重；
+# 组内按参考音频排序，让相同参考音频的台词连续合成，复用 TTS 的 prompt_cache
+def schedule_multi_lines(lines: list[dict]) -> list[tuple[tuple[str, str], list[dict]]]:
+    groups = OrderedDict()
+    for line in lines:
+        groups.setdefault((line["version"], line["model_name"]), []).append(line)
+    for group in groups.values():
+        group.sort(key=lambda line: (line["ref_audio"], line["index"]))
+    return list(groups.items())
+
 # 根据说话人和情感合成语音（多人合成）
-def multi_infer(content, top_k, top_p, temperature, text_split_method, batch_size, batch_threshold, split_bucket, fragment_interval, media_type, parallel_infer, repetition_penalty, seed, sample_steps, if_sr):
+class ArchiveWriter:
+    """ 供 zipfile 写入的只追加输出：已写入的字节同时落盘并可被逐段取走，用于边合成边下载 """
+
+    def __init__(self, file_path: str):
+        self.file = open(file_path, "wb")
+        self.pending = []
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.file.write(data)
+        self.pending.append(data)
+        return len(data)
+
+    def flush(self) -> None:
+        self.file.flush()
+
+    def drain(self) -> bytes:
+        data = b"".join(self.pending)
+        self.pending.clear()
+        return data
+
+    def close(self) -> None:
+        self.file.close()
+
+def parse_multi_lines(content: str, log_list: list, now) -> list[dict]:
+    """ 解析多人对话剧本，每行格式为 版本|模型|合成语言|参考语言|情感|语速|文本 """
+    lines = []
+    for i, single_content in enumerate(filter(str.strip, content.split("‖"))):
+        try:
+            single_content_list = single_content.split("|")
+            model_version = single_content_list[0]
+            model_name = single_content_list[1]
+            text_lang = single_content_list[2]
+            prompt_lang = single_content_list[3]
+            emotion = single_content_list[4]
+            speed_facter = float(single_content_list[5])
+            text = single_content_list[6]
+            text = text.replace("#", "")
+            if emotion == "随机":
+                ref_audio, lab_content = random_ref_audio(model_name, prompt_lang, model_version)
+                prompt_text = lab_content
+            else:
+                emo, prompt_text = get_ref_audio(model_name, prompt_lang, emotion, model_version)
+                ref_audio = f"models/{model_version}/{model_name}/reference_audios/{prompt_lang}/emotions/【{emo}】{prompt_text}.wav"
+        except:
+            log_list.append(f"[{now()}] 第 {i+1} 段对话格式错误或参数有误，已跳过！")
+            continue
+        lines.append({
+            "index": i,
+            "version": model_version,
+            "model_name": model_name,
+            "text_lang": text_lang,
+            "prompt_lang": prompt_lang,
+            "emotion": emotion,
+            "speed_facter": speed_facter,
+            "text": text,
+            "ref_audio": ref_audio,
+            "prompt_text": prompt_text,
+        })
+    return lines
+
+def multi_infer_stream(content, top_k, top_p, temperature, text_split_method, batch_size, batch_threshold, split_bucket, fragment_interval, media_type, parallel_infer, repetition_penalty, seed, sample_steps, if_sr, raise_on_error: bool = False):
+    """
+    多人对话合成，边合成边产出 zip 压缩包的字节流（音频不再压缩，直接存储）。
+    返回 (字节生成器, 压缩包路径, 提示信息)；压缩包同时写入 outputs/，生成器跑完后即可通过路径下载。
+    中途出错时压缩包照常收尾并在 log.txt 中记录原因，raise_on_error 为 True 时随后抛出异常。
+    """
     log_list = []
+    now = lambda: datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+    content_md5 = f"{md5(content.encode()).hexdigest()}_{int(time())}"
+    content_md5 = md5(content_md5.encode()).hexdigest()
+    lines = parse_multi_lines(content, log_list, now)
+    archive_path = f"outputs/conv_{content_md5}.zip"
+
+    def archive_chunks():
+        nonlocal seed
+        use_cache = seed != -1
+        if seed == -1:
+            seed = random_seed()
+        writer = ArchiveWriter(f"{archive_path}.part")
+        archive = zipfile.ZipFile(writer, "w")
+        completed = False
+        try:
+            groups = schedule_multi_lines(lines)
+            log_list.append(f"[{now()}] 共 {len(lines)} 段有效对话，按说话人分为 {len(groups)} 组合成")
+            for (model_version, model_name), group in groups:
+                weights = get_model_path(model_name, model_version)
+                for line in group:
+                    i = line["index"]
+                    log_list.append(f"[{now()}] 正在合成第 {i+1} 段对话，模型：{model_name}，版本：{model_version}，情感：{line['emotion']}")
+                    audio = tts_infer(line["text"], line["text_lang"], line["ref_audio"], line["prompt_text"], line["prompt_lang"], top_k, top_p, temperature, text_split_method, batch_size, batch_threshold, split_bucket, line["speed_facter"], fragment_interval, seed, media_type, parallel_infer, repetition_penalty, sample_steps, if_sr, weights=weights, use_cache=use_cache)
+                    # 文件名以剧本中的序号开头，解压后仍按剧本顺序排列
+                    file_name = f"conv_{content_md5}/{i+1}_{model_name}_{model_version}"
+                    archive.writestr(f"{file_name}.{media_type}", audio, zipfile.ZIP_STORED)
+                    archive.writestr(f"{file_name}.txt", line["text"], zipfile.ZIP_DEFLATED)
+                    log_list.append(f"[{now()}] 第 {i+1} 段对话合成成功！")
+                    yield writer.drain()
+            completed = True
+        except Exception as e:
+            log_list.append(f"[{now()}] 合成中断：{e}")
+            logger.error(f"多人对话合成中断: {e}")
+        finally:
+            archive.writestr(f"conv_{content_md5}/log.txt", "\n".join(log_list), zipfile.ZIP_DEFLATED)
+            archive.close()
+            writer.close()
+            Path(f"{archive_path}.part").replace(archive_path)
+            output_store.add_path(archive_path)
+        yield writer.drain()
+        if not completed and raise_on_error:
+            raise RuntimeError("多人对话合成中断，详情见压缩包内 log.txt")
+
+    if len(lines) == 0:
+        return None, "", "没有有效的对话"
+    return archive_chunks(), archive_path, "合成成功"
+
+def multi_infer(content, top_k, top_p, temperature, text_split_method, batch_size, batch_threshold, split_bucket, fragment_interval, media_type, parallel_infer, repetition_penalty, seed, sample_steps, if_sr):
     try:
-        content_list = content.split("‖")
-        filtered_list = list(filter(str.strip, content_list))
-        content_md5 = f"{md5(content.encode()).hexdigest()}_{int(time())}"
-        content_md5 = md5(content_md5.encode()).hexdigest()
-        Path(f"outputs/conv_{content_md5}").mkdir(parents=True, exist_ok=True)
-        for i, single_content in enumerate(filtered_list):
-            try:
-                single_content_list = single_content.split("|")
-                model_version = single_content_list[0]
-                model_name = single_content_list[1]
-                text_lang = single_content_list[2]
-                prompt_lang = single_content_list[3]
-                emotion = single_content_list[4]
-                speed_facter = float(single_content_list[5])
-                text = single_content_list[6]
-                text = text.replace("#", "")
-                if emotion == "随机":
-                    ref_audio, lab_content = random_ref_audio(model_name, prompt_lang, model_version)
-                    prompt_text = lab_content
-                else:
-                    emo, prompt_text = get_ref_audio(model_name, prompt_lang, emotion, model_version)
-                    ref_audio = f"models/{model_version}/{model_name}/reference_audios/{prompt_lang}/emotions/【{emo}】{prompt_text}.wav"
-            except:
-                log_list.append(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]}] 第 {i+1} 段对话格式错误或参数有误，已跳过！")
-                continue
-            log_list.append(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]}] 正在合成第 {i+1} 段对话，模型：{model_name}，版本：{model_version}，情感：{emotion}")
-            load_model(model_name, model_version)
-            if seed == -1:
-                seed = random_seed()
-            audio = tts_infer(text, text_lang, ref_audio, prompt_text, prompt_lang, top_k, top_p, temperature, text_split_method, batch_size, batch_threshold, split_bucket, speed_facter, fragment_interval, seed, media_type, parallel_infer, repetition_penalty, sample_steps, if_sr)
-            Path(f"outputs/conv_{content_md5}/{i+1}_{model_name}_{model_version}.{media_type}").write_bytes(audio)
-            Path(f"outputs/conv_{content_md5}/{i+1}_{model_name}_{model_version}.txt").write_text(text, encoding="utf-8")
-            log_list.append(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]}] 第 {i+1} 段对话合成成功！")
-        Path(f"outputs/conv_{content_md5}/log.txt").write_text("\n".join(log_list), encoding="utf-8")
-        if os.name == "nt":
-            subprocess.run(f"./7-Zip/7za.exe a -t7z outputs/conv_{content_md5}.7z outputs/conv_{content_md5}",stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL)
-        else:
-            subprocess.run(f"7za a -t7z outputs/conv_{content_md5}.7z outputs/conv_{content_md5}", shell=True,stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL)
-        archive_path = f"outputs/conv_{content_md5}.7z"
-        msg = "合成成功"
+        archive_stream, archive_path, msg = multi_infer_stream(content, top_k, top_p, temperature, text_split_method, batch_size, batch_threshold, split_bucket, fragment_interval, media_type, parallel_infer, repetition_penalty, seed, sample_steps, if_sr, raise_on_error=True)
+        if archive_stream is None:
+            return "", msg
+        for _ in archive_stream:
+            pass
     except:
         msg = "合成失败，参数错误！"
         archive_path = ""
@@ -427,43 +2429,17 @@ def multi_infer(content, top_k, top_p, temperature, text_split_method, batch_siz
 #===============原版兼容================
 # 获取模型列表
 def get_classic_model_list(version):
-    gpt_model_list = []
-    sovits_model_list = []
     gpt_model_path_index = {}
     sovits_model_path_index = {}
     if not version_support(version):
         msg = "不支持该版本！"
     else:
-        installed_gpt = glob(f"models/{version}/**/*.ckpt", recursive=True)
-        installed_sovits = glob(f"models/{version}/**/*.pth", recursive=True)
-        classic_gpt = glob(f"GPT_weights_{version}/*.ckpt", recursive=True)
-        classic_sovits = glob(f"SoVITS_weights_{version}/*.pth", recursive=True)
-        
-        for inst_gpt in installed_gpt:
-            model_name = Path(inst_gpt).name.replace(".ckpt", "")
-            model_name = f"【GSVI】{model_name}"
-            gpt_model_list.append(model_name)
-            gpt_model_path_index[model_name] = inst_gpt
-            
-        for inst_sovits in installed_sovits:
-            model_name = Path(inst_sovits).name.replace(".pth", "")
-            model_name = f"【GSVI】{model_name}"
-            sovits_model_list.append(model_name)
-            sovits_model_path_index[model_name] = inst_sovits
-            
-        for classic_gpt_model in classic_gpt:
-            model_name = Path(classic_gpt_model).name.replace(".ckpt", "")
-            model_name = f"【经典】{model_name}"
-            gpt_model_list.append(model_name)
-            gpt_model_path_index[model_name] = classic_gpt_model
-            
-        for classic_sovits_model in classic_sovits:
-            model_name = Path(classic_sovits_model).name.replace(".pth", "")
-            model_name = f"【经典】{model_name}"
-            sovits_model_list.append(model_name)
-            sovits_model_path_index[model_name] = classic_sovits_model
+        version_index = model_index.get(version)
+        gpt_model_path_index = dict(version_index["classic_gpt"])
+        sovits_model_path_index = dict(version_index["classic_sovits"])
         msg = "获取模型列表成功"
-            
+    gpt_model_list = list(gpt_model_path_index.keys())
+    sovits_model_list = list(sovits_model_path_index.keys())
     return gpt_model_list, sovits_model_list, msg, gpt_model_path_index, sovits_model_path_index
 
 # 推理函数
@@ -472,10 +2448,9 @@ def classic_infer(gpt_model_name, sovits_model_name, ref_audio_path, prompt_text
     if not version_support(version):
         msg = "不支持该版本！或没选择版本！"
     else:
-        _, _, msg, gpt_model_path_index, sovits_model_path_index = get_classic_model_list(version)
-        
-        gpt_model = gpt_model_path_index.get(gpt_model_name, "")
-        sovits_model = sovits_model_path_index.get(sovits_model_name, "")
+        version_index = model_index.get(version)
+        gpt_model = version_index["classic_gpt"].get(gpt_model_name, "")
+        sovits_model = version_index["classic_sovits"].get(sovits_model_name, "")
         
         if gpt_model_name == "":
             msg = "无 GPT 模型"
@@ -492,71 +2467,74 @@ def classic_infer(gpt_model_name, sovits_model_name, ref_audio_path, prompt_text
         elif not Path(gpt_model).exists() or not Path(sovits_model).exists():
             msg = "模型不存在"
         else:
-            load_weights(gpt_model, sovits_model)
-            audio = tts_infer(text, text_lang, ref_audio_path, prompt_text, prompt_lang, top_k, top_p, temperature, text_split_method, batch_size, batch_threshold, split_bucket, speed_facter, fragment_interval, seed, media_type, parallel_infer, repetition_penalty, sample_steps, if_sr)
-            audio_md5 = md5(audio).hexdigest()
-            audio_path = f"outputs/{audio_md5}.{media_type}"
-            Path(audio_path).write_bytes(audio)
+            audio = tts_infer(text, text_lang, ref_audio_path, prompt_text, prompt_lang, top_k, top_p, temperature, text_split_method, batch_size, batch_threshold, split_bucket, speed_facter, fragment_interval, seed, media_type, parallel_infer, repetition_penalty, sample_steps, if_sr, weights=(gpt_model, sovits_model), use_cache=seed != -1)
+            with stage("save_output"):
+                audio_path = save_output(audio, media_type)
             msg = "合成成功"
     return audio_path, msg
 
 #=========OpenAI语音合成兼容接口=========
-def openai_like_infer(model, input, voice, response_format, speed, other_options: otherParams):
+def prepare_openai_like_infer(model, input, voice, response_format, speed, other_options: otherParams):
+    """ 校验 OpenAI 风格请求并解析出 tts_infer 的参数，校验失败时参数为 None """
     version = model.split("-")[1]
     if not version_support(version):
-        msg = "不支持该版本！"
-        audio_data = None
+        return None, "不支持该版本！"
     elif model == "":
-        msg = "请选择模型"
-        audio_data = None
+        return None, "请选择模型"
     elif input == "":
-        msg = "请提供合成文本"
-        audio_data = None
+        return None, "请提供合成文本"
     elif voice == "":
-        msg = "请选择说话人"
-        audio_data = None
+        return None, "请选择说话人"
+    if other_options.emotion == "随机":
+        ref_audio, lab_content = random_ref_audio(voice, other_options.prompt_lang, version)
+        prompt_text = lab_content
     else:
-        if other_options.emotion == "随机":
-            ref_audio, lab_content = random_ref_audio(voice, other_options.prompt_lang, version)
-            prompt_text = lab_content
-        else:
-            emo, prompt_text = get_ref_audio(voice, other_options.prompt_lang, other_options.emotion, version)
-            ref_audio = f"models/{version}/{voice}/reference_audios/{other_options.prompt_lang}/emotions/【{emo}】{prompt_text}.wav"
-        load_model(voice, version)
-        if other_options.seed == -1:
-            seed = random_seed()
-        else:
-            seed = other_options.seed
-            
-        audio_data = tts_infer(
-            input, 
-            other_options.text_lang, 
-            ref_audio, prompt_text, 
-            other_options.prompt_lang, 
-            other_options.top_k, 
-            other_options.top_p, 
-            other_options.temperature, 
-            other_options.text_split_method, 
-            other_options.batch_size, 
-            other_options.batch_threshold, 
-            other_options.split_bucket, 
-            speed, 
-            other_options.fragment_interval, 
-            seed, 
-            response_format, 
-            other_options.parallel_infer, 
-            other_options.repetition_penalty, 
-            other_options.sample_steps, 
-            other_options.if_sr
-            )
-        msg = "合成成功"
+        emo, prompt_text = get_ref_audio(voice, other_options.prompt_lang, other_options.emotion, version)
+        ref_audio = f"models/{version}/{voice}/reference_audios/{other_options.prompt_lang}/emotions/【{emo}】{prompt_text}.wav"
+    if other_options.seed == -1:
+        seed = random_seed()
+    else:
+        seed = other_options.seed
+    infer_kwargs = {
+        "text": input,
+        "text_lang": other_options.text_lang,
+        "ref_audio_path": ref_audio,
+        "prompt_text": prompt_text,
+        "prompt_lang": other_options.prompt_lang,
+        "top_k": other_options.top_k,
+        "top_p": other_options.top_p,
+        "temperature": other_options.temperature,
+        "text_split_method": other_options.text_split_method,
+        "batch_size": other_options.batch_size,
+        "batch_threshold": other_options.batch_threshold,
+        "split_bucket": other_options.split_bucket,
+        "speed_facter": speed,
+        "fragment_interval": other_options.fragment_interval,
+        "seed": seed,
+        "media_type": response_format,
+        "parallel_infer": other_options.parallel_infer,
+        "repetition_penalty": other_options.repetition_penalty,
+        "sample_steps": other_options.sample_steps,
+        "if_sr": other_options.if_sr,
+        "weights": get_model_path(voice, version),
+    }
+    return infer_kwargs, "合成成功"
+
+def openai_like_infer(model, input, voice, response_format, speed, other_options: otherParams):
+    infer_kwargs, msg = prepare_openai_like_infer(model, input, voice, response_format, speed, other_options)
+    if infer_kwargs is None:
+        return None, msg
+    audio_data = tts_infer(**infer_kwargs, use_cache=other_options.seed != -1)
     return audio_data, msg
-            
-            
-    
-        
-        
-        
+
+def openai_like_infer_stream(model, input, voice, response_format, speed, other_options: otherParams):
+    """ 流式版本，返回逐段产出音频字节的生成器 """
+    infer_kwargs, msg = prepare_openai_like_infer(model, input, voice, response_format, speed, other_options)
+    if infer_kwargs is None:
+        return None, msg
+    return tts_infer_stream(**infer_kwargs), msg
+
+
 #===============一键安装================
 # 检测是否已安装对应模型
 def check_installed(version, categroy, lang, model_name):
@@ -565,20 +2543,246 @@ def check_installed(version, categroy, lang, model_name):
     else:
         return False
     
-# 检测模型是否成功安装
-def check_model_installed(version, categroy, lang, model_name):
-    if not check_installed(version, categroy, lang, model_name):
-        return False
-    else:
-        gpt_model_files = glob(f'models/{version}/{categroy}-{lang}-{model_name}/*.ckpt', recursive=True)
-        sovits_model_files = glob(f'models/{version}/{categroy}-{lang}-{model_name}/*.pth', recursive=True)
-        if len(gpt_model_files) == 0 or len(sovits_model_files) == 0:
-            return False
+# 后台安装：下载、解压、校验与预载都在后台线程中进行，接口立即返回任务 ID，进度见 /install_status
+INSTALL_CHUNK = 1024 * 1024
+INSTALL_TIMEOUT = 60  # 下载连接与读取超时（秒）
+INSTALL_HISTORY = 64  # 保留最近多少个安装任务的状态
+WEIGHT_SUFFIXES = (".ckpt", ".pth", ".log")
+
+def member_name(info: zipfile.ZipInfo) -> str:
+    """ 压缩包内的文件名；未标记 UTF-8 的条目（Windows 下打包的中文文件名）依次尝试 UTF-8 与 GBK """
+    if info.flag_bits & 0x800:
+        return info.filename
+    raw = info.filename.encode("cp437", errors="ignore")
+    for encoding in ("utf-8", "gbk"):
+        try:
+            return raw.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return info.filename
+
+class InstallJob:
+    """ 一次模型安装 """
+
+    def __init__(self, version: str, name: str, lang: str, url: str, checksum: str, preload):
+        self.id = uuid4().hex
+        self.version = version
+        self.name = name
+        self.lang = lang
+        self.url = url
+        self.checksum = checksum.lower()
+        self.preload = preload
+        self.status = "queued"  # queued / downloading / extracting / verifying / done / failed
+        self.downloaded = 0
+        self.total = 0
+        self.extracted = 0
+        self.files = 0
+        self.sha256 = ""
+        self.msg = ""
+        self.created = time()
+        self.finished = None
+        self.done = threading.Event()
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "model": f"{self.version}/{self.name}",
+            "status": self.status,
+            "downloaded": self.downloaded,
+            "total": self.total,
+            "progress": round(self.downloaded / self.total, 4) if self.total else None,
+            "extracted": self.extracted,
+            "files": self.files,
+            "sha256": self.sha256,
+            "msg": self.msg,
+            "created": self.created,
+            "finished": self.finished,
+        }
+
+class ModelInstaller:
+    """ 单线程依次安装：断点续传下载到 cache/，边校验边直接解压到 models/，完成后交给推理线程预载 """
+
+    def __init__(self, models_dir: str = "models", cache_dir: str = "cache"):
+        self.models_dir = Path(models_dir)
+        self.cache_dir = Path(cache_dir)
+        self.queue = queue.Queue()
+        self.jobs = OrderedDict()  # job_id -> InstallJob
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def submit(self, version: str, name: str, lang: str, url: str, checksum: str = "", preload=None) -> InstallJob:
+        """ 同一模型正在安装时返回已有任务 """
+        with self.lock:
+            for job in self.jobs.values():
+                if job.version == version and job.name == name and not job.done.is_set():
+                    return job
+            job = InstallJob(version, name, lang, url, checksum, preload)
+            self.jobs[job.id] = job
+            while len(self.jobs) > INSTALL_HISTORY:
+                oldest_id, oldest = next(iter(self.jobs.items()))
+                if not oldest.done.is_set():
+                    break
+                self.jobs.pop(oldest_id)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.loop_forever, name="gsvi-installer", daemon=True)
+                self.thread.start()
+        self.queue.put(job)
+        return job
+
+    def get(self, job_id: str):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def loop_forever(self) -> None:
+        while True:
+            job = self.queue.get()
+            try:
+                self.install(job)
+            except Exception as e:
+                job.status = "failed"
+                job.msg = f"模型 {job.name} 安装失败：{e}"
+                logger.error(job.msg)
+            finally:
+                job.finished = time()
+                job.done.set()
+
+    def install(self, job: InstallJob) -> None:
+        # 多个推理进程可能同时安装同一模型，.part 文件与解压目录按模型加跨进程锁
+        with FileLock(self.cache_dir / f"{job.name}.zip.lock"):
+            if (self.models_dir / job.version / job.name).exists():
+                job.status = "failed"
+                job.msg = f"模型 {job.name} 已安装过！"
+                return
+            self.install_locked(job)
+
+    def install_locked(self, job: InstallJob) -> None:
+        logger.info(f"模型 {job.name} 开始安装: {job.url}")
+        zip_path = self.cache_dir / f"{job.name}.zip"
+        job.status = "downloading"
+        try:
+            job.sha256 = self.download(job, zip_path)
+        except OSError as e:
+            # 已下载的部分保留在 .part 中，再次安装时断点续传
+            job.status = "failed"
+            job.msg = f"模型 {job.name} 下载失败，请检查网络连接！（{e}）"
+            logger.error(job.msg)
+            return
+        if job.checksum and job.sha256 != job.checksum:
+            zip_path.unlink(missing_ok=True)
+            job.status = "failed"
+            job.msg = f"模型 {job.name} 校验失败：sha256 为 {job.sha256}，应为 {job.checksum}"
+            logger.error(job.msg)
+            return
+
+        job.status = "extracting"
+        staging = self.models_dir / ".installing" / job.version / job.name
+        target = self.models_dir / job.version / job.name
+        try:
+            self.extract(job, zip_path, staging)
+        except (zipfile.BadZipFile, OSError, EOFError) as e:
+            # CRC 不符或压缩包损坏，删掉以便重新下载
+            rmtree(staging, ignore_errors=True)
+            zip_path.unlink(missing_ok=True)
+            job.status = "failed"
+            job.msg = f"模型 {job.name} 安装失败或已损坏，请检查下网络连接！（{e}）"
+            logger.error(job.msg)
+            return
+
+        job.status = "verifying"
+        if not glob(f"{staging}/*.ckpt") or not glob(f"{staging}/*.pth"):
+            rmtree(staging, ignore_errors=True)
+            zip_path.unlink(missing_ok=True)
+            job.status = "failed"
+            job.msg = f"模型 {job.name} 压缩包中缺少 GPT（.ckpt）或 SoVITS（.pth）权重！"
+            logger.error(job.msg)
+            return
+        if target.exists():
+            rmtree(staging, ignore_errors=True)
+            job.status = "failed"
+            job.msg = f"模型 {job.name} 已安装过！"
+            return
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # 解压完整后一次性改名，模型索引不会看到装了一半的目录
+        staging.replace(target)
+        zip_path.unlink(missing_ok=True)
+        model_index.invalidate(job.version)
+        job.status = "done"
+        job.msg = f"模型 {job.name} 安装完成！可在 models/{job.version} 目录下查看！"
+        logger.success(job.msg)
+        if job.preload is not None:
+            job.preload(f"{job.version}/{job.name}")
+
+    @staticmethod
+    def download(job: InstallJob, zip_path: Path) -> str:
+        """ 下载到 .part 文件，服务器支持 Range 时断点续传，返回整个文件的 sha256 """
+        zip_path.parent.mkdir(parents=True, exist_ok=True)
+        part_path = zip_path.with_suffix(".zip.part")
+        offset = part_path.stat().st_size if part_path.exists() else 0
+        headers = {"User-Agent": "GSVI"}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+        digest = sha256()
+        try:
+            response = urlopen(Request(job.url, headers=headers), timeout=INSTALL_TIMEOUT)
+        except HTTPError as e:
+            if not offset or e.code != 416:
+                raise
+            # 请求范围超出文件末尾：上次已下载完整、只是没来得及改名，直接校验已有的 .part
+            e.close()
+            response = None
+        if response is None:
+            job.total = job.downloaded = offset
+            with open(part_path, "rb") as existing:
+                for chunk in iter(lambda: existing.read(INSTALL_CHUNK), b""):
+                    digest.update(chunk)
         else:
-            return True
-    
-# 安装模型
-def install_model(version, categroy, lang, model_name, model_url):
+            with response:
+                if offset and response.status != 206:
+                    # 服务器不支持断点续传，从头下载
+                    offset = 0
+                length = response.headers.get("Content-Length")
+                job.total = offset + int(length) if length else 0
+                job.downloaded = offset
+                if offset:
+                    with open(part_path, "rb") as existing:
+                        for chunk in iter(lambda: existing.read(INSTALL_CHUNK), b""):
+                            digest.update(chunk)
+                with open(part_path, "ab" if offset else "wb") as output:
+                    for chunk in iter(lambda: response.read(INSTALL_CHUNK), b""):
+                        output.write(chunk)
+                        digest.update(chunk)
+                        job.downloaded += len(chunk)
+        if job.total and job.downloaded < job.total:
+            raise OSError(f"连接中断，已下载 {job.downloaded}/{job.total} 字节")
+        part_path.replace(zip_path)
+        return digest.hexdigest()
+
+    @staticmethod
+    def extract(job: InstallJob, zip_path: Path, staging: Path) -> None:
+        """ 参考音频放入 reference_audios/<语言>/emotions，权重与日志放在模型目录下，其余文件忽略；读到条目末尾时 zipfile 会校验 CRC """
+        rmtree(staging, ignore_errors=True)
+        emotions = staging / "reference_audios" / job.lang / "emotions"
+        emotions.mkdir(parents=True, exist_ok=True)
+        with zipfile.ZipFile(zip_path) as archive:
+            members = [info for info in archive.infolist() if not info.is_dir()]
+            job.files = len(members)
+            for info in members:
+                filename = Path(member_name(info)).name
+                if filename.endswith(".wav"):
+                    target = emotions / filename
+                elif filename.endswith(WEIGHT_SUFFIXES):
+                    target = staging / filename
+                else:
+                    job.extracted += 1
+                    continue
+                with archive.open(info) as source, open(target, "wb") as output:
+                    copyfileobj(source, output, INSTALL_CHUNK)
+                job.extracted += 1
+
+model_installer = ModelInstaller()
+
+# 安装模型：提交到后台安装线程，返回 (任务状态, 提示信息)；参数有误或已安装时任务状态为 None
+def install_model(version, categroy, lang, model_name, model_url, checksum: str = "", preload=None):
     if check_installed(version, categroy, lang, model_name):
         msg = f"模型 {categroy}-{lang}-{model_name} 已安装过！"
     elif model_url == "":
@@ -591,34 +2795,24 @@ def install_model(version, categroy, lang, model_name, model_url):
         msg = f"语言不能为空！"
     elif model_name == "":
         msg = f"模型名称不能为空！" 
-    else:    
-        print(f"------------------------模型 {categroy}-{lang}-{model_name} 安装中------------------------")
-        print(f"------------------------模型 {categroy}-{lang}-{model_name} 下载中------------------------")
-        if os.name == "nt":
-            subprocess.run(f"./Aria2/aria2c.exe -x16 -s16 -c {model_url} -o cache/{categroy}-{lang}-{model_name}.zip")
-        else:
-            subprocess.run(f"aria2c -x16 -s16 -c {model_url} -o cache/{categroy}-{lang}-{model_name}.zip", shell=True)
-        if Path(f"cache/{categroy}-{lang}-{model_name}.zip").exists():
-            print(f"------------------------模型 {categroy}-{lang}-{model_name} 解压中------------------------")
-            Path(f"cache/{categroy}-{lang}-{model_name}").mkdir(parents=True, exist_ok=True)
-            if os.name == "nt":
-                subprocess.run(f"./7-Zip/7za.exe x cache/{categroy}-{lang}-{model_name}.zip -ocache/{categroy}-{lang}-{model_name}",stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL)
-            else:
-                subprocess.run(f"7za x cache/{categroy}-{lang}-{model_name}.zip -ocache/{categroy}-{lang}-{model_name}", shell=True)
-            print(f"------------------------模型 {categroy}-{lang}-{model_name} 移动中------------------------")
-            move_model_files(version, categroy, lang, model_name)
-            print(f"------------------------清理 {categroy}-{lang}-{model_name} 的缓存------------------------")
-            rmtree(f"cache/{categroy}-{lang}-{model_name}")
-            Path(f"cache/{categroy}-{lang}-{model_name}.zip").unlink()
-            if check_model_installed(version, categroy, lang, model_name):
-                print(f"------------------------模型 {categroy}-{lang}-{model_name} 安装完成------------------------")
-                msg = f"模型 {categroy}-{lang}-{model_name} 安装完成！可在 models/{version} 目录下查看！"
-            else:
-                msg = f"模型 {categroy}-{lang}-{model_name} 安装失败或已损坏，请检查下网络连接！"
-                rmtree(f"models/{version}/{categroy}-{lang}-{model_name}")
-        else:
-            msg = f"模型 {categroy}-{lang}-{model_name} 下载失败，请检查网络连接！"
-    return msg
+    else:
+        job = model_installer.submit(version, f"{categroy}-{lang}-{model_name}", lang, model_url, checksum, preload)
+        return job.to_dict(), f"模型 {categroy}-{lang}-{model_name} 已开始安装，可在 /install_status/{job.id} 查看进度"
+    return None, msg
+
+def get_install_status(job_id: str = ""):
+    """ 查询安装任务，job_id 为空时返回全部任务，任务不存在时返回 None """
+    if job_id == "":
+        with model_installer.lock:
+            return [job.to_dict() for job in model_installer.jobs.values()]
+    job = model_installer.get(job_id)
+    return None if job is None else job.to_dict()
+
+def wait_install(job_id: str) -> dict:
+    """ 阻塞到安装任务结束，在线程池中调用 """
+    job = model_installer.get(job_id)
+    job.done.wait()
+    return job.to_dict()
 
 # 删除模型
 def delete_model(version, categroy, lang, model_name):
@@ -626,5 +2820,6 @@ def delete_model(version, categroy, lang, model_name):
         msg = f"模型 {categroy}-{lang}-{model_name} 不存在！"
     else:
         rmtree(f"models/{version}/{categroy}-{lang}-{model_name}")
+        model_index.invalidate(version)
         msg = f"模型 {categroy}-{lang}-{model_name} 删除成功！"
     return msg
\ No newline at end of file
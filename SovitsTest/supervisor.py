@@ -0,0 +1,401 @@
+""" GSVI多进程部署：主进程只负责转发，按模型亲和把请求交给已载入该模型的推理进程 """
+
+import asyncio
+import http.client
+import json
+import os
+import re
+import signal
+import subprocess
+import threading
+from collections import OrderedDict
+from time import sleep
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.middleware.cors import CORSMiddleware
+from tools.logger import logger
+
+# 亲和进程比最空闲的进程多出这么多进行中的请求时，改投最空闲的进程
+AFFINITY_SPILL = 2
+# 最多记住多少个模型的亲和关系
+AFFINITY_MAX_VOICES = 1024
+# 推理进程存活检查间隔（秒）
+HEALTH_SECONDS = 5
+# 转发给推理进程的超时（秒），多人对话等长任务可能需要很久
+PROXY_TIMEOUT = 3600
+PROXY_CHUNK = 64 * 1024
+# 逐跳头部不转发
+HOP_HEADERS = {"connection", "keep-alive", "transfer-encoding", "te", "trailer", "upgrade", "proxy-authorization", "proxy-authenticate", "host", "content-length"}
+METRIC_LINE = re.compile(r"([^{\s]+)(?:\{(.*)\})?\s+(.*)")
+
+
+class WorkerProcess:
+    """ 一个推理进程，监听 127.0.0.1 上的独立端口 """
+
+    def __init__(self, index: int, port: int, command: list[str], threads: int):
+        self.index = index
+        self.port = port
+        self.command = command + ["--worker_id", str(index), "--worker_port", str(port), "--threads", str(threads)]
+        self.threads = threads
+        self.process = None
+        self.ready = False
+        self.inflight = 0
+        self.restarts = 0
+
+    def start(self) -> None:
+        env = dict(os.environ)
+        # 限制每个进程的 OpenMP / MKL 线程数，避免多个进程争抢同一批核心
+        env["OMP_NUM_THREADS"] = str(self.threads)
+        env["MKL_NUM_THREADS"] = str(self.threads)
+        self.ready = False
+        self.process = subprocess.Popen(self.command, env=env)
+        logger.info(f"推理进程 {self.index} 已启动，端口: {self.port}，线程数: {self.threads}，PID: {self.process.pid}")
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def probe(self) -> bool:
+        """ 推理进程的推理模块就绪后才接收请求（--warm_start 时端口先于推理模块就绪） """
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=2)
+            conn.request("GET", "/ready")
+            self.ready = conn.getresponse().status == 200
+            conn.close()
+        except OSError:
+            self.ready = False
+        return self.ready
+
+    def stop(self) -> None:
+        if self.alive():
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+    def stats(self) -> dict:
+        return {
+            "worker": self.index,
+            "port": self.port,
+            "pid": self.process.pid if self.process else None,
+            "alive": self.alive(),
+            "ready": self.ready,
+            "inflight": self.inflight,
+            "threads": self.threads,
+            "restarts": self.restarts,
+        }
+
+
+class Supervisor:
+    """ 启动并看护 N 个推理进程，按模型亲和选择进程 """
+
+    def __init__(self, command: list[str], count: int, base_port: int, threads: int):
+        self.workers = [WorkerProcess(i, base_port + i, command, threads) for i in range(count)]
+        self.affinity = OrderedDict()  # 模型 -> 推理进程，越靠后越新
+        self.routes = {"affine": 0, "spill": 0, "new": 0, "any": 0}
+        self.lock = threading.Lock()
+        self.stopping = False
+        self.monitor = None
+
+    def start(self) -> None:
+        for worker in self.workers:
+            worker.start()
+        self.monitor = threading.Thread(target=self.monitor_forever, name="gsvi-supervisor", daemon=True)
+        self.monitor.start()
+
+    def stop(self) -> None:
+        self.stopping = True
+        for worker in self.workers:
+            worker.stop()
+
+    def monitor_forever(self) -> None:
+        while not self.stopping:
+            for worker in self.workers:
+                if self.stopping:
+                    break
+                if not worker.alive():
+                    logger.warning(f"推理进程 {worker.index} 已退出（返回码 {worker.process.returncode}），正在重启")
+                    self.forget(worker)
+                    worker.restarts += 1
+                    worker.start()
+                elif not worker.ready and worker.probe():
+                    logger.success(f"推理进程 {worker.index} 已就绪")
+            sleep(HEALTH_SECONDS)
+
+    def forget(self, worker: WorkerProcess) -> None:
+        """ 进程重启后权重不在内存里了，清掉它的亲和关系 """
+        with self.lock:
+            for voice in [voice for voice, owner in self.affinity.items() if owner is worker]:
+                self.affinity.pop(voice)
+
+    @staticmethod
+    def voice_of(path: str, body: bytes):
+        """ 从请求中取出决定权重的字段，不涉及具体模型的请求返回 None """
+        if path not in ("/infer_single", "/infer_classic", "/v1/audio/speech"):
+            return None
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return None
+        if not isinstance(payload, dict):
+            return None
+        if path == "/infer_single":
+            return f"{payload.get('version')}/{payload.get('model_name')}"
+        if path == "/infer_classic":
+            return f"{payload.get('version')}/{payload.get('gpt_model_name')}/{payload.get('sovits_model_name')}"
+        return f"{payload.get('model')}/{payload.get('voice')}"
+
+    def pick(self, voice=None):
+        """ 优先交给已载入该模型的进程；它明显比其他进程忙时改投最空闲的进程，没有可用进程时返回 None """
+        with self.lock:
+            ready = [worker for worker in self.workers if worker.ready and worker.alive()]
+            if not ready:
+                return None
+            idlest = min(ready, key=lambda worker: worker.inflight)
+            if voice is None:
+                route, worker = "any", idlest
+            else:
+                owner = self.affinity.get(voice)
+                if owner in ready and owner.inflight - idlest.inflight < AFFINITY_SPILL:
+                    route, worker = "affine", owner
+                    self.affinity.move_to_end(voice)
+                elif owner in ready:
+                    route, worker = "spill", idlest
+                else:
+                    route, worker = "new", idlest
+                    self.affinity[voice] = idlest
+                    while len(self.affinity) > AFFINITY_MAX_VOICES:
+                        self.affinity.popitem(last=False)
+            self.routes[route] += 1
+            worker.inflight += 1
+            return worker
+
+    def release(self, worker: WorkerProcess) -> None:
+        with self.lock:
+            worker.inflight -= 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            voices = {worker.index: [] for worker in self.workers}
+            for voice, owner in self.affinity.items():
+                voices[owner.index].append(voice)
+            return {
+                "workers": [dict(worker.stats(), voices=voices[worker.index]) for worker in self.workers],
+                "routes": dict(self.routes),
+            }
+
+
+def open_upstream(worker: WorkerProcess, method: str, target: str, headers: dict, body: bytes):
+    conn = http.client.HTTPConnection("127.0.0.1", worker.port, timeout=PROXY_TIMEOUT)
+    conn.request(method, target, body=body or None, headers=headers)
+    return conn, conn.getresponse()
+
+async def fetch(worker: WorkerProcess, method: str, target: str, body: bytes = b"") -> tuple[int, bytes]:
+    """ 读取推理进程的完整响应，用于汇总统计 """
+    def run():
+        conn, response = open_upstream(worker, method, target, {"Content-Type": "application/json"} if body else {}, body)
+        try:
+            return response.status, response.read()
+        finally:
+            conn.close()
+    return await asyncio.to_thread(run)
+
+async def forward(worker: WorkerProcess, request: Request, body: bytes, release=None) -> Response:
+    """ 把请求原样转发给推理进程，响应体边读边发，流式合成与下载不受影响 """
+    target = request.url.path + (f"?{request.url.query}" if request.url.query else "")
+    headers = {key: value for key, value in request.headers.items() if key.lower() not in HOP_HEADERS}
+    try:
+        conn, upstream = await asyncio.to_thread(open_upstream, worker, request.method, target, headers, body)
+    except OSError as e:
+        if release:
+            release()
+        logger.error(f"转发到推理进程 {worker.index} 失败: {e}")
+        return JSONResponse(content={"msg": "推理进程不可用，请稍后再试"}, status_code=503)
+
+    async def relay():
+        try:
+            while True:
+                chunk = await asyncio.to_thread(upstream.read1, PROXY_CHUNK)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            conn.close()
+            if release:
+                release()
+
+    response_headers = {key: value for key, value in upstream.getheaders() if key.lower() not in HOP_HEADERS}
+    return StreamingResponse(relay(), status_code=upstream.status, headers=response_headers)
+
+def merge_metrics(texts: list[str], supervisor: Supervisor) -> str:
+    """ 合并各推理进程的 Prometheus 指标，样本加上 worker 标签，同名指标的样本放在一起 """
+    families = OrderedDict()  # 指标名 -> [注释行, 样本行]
+    for index, text in enumerate(texts):
+        name = None
+        for line in text.splitlines():
+            if line.startswith("#"):
+                parts = line.split(maxsplit=3)
+                if len(parts) >= 3 and parts[1] in ("HELP", "TYPE"):
+                    name = parts[2]
+                    family = families.setdefault(name, [[], []])
+                    if line not in family[0]:
+                        family[0].append(line)
+                continue
+            match = METRIC_LINE.match(line)
+            if match is None or name is None:
+                continue
+            sample, labels, value = match.groups()
+            labels = f'worker="{index}",{labels}' if labels else f'worker="{index}"'
+            families[name][1].append(f"{sample}{{{labels}}} {value}")
+    lines = []
+    for comments, samples in families.values():
+        lines.extend(comments)
+        lines.extend(samples)
+    lines.append("# HELP gsvi_router_requests_total 转发的请求数，按选择方式区分（affine 亲和命中 / spill 亲和进程太忙 / new 首次分配 / any 与模型无关）")
+    lines.append("# TYPE gsvi_router_requests_total counter")
+    for route, count in supervisor.stats()["routes"].items():
+        lines.append(f'gsvi_router_requests_total{{route="{route}"}} {count}')
+    return "\n".join(lines) + "\n"
+
+def merge_stats(results: list[dict]) -> dict:
+    """ 各推理进程的缓存统计：计数与字节数求和，命中率重新计算，原始数据放在 workers 中 """
+    merged = {"msg": "获取缓存统计成功", "workers": results}
+    sections = [key for key, value in results[0].items() if isinstance(value, dict)] if results else []
+    for section in sections:
+        values = [result[section] for result in results if isinstance(result.get(section), dict)]
+        total = {}
+        for key in values[0]:
+            numbers = [value.get(key) for value in values]
+            if not all(isinstance(number, int) and not isinstance(number, bool) for number in numbers):
+                continue
+            # 上限与保留时间是各进程相同的配置，不求和
+            total[key] = numbers[0] if key.startswith("max_") or key.endswith("_seconds") else sum(numbers)
+        if "hit_rate" in values[0] and "hits" in total and "misses" in total:
+            lookups = total["hits"] + total["misses"]
+            total["hit_rate"] = total["hits"] / lookups if lookups else 0.0
+        merged[section] = total
+    return merged
+
+def create_router(supervisor: Supervisor, origin: list[str]) -> FastAPI:
+    """ 对外的转发服务：接口与单进程部署完全相同 """
+    router = FastAPI()
+    router.add_middleware(
+        CORSMiddleware,
+        allow_origins=origin,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    def ready_workers() -> list[WorkerProcess]:
+        return [worker for worker in supervisor.workers if worker.ready and worker.alive()]
+
+    async def gather_json(target: str) -> list[dict]:
+        results = []
+        for worker in ready_workers():
+            try:
+                status, content = await fetch(worker, "GET", target)
+                results.append(json.loads(content))
+            except (OSError, ValueError) as e:
+                logger.warning(f"获取推理进程 {worker.index} 的 {target} 失败: {e}")
+        return results
+
+    @router.get("/workers")
+    async def workers():
+        return {"msg": "获取推理进程状态成功", **supervisor.stats()}
+
+    @router.get("/ready")
+    async def ready(voice: str = ""):
+        states = []
+        for worker in supervisor.workers:
+            if not worker.alive():
+                continue
+            try:
+                _, content = await fetch(worker, "GET", "/ready")
+                states.append(json.loads(content))
+            except (OSError, ValueError):
+                continue
+        # 任一推理进程就绪即可服务；模型在任一进程中预载完成即视为就绪
+        voices = {}
+        for state in states:
+            for name, entry in state.get("voices", {}).items():
+                if voices.get(name, {}).get("status") != "ready":
+                    voices[name] = entry
+        serving = any(state.get("ready") for state in states)
+        ok = serving and (not voice or voices.get(voice, {}).get("status") == "ready")
+        content = {"msg": "服务已就绪" if ok else "服务正在启动", "ready": serving, "voices": voices, "workers": states}
+        return JSONResponse(content=content, status_code=200 if ok else 503)
+
+    @router.get("/metrics")
+    async def metrics():
+        texts = []
+        for worker in ready_workers():
+            try:
+                _, content = await fetch(worker, "GET", "/metrics")
+                texts.append(content.decode("utf-8"))
+            except OSError as e:
+                logger.warning(f"获取推理进程 {worker.index} 的指标失败: {e}")
+        return Response(content=merge_metrics(texts, supervisor), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+    @router.get("/cache_stats")
+    async def cache_stats():
+        return merge_stats(await gather_json("/cache_stats"))
+
+    @router.get("/jobs")
+    async def job_queue_stats():
+        results = await gather_json("/jobs")
+        merged = {"msg": "获取队列状态成功"}
+        for key in ("queue_depth", "max_queue", "running", "queued"):
+            merged[key] = sum(result.get(key, 0) for result in results)
+        return merged
+
+    # 推理任务与安装任务的 ID 只有创建它的进程认识，逐个询问
+    @router.api_route("/jobs/{job_id}", methods=["GET", "DELETE"])
+    @router.get("/install_status/{job_id}")
+    async def job(job_id: str, request: Request):
+        status, content = 404, json.dumps({"msg": "任务不存在或已过期"}).encode("utf-8")
+        for worker in ready_workers():
+            try:
+                status, content = await fetch(worker, request.method, request.url.path)
+            except OSError:
+                continue
+            if status != 404:
+                break
+        return Response(content=content, status_code=status, media_type="application/json")
+
+    @router.post("/shutdown")
+    async def shutdown(request: Request):
+        body = await request.body()
+        worker = supervisor.pick()
+        if worker is None:
+            return JSONResponse(content={"msg": "推理进程尚未就绪"}, status_code=503)
+        try:
+            status, content = await fetch(worker, "POST", "/shutdown", body)
+        except OSError:
+            # 推理进程收到正确的密码后立即退出，可能来不及返回响应
+            status, content = 200, b"null"
+        finally:
+            supervisor.release(worker)
+        if b"msg" in content:
+            # 密码错误
+            return Response(content=content, status_code=status, media_type="application/json")
+        # stop 会逐个等待推理进程退出，不能阻塞事件循环
+        await asyncio.to_thread(supervisor.stop)
+        os.kill(os.getpid(), signal.SIGINT)
+        print("服务已关闭")
+
+    @router.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS", "HEAD"])
+    async def proxy(path: str, request: Request):
+        body = await request.body()
+        if request.url.path.startswith("/outputs/"):
+            # 输出文件索引与清理由 0 号进程负责，下载尽量交给它以便记录访问时间；
+            # 它正在重启时由其他进程提供下载（outputs/ 是共用目录），只是这次访问不计入清理依据
+            workers = ready_workers()
+            worker = supervisor.workers[0] if supervisor.workers[0] in workers else next(iter(workers), None)
+            return await forward(worker, request, body) if worker else JSONResponse(content={"msg": "推理进程尚未就绪"}, status_code=503)
+        worker = supervisor.pick(supervisor.voice_of(request.url.path, body))
+        if worker is None:
+            return JSONResponse(content={"msg": "推理进程尚未就绪，请稍后再试"}, status_code=503)
+        return await forward(worker, request, body, lambda: supervisor.release(worker))
+
+    return router
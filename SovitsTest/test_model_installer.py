@@ -0,0 +1,181 @@
+""" ModelInstaller 的下载、断点续传、校验与解压测试：本地 HTTP 服务提供压缩包，推理相关模块用 benchmark.py 中的最小实现代替 """
+
+import io
+import os
+import sys
+import tempfile
+import threading
+import unittest
+import zipfile
+from hashlib import sha256
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import benchmark
+
+benchmark.install_stub_modules(0, 0, 0)
+from tools import my_infer
+
+
+def make_archive() -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("speaker/speaker-e15.ckpt", b"gpt" * 1000)
+        archive.writestr("speaker/speaker_e8_s200.pth", b"sovits" * 1000)
+        archive.writestr("speaker/train.log", b"log")
+        archive.writestr("speaker/【开心】今天真是太开心了！.wav", b"RIFF" + b"\0" * 2000)
+        archive.writestr("speaker/readme.txt", b"ignored")
+    return buffer.getvalue()
+
+
+class ArchiveHandler(BaseHTTPRequestHandler):
+    """ 提供 server.payload，支持单段 Range；server.ranges 记录收到的 Range 头 """
+
+    def do_GET(self):
+        payload = self.server.payload
+        requested = self.headers.get("Range")
+        self.server.ranges.append(requested)
+        if requested and self.server.accept_ranges:
+            start = int(requested.split("=")[1].split("-")[0])
+            if start >= len(payload):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(payload)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            body = payload[start:]
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(payload) - 1}/{len(payload)}")
+        else:
+            body = payload
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ModelInstallerTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.payload = make_archive()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), ArchiveHandler)
+        cls.server.payload = cls.payload
+        cls.server.accept_ranges = True
+        cls.server.ranges = []
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_address[1]}/model.zip"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.payload = self.payload
+        self.server.accept_ranges = True
+        self.server.ranges.clear()
+        self.workdir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        # 安装完成后模型索引按相对路径重建 models/
+        os.chdir(self.workdir.name)
+        self.root = Path(self.workdir.name)
+        self.installer = my_infer.ModelInstaller(models_dir=str(self.root / "models"), cache_dir=str(self.root / "cache"))
+        self.name = "角色-中文-speaker"
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.workdir.cleanup()
+
+    def install(self, checksum: str = "") -> my_infer.InstallJob:
+        job = self.installer.submit("v4", self.name, "中文", self.url, checksum)
+        self.assertTrue(job.done.wait(30), "安装超时")
+        return job
+
+    def write_part(self, data: bytes) -> Path:
+        part_path = self.root / "cache" / f"{self.name}.zip.part"
+        part_path.parent.mkdir(parents=True, exist_ok=True)
+        part_path.write_bytes(data)
+        return part_path
+
+    def leftovers(self) -> list:
+        """ cache/ 中残留的压缩包与 .part（.lock 为跨进程锁文件，保留） """
+        return sorted(self.root.glob("cache/*.zip")) + sorted(self.root.glob("cache/*.zip.part"))
+
+    def assert_installed(self, job: my_infer.InstallJob) -> None:
+        self.assertEqual(job.status, "done", job.msg)
+        self.assertEqual(job.sha256, sha256(self.payload).hexdigest())
+        target = self.root / "models" / "v4" / self.name
+        self.assertEqual((target / "speaker-e15.ckpt").read_bytes(), b"gpt" * 1000)
+        self.assertTrue((target / "speaker_e8_s200.pth").exists())
+        self.assertTrue((target / "train.log").exists())
+        self.assertTrue((target / "reference_audios" / "中文" / "emotions" / "【开心】今天真是太开心了！.wav").exists())
+        self.assertFalse((target / "readme.txt").exists())
+        self.assertEqual(self.leftovers(), [])
+        self.assertFalse((self.root / "models" / ".installing" / "v4" / self.name).exists())
+
+    def test_install(self):
+        job = self.install(sha256(self.payload).hexdigest())
+        self.assert_installed(job)
+        self.assertEqual(self.server.ranges, [None])
+        self.assertEqual(job.downloaded, len(self.payload))
+
+    def test_resume_partial_download(self):
+        half = len(self.payload) // 2
+        self.write_part(self.payload[:half])
+        job = self.install()
+        self.assert_installed(job)
+        self.assertEqual(self.server.ranges, [f"bytes={half}-"])
+
+    def test_restart_when_range_not_supported(self):
+        self.server.accept_ranges = False
+        self.write_part(b"stale bytes")
+        job = self.install()
+        self.assert_installed(job)
+
+    def test_complete_part_file_gets_416(self):
+        self.write_part(self.payload)
+        job = self.install()
+        self.assert_installed(job)
+        self.assertEqual(self.server.ranges, [f"bytes={len(self.payload)}-"])
+
+    def test_checksum_mismatch(self):
+        job = self.install("0" * 64)
+        self.assertEqual(job.status, "failed")
+        self.assertIn("校验失败", job.msg)
+        self.assertFalse((self.root / "models" / "v4" / self.name).exists())
+        self.assertEqual(self.leftovers(), [])
+
+    def test_corrupt_archive(self):
+        # 与压缩包等长的损坏数据：服务器返回 416，解压时发现损坏后删除，下次重新下载
+        self.write_part(b"\0" * len(self.payload))
+        job = self.install()
+        self.assertEqual(job.status, "failed")
+        self.assertEqual(self.leftovers(), [])
+        job = self.install()
+        self.assert_installed(job)
+
+    def test_waits_for_other_installer(self):
+        # 另一个进程正在安装同一模型时等它结束，之后发现已安装
+        with my_infer.FileLock(self.root / "cache" / f"{self.name}.zip.lock"):
+            job = self.installer.submit("v4", self.name, "中文", self.url)
+            self.assertFalse(job.done.wait(0.5))
+            self.assertEqual(self.server.ranges, [])
+            (self.root / "models" / "v4" / self.name).mkdir(parents=True)
+        self.assertTrue(job.done.wait(30))
+        self.assertEqual(job.status, "failed")
+        self.assertIn("已安装过", job.msg)
+
+    def test_already_installed(self):
+        self.assert_installed(self.install())
+        job = self.install()
+        self.assertEqual(job.status, "failed")
+        self.assertIn("已安装过", job.msg)
+
+
+if __name__ == "__main__":
+    unittest.main()
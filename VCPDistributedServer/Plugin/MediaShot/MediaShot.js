@@ -0,0 +1,218 @@
+/**
+ * MediaShot.js
+ * 常驻 Python 工作进程的桥接层：由一个小的 `python media_shot.py --worker` 进程池处理所有调用，
+ * 避免每次调用都重新启动解释器、导入 PIL、检查 FFmpeg 和探测字体。
+ * 每个工作进程同一时间只处理一个请求，其余请求在这里排队；超时从请求发给工作进程时开始计算，
+ * 超时后只重启处理该请求的工作进程，其他进程上的请求不受影响。
+ * 请求与响应都是单行 JSON（NDJSON），通过 requestId 对应。
+ */
+const { spawn } = require('child_process');
+const path = require('path');
+const fs = require('fs');
+const readline = require('readline');
+
+const manifest = require('./plugin-manifest.json');
+
+const WORKER_SCRIPT = 'media_shot.py';
+const REQUEST_TIMEOUT = manifest.communication?.timeout || 60000;
+const DEFAULT_POOL_SIZE = 2;
+
+let pluginConfig = null;
+let projectBasePath = null;
+const workers = []; // { child, requestId }，requestId 为 null 时空闲
+const queuedRequests = []; // 等待空闲工作进程的 { requestId, args, resolve, reject }
+let nextRequestId = 1;
+const pendingRequests = new Map(); // requestId -> { child, resolve, reject, timeoutId }
+
+/**
+ * 读取插件目录下的 config.env（未经插件管理器注入配置时使用）
+ */
+function readLocalConfig() {
+    const config = {};
+    try {
+        const configPath = path.join(__dirname, 'config.env');
+        if (!fs.existsSync(configPath)) return config;
+        const content = fs.readFileSync(configPath, 'utf-8');
+        for (const line of content.split(/\r?\n/)) {
+            const match = line.match(/^\s*([A-Za-z_][A-Za-z0-9_]*)\s*=\s*(.*?)\s*$/);
+            if (match) config[match[1]] = match[2];
+        }
+    } catch (error) {
+        console.error('[MediaShot] Error reading config.env:', error);
+    }
+    return config;
+}
+
+function currentConfig() {
+    return pluginConfig || readLocalConfig();
+}
+
+function buildWorkerEnv() {
+    const config = currentConfig();
+    const env = { ...process.env };
+    for (const [key, value] of Object.entries(config)) {
+        if (value !== undefined && value !== null) env[key] = String(value);
+    }
+    if (projectBasePath) {
+        env.PROJECT_BASE_PATH = projectBasePath;
+    }
+    env.PYTHONIOENCODING = 'utf-8';
+    return env;
+}
+
+function poolSize() {
+    const size = parseInt(currentConfig().WORKER_POOL_SIZE, 10);
+    return Number.isFinite(size) && size > 0 ? size : DEFAULT_POOL_SIZE;
+}
+
+/**
+ * 拒绝等待中的请求；指定 child 时只处理发给该工作进程的请求
+ */
+function rejectAll(error, child = null) {
+    for (const [requestId, request] of pendingRequests) {
+        if (child && request.child !== child) continue;
+        pendingRequests.delete(requestId);
+        clearTimeout(request.timeoutId);
+        request.reject(error);
+    }
+}
+
+function removeWorker(child) {
+    const index = workers.findIndex((slot) => slot.child === child);
+    if (index !== -1) workers.splice(index, 1);
+}
+
+function startWorker() {
+    const child = spawn('python', [WORKER_SCRIPT, '--worker'], {
+        cwd: __dirname,
+        env: buildWorkerEnv(),
+        windowsHide: true
+    });
+    console.log(`[MediaShot] 工作进程已启动 (PID: ${child.pid})`);
+    const slot = { child, requestId: null };
+
+    const lines = readline.createInterface({ input: child.stdout });
+    lines.on('line', (line) => {
+        let response;
+        try {
+            response = JSON.parse(line);
+        } catch (e) {
+            console.warn(`[MediaShot] 无法解析工作进程输出: ${line}`);
+            return;
+        }
+        const request = pendingRequests.get(response.requestId);
+        if (!request) return;
+        pendingRequests.delete(response.requestId);
+        clearTimeout(request.timeoutId);
+        if (slot.requestId === response.requestId) slot.requestId = null;
+        if (response.status === 'success') {
+            request.resolve(response.result);
+        } else {
+            request.reject(new Error(response.error || 'Plugin reported an error without a message.'));
+        }
+        dispatch();
+    });
+
+    // 日志写在 stderr 上，必须持续读取，否则管道写满后工作进程会阻塞
+    child.stderr.setEncoding('utf8');
+    child.stderr.on('data', (data) => {
+        if (pluginConfig?.DebugMode) console.log(`[MediaShot] ${data.trim()}`);
+    });
+
+    // 工作进程意外退出后写入会触发 EPIPE，交给 exit 事件统一处理
+    child.stdin.on('error', (err) => {
+        console.warn(`[MediaShot] 写入工作进程失败: ${err.message}`);
+    });
+
+    child.on('error', (err) => {
+        console.error(`[MediaShot] 工作进程启动失败: ${err.message}`);
+        removeWorker(child);
+        const error = new Error(`Failed to start plugin "MediaShot": ${err.message}`);
+        rejectAll(error, child);
+        if (workers.length === 0) {
+            // 没有可用的工作进程，排队的请求没有计时器，直接拒绝，避免反复启动失败
+            for (const request of queuedRequests.splice(0)) request.reject(error);
+        } else {
+            dispatch();
+        }
+    });
+
+    child.on('exit', (code, signal) => {
+        removeWorker(child);
+        rejectAll(new Error(`MediaShot 工作进程已退出 (code: ${code}, signal: ${signal})`), child);
+        dispatch();
+    });
+
+    workers.push(slot);
+    return slot;
+}
+
+function stopWorker(slot) {
+    removeWorker(slot.child);
+    try {
+        slot.child.stdin.end();
+        slot.child.kill();
+    } catch (e) {
+        console.error('[MediaShot] 终止工作进程时出错:', e);
+    }
+}
+
+/**
+ * 把排队的请求交给空闲的工作进程，进程数未到上限时按需启动新进程
+ */
+function dispatch() {
+    while (queuedRequests.length > 0) {
+        let slot = workers.find((candidate) => candidate.requestId === null);
+        if (!slot) {
+            if (workers.length >= poolSize()) return;
+            slot = startWorker();
+        }
+        send(slot, queuedRequests.shift());
+    }
+}
+
+function send(slot, { requestId, args, resolve, reject }) {
+    const { child } = slot;
+    slot.requestId = requestId;
+    const timeoutId = setTimeout(() => {
+        pendingRequests.delete(requestId);
+        reject(new Error('Plugin "MediaShot" execution timed out.'));
+        // 工作进程可能卡在这个请求上，只重启这一个进程，下次分派时按需补充
+        stopWorker(slot);
+        dispatch();
+    }, REQUEST_TIMEOUT);
+    pendingRequests.set(requestId, { child, resolve, reject, timeoutId });
+    child.stdin.write(JSON.stringify({ ...args, requestId }) + '\n');
+}
+
+/**
+ * 插件管理器初始化服务插件时调用，这里只用于接收合并后的配置，不注册任何路由
+ */
+function registerRoutes(app, config, basePath) {
+    pluginConfig = config || null;
+    projectBasePath = basePath || null;
+}
+
+async function processToolCall(args) {
+    const requestId = nextRequestId++;
+    return new Promise((resolve, reject) => {
+        queuedRequests.push({ requestId, args, resolve, reject });
+        dispatch();
+    });
+}
+
+/**
+ * 清理插件资源，在主程序退出或插件重载时调用。
+ */
+function cleanup() {
+    const error = new Error('MediaShot 插件正在关闭');
+    for (const request of queuedRequests.splice(0)) request.reject(error);
+    rejectAll(error);
+    for (const slot of [...workers]) stopWorker(slot);
+}
+
+module.exports = {
+    registerRoutes,
+    processToolCall,
+    cleanup
+};
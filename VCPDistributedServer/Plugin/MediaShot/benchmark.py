@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+MediaShot 调用开销测试
+对比单次调用模式（每次启动一个 python media_shot.py）与常驻工作进程模式（python media_shot.py --worker）
+处理同一批请求的单次耗时，输出延迟分位数与每次调用节省的开销（JSON）
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from PIL import Image, ImageDraw
+
+PLUGIN_DIR = Path(__file__).resolve().parent
+SCRIPT = PLUGIN_DIR / "media_shot.py"
+
+# 测试场景：每个场景生成一条请求（outputPath 由调用方填写）
+SCENARIOS = {
+    "edit": lambda image: {
+        "command": "EditImage", "imagePath": image, "editType": "rectangle",
+        "x": 0.1, "y": 0.1, "width": 0.5, "height": 0.5, "color": "#00FF00"
+    },
+    "text": lambda image: {
+        "command": "EditImage", "imagePath": image, "editType": "text",
+        "x": 0.5, "y": 0.5, "text": "MediaShot 测试", "fontSize": 0.05
+    },
+    "batch": lambda image: {
+        "command": "BatchEditImage", "imagePath": image, "edits": [
+            {"editType": "grayscale"},
+            {"editType": "circle", "x": 0.5, "y": 0.5, "radius": 0.2},
+            {"editType": "text", "x": 0.5, "y": 0.2, "text": "标注", "color": "white"},
+            {"editType": "crop_region", "x": 0.1, "y": 0.1, "width": 0.8, "height": 0.8}
+        ]
+    },
+}
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    rank = (len(values) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+def distribution(values):
+    if not values:
+        return {}
+    return {
+        "p50": round(percentile(values, 50), 2),
+        "p95": round(percentile(values, 95), 2),
+        "mean": round(sum(values) / len(values), 2),
+        "max": round(max(values), 2),
+    }
+
+def make_test_image(path, width, height):
+    """生成带渐变和图形的测试图片"""
+    img = Image.new("RGB", (width, height))
+    draw = ImageDraw.Draw(img)
+    for y in range(0, height, 4):
+        draw.rectangle([0, y, width, y + 4], fill=(y * 255 // height, 80, 255 - y * 255 // height))
+    draw.ellipse([width // 4, height // 4, width * 3 // 4, height * 3 // 4], fill=(240, 200, 40))
+    img.save(path, quality=95)
+
+def build_requests(args, workspace):
+    image = str(Path(args.image).resolve()) if args.image else str(workspace / "input.jpg")
+    if not args.image:
+        make_test_image(image, args.width, args.height)
+    requests = []
+    for i in range(args.requests):
+        request = SCENARIOS[args.scenario](image)
+        request["outputPath"] = str(workspace / "out" / f"{args.scenario}_{i}{Path(image).suffix}")
+        requests.append(request)
+    return requests
+
+def worker_env():
+    env = dict(os.environ)
+    env["PYTHONIOENCODING"] = "utf-8"
+    return env
+
+def run_oneshot(requests, workspace):
+    """每个请求启动一个新进程，与插件管理器的同步调用方式一致"""
+    latencies, errors = [], []
+    for request in requests:
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, str(SCRIPT)],
+            input=json.dumps(request, ensure_ascii=False) + "\n",
+            capture_output=True, text=True, encoding="utf-8", cwd=workspace, env=worker_env()
+        )
+        elapsed = (time.perf_counter() - start) * 1000
+        response = json.loads(result.stdout.strip().splitlines()[-1]) if result.stdout.strip() else {}
+        if response.get("status") == "success":
+            latencies.append(elapsed)
+        else:
+            # 失败的调用往往提前返回，计入平均值会让结果偏快
+            latencies.append(None)
+            errors.append(response.get("error") or result.stderr.strip()[-200:])
+    return latencies, errors
+
+def run_worker(requests, workspace):
+    """启动一个常驻工作进程，逐条发送请求并等待对应的响应行"""
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, str(SCRIPT), "--worker"],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        text=True, encoding="utf-8", cwd=workspace, env=worker_env()
+    )
+    latencies, errors = [], []
+    try:
+        for i, request in enumerate(requests):
+            if i > 0:
+                start = time.perf_counter()
+            process.stdin.write(json.dumps({**request, "requestId": i}, ensure_ascii=False) + "\n")
+            process.stdin.flush()
+            response = json.loads(process.stdout.readline())
+            # 第一条请求包含进程启动耗时
+            elapsed = (time.perf_counter() - start) * 1000
+            if response.get("status") == "success":
+                latencies.append(elapsed)
+            else:
+                latencies.append(None)
+                errors.append(response.get("error"))
+    finally:
+        process.stdin.close()
+        process.wait(timeout=30)
+    return latencies, errors
+
+def summarize(latencies, errors):
+    """latencies 中失败的调用为 None，只统计成功调用的耗时"""
+    succeeded = [ms for ms in latencies if ms is not None]
+    return {
+        "requests": len(latencies),
+        "succeeded": len(succeeded),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "first_call_ms": round(latencies[0], 2) if latencies and latencies[0] is not None else None,
+        "latency_ms": distribution(succeeded),
+        "steady_latency_ms": distribution([ms for ms in latencies[1:] if ms is not None]),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="MediaShot 单次调用与常驻工作进程开销对比")
+    parser.add_argument("-n", "--requests", type=int, default=20, help="每种模式的请求数")
+    parser.add_argument("--scenario", type=str, default="edit", choices=list(SCENARIOS), help="测试场景")
+    parser.add_argument("--image", type=str, default="", help="输入图片，默认生成测试图片")
+    parser.add_argument("--width", type=int, default=1920, help="生成测试图片的宽度")
+    parser.add_argument("--height", type=int, default=1080, help="生成测试图片的高度")
+    parser.add_argument("--modes", type=str, default="oneshot,worker", help="参与测试的模式，可选 oneshot / worker")
+    parser.add_argument("-o", "--output", type=str, default="", help="同时把结果写入该文件")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="mediashot_bench_") as tmp:
+        workspace = Path(tmp)
+        (workspace / "out").mkdir()
+        requests = build_requests(args, workspace)
+        report = {"scenario": args.scenario, "requests": args.requests}
+        modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+        if "oneshot" in modes:
+            report["oneshot"] = summarize(*run_oneshot(requests, workspace))
+        if "worker" in modes:
+            report["worker"] = summarize(*run_worker(requests, workspace))
+
+    if "oneshot" in report and "worker" in report:
+        oneshot_mean = report["oneshot"]["latency_ms"].get("mean")
+        worker_mean = report["worker"]["steady_latency_ms"].get("mean") or report["worker"]["latency_ms"].get("mean")
+        if oneshot_mean and worker_mean:
+            report["overhead_saved_ms_per_call"] = round(oneshot_mean - worker_mean, 2)
+            report["speedup"] = round(oneshot_mean / worker_mean, 2)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text, encoding="utf-8")
+
+    failed = [mode for mode in ("oneshot", "worker") if mode in report and report[mode]["succeeded"] == 0]
+    if failed:
+        sys.exit(f"以下模式没有成功的调用，结果无效: {', '.join(failed)}")
+
+if __name__ == "__main__":
+    main()
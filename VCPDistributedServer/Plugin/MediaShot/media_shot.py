@@ -10,29 +10,97 @@ import os
 import base64
 import subprocess
 import tempfile
+import threading
+import uuid
 from pathlib import Path
 import logging
 import time
 from datetime import datetime
 from PIL import Image, ImageDraw, ImageFont, ImageFilter
 from PIL.Image import Resampling
+from collections import OrderedDict
+import bisect
 import math
+import sqlite3
+import struct
+import unicodedata
 
 # 设置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 依赖检查通过后在常驻工作进程中复用，不再每次请求都执行 ffmpeg -version
+DEPENDENCY_CHECKED = False
+
 def check_dependencies():
     """检查必要的依赖"""
+    global DEPENDENCY_CHECKED
+    if DEPENDENCY_CHECKED:
+        return True, "FFmpeg可用"
     try:
-        result = subprocess.run(['ffmpeg', '-version'], 
+        # 常驻模式下本进程的 stdin 是请求管道，子进程一律不继承，避免 FFmpeg 读走请求行
+        result = subprocess.run(['ffmpeg', '-version'], stdin=subprocess.DEVNULL,
                               capture_output=True, text=True, timeout=5)
         if result.returncode != 0:
             return False, "FFmpeg未安装或不可用"
+        DEPENDENCY_CHECKED = True
         return True, "FFmpeg可用"
     except (subprocess.TimeoutExpired, FileNotFoundError):
         return False, "FFmpeg未安装或不可用"
 
+class DecodedImageCache:
+    """已解码图片的内存缓存，键为 (绝对路径, 文件大小, 修改时间)，按像素字节数做LRU淘汰
+    max_bytes 为 0 时不缓存（单次调用模式），常驻工作进程中才启用"""
+    
+    def __init__(self, max_bytes=0):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> 已解码的 Image
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+    
+    def open(self, image_path):
+        """返回可自由修改的图片对象：命中时复制缓存中的图片，未命中时从磁盘解码"""
+        if self.max_bytes <= 0:
+            return Image.open(image_path)
+        
+        stat = os.stat(image_path)
+        key = (os.path.abspath(image_path), stat.st_size, stat.st_mtime_ns)
+        cached = self.entries.get(key)
+        if cached is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return cached.copy()
+        
+        self.misses += 1
+        with Image.open(image_path) as img:
+            img.load()
+            decoded = img.copy()
+        
+        size = self.image_bytes(decoded)
+        if size <= self.max_bytes:
+            self.entries[key] = decoded
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.total_bytes -= self.image_bytes(evicted)
+        return decoded.copy()
+    
+    @staticmethod
+    def image_bytes(img):
+        return img.width * img.height * len(img.getbands())
+    
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+IMAGE_CACHE = DecodedImageCache()
+
 def format_time_ms(timestamp_ms):
     """将毫秒转换为FFmpeg时间格式"""
     seconds = timestamp_ms / 1000.0
@@ -41,24 +109,284 @@ def format_time_ms(timestamp_ms):
     remaining_seconds = seconds % 60
     return f"{hours:02d}:{minutes:02d}:{remaining_seconds:06.3f}"
 
+# ffprobe 缓存数据格式版本，解析逻辑变化时递增以丢弃旧记录
+MEDIA_CACHE_VERSION = 1
+# 数据库中最多保留的记录数，超出后按最近使用时间淘汰
+MEDIA_CACHE_MAX_ROWS = 5000
+# 进程内保留的记录数
+MEDIA_CACHE_MEMORY_ENTRIES = 256
+
+def parse_frame_rate(rate):
+    """把 ffprobe 的 "30000/1001" 形式帧率转换为浮点数，无法识别时返回 None"""
+    try:
+        num, _, den = str(rate).partition('/')
+        num, den = float(num), float(den or 1)
+    except ValueError:
+        return None
+    if num <= 0 or den <= 0:
+        return None
+    return round(num / den, 3)
+
+def parse_seconds_ms(value):
+    """把 ffprobe 输出的秒数字符串转换为毫秒，N/A 或缺失时返回 None"""
+    try:
+        return int(float(value) * 1000)
+    except (TypeError, ValueError):
+        return None
+
+def summarize_stream(stream):
+    """从 ffprobe 的流信息中提取常用字段"""
+    summary = {
+        "index": stream.get('index'),
+        "codec_type": stream.get('codec_type'),
+        "codec_name": stream.get('codec_name'),
+        "profile": stream.get('profile'),
+        "bit_rate": int(stream['bit_rate']) if str(stream.get('bit_rate', '')).isdigit() else None,
+        "duration_ms": parse_seconds_ms(stream.get('duration')),
+    }
+    if stream.get('codec_type') == 'video':
+        rotation = stream.get('tags', {}).get('rotate')
+        for side_data in stream.get('side_data_list', []):
+            if 'rotation' in side_data:
+                rotation = side_data['rotation']
+        summary.update({
+            "width": stream.get('width'),
+            "height": stream.get('height'),
+            "pix_fmt": stream.get('pix_fmt'),
+            "frame_rate": parse_frame_rate(stream.get('avg_frame_rate')) or parse_frame_rate(stream.get('r_frame_rate')),
+            "nb_frames": int(stream['nb_frames']) if str(stream.get('nb_frames', '')).isdigit() else None,
+            "rotation": int(float(rotation)) if rotation is not None else 0,
+            # 音频文件中的封面图也是视频流
+            "attached_pic": bool(stream.get('disposition', {}).get('attached_pic')),
+        })
+    elif stream.get('codec_type') == 'audio':
+        summary.update({
+            "sample_rate": int(stream['sample_rate']) if str(stream.get('sample_rate', '')).isdigit() else None,
+            "channels": stream.get('channels'),
+            "channel_layout": stream.get('channel_layout'),
+        })
+    return {key: value for key, value in summary.items() if value is not None}
+
+def run_ffprobe(file_path):
+    """调用 ffprobe 读取容器与各流的信息"""
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-show_format',
+        '-show_streams',
+        '-of', 'json',
+        file_path
+    ]
+    try:
+        result = subprocess.run(cmd, stdin=subprocess.DEVNULL, capture_output=True, text=True, encoding='utf-8', errors='replace', timeout=10)
+    except subprocess.TimeoutExpired:
+        raise RuntimeError("读取媒体信息超时")
+    if result.returncode != 0:
+        raise RuntimeError(f"FFprobe执行失败: {result.stderr}")
+    
+    data = json.loads(result.stdout or '{}')
+    fmt = data.get('format', {})
+    streams = [summarize_stream(stream) for stream in data.get('streams', [])]
+    video = next((s for s in streams if s.get('codec_type') == 'video' and not s.get('attached_pic')), None)
+    audio = next((s for s in streams if s.get('codec_type') == 'audio'), None)
+    return {
+        "format_name": fmt.get('format_name'),
+        "duration_ms": parse_seconds_ms(fmt.get('duration')),
+        "bit_rate": int(fmt['bit_rate']) if str(fmt.get('bit_rate', '')).isdigit() else None,
+        "streams": streams,
+        "video_stream": video['index'] if video else None,
+        "audio_stream": audio['index'] if audio else None,
+        "frame_rate": video.get('frame_rate') if video else None,
+    }
+
+def probe_keyframes(file_path, stream_index):
+    """读取视频流中所有关键帧的时间（毫秒）；只解析数据包标记，不解码画面"""
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-select_streams', str(stream_index),
+        '-show_entries', 'packet=pts_time,flags',
+        '-of', 'csv=p=0',
+        file_path
+    ]
+    try:
+        result = subprocess.run(cmd, stdin=subprocess.DEVNULL, capture_output=True, text=True, encoding='utf-8', errors='replace', timeout=60)
+    except subprocess.TimeoutExpired:
+        raise RuntimeError("读取关键帧索引超时")
+    if result.returncode != 0:
+        raise RuntimeError(f"FFprobe执行失败: {result.stderr}")
+    
+    keyframes = set()
+    for line in result.stdout.splitlines():
+        pts_time, _, flags = line.strip().partition(',')
+        timestamp = parse_seconds_ms(pts_time)
+        if 'K' in flags and timestamp is not None:
+            keyframes.add(timestamp)
+    return sorted(keyframes)
+
+class MediaProbeCache:
+    """ffprobe 结果缓存，键为 (绝对路径, 文件大小, 修改时间)
+    进程内保留最近使用的记录，并持久化到本地 SQLite 数据库供后续调用复用；db_path 为空时只在进程内缓存"""
+    
+    def __init__(self, db_path=""):
+        self.db_path = db_path
+        self.conn = None
+        self.entries = OrderedDict()  # 绝对路径 -> (size, mtime_ns, info, keyframes)
+        self.hits = 0
+        self.misses = 0
+    
+    def connect(self):
+        """首次使用时打开数据库；打开失败时退化为只在进程内缓存"""
+        if self.conn is None and self.db_path:
+            try:
+                self.conn = sqlite3.connect(self.db_path, timeout=5)
+                self.conn.execute(
+                    "CREATE TABLE IF NOT EXISTS media_info ("
+                    "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, version INTEGER, "
+                    "info TEXT, keyframes TEXT, used REAL)"
+                )
+                self.conn.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"无法打开媒体信息缓存 {self.db_path}: {e}")
+                self.conn = None
+                self.db_path = ""
+        return self.conn
+    
+    def lookup(self, path, size, mtime_ns):
+        entry = self.entries.get(path)
+        if entry is not None and entry[0] == size and entry[1] == mtime_ns:
+            self.entries.move_to_end(path)
+            return entry
+        
+        conn = self.connect()
+        if conn is None:
+            return None
+        try:
+            row = conn.execute(
+                "SELECT info, keyframes FROM media_info WHERE path = ? AND size = ? AND mtime_ns = ? AND version = ?",
+                (path, size, mtime_ns, MEDIA_CACHE_VERSION)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE media_info SET used = ? WHERE path = ?", (time.time(), path))
+            conn.commit()
+            entry = (size, mtime_ns, json.loads(row[0]), json.loads(row[1]) if row[1] else None)
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning(f"读取媒体信息缓存失败: {e}")
+            return None
+        self.remember(path, entry)
+        return entry
+    
+    def remember(self, path, entry):
+        self.entries[path] = entry
+        self.entries.move_to_end(path)
+        while len(self.entries) > MEDIA_CACHE_MEMORY_ENTRIES:
+            self.entries.popitem(last=False)
+    
+    def store(self, path, entry):
+        self.remember(path, entry)
+        conn = self.connect()
+        if conn is None:
+            return
+        size, mtime_ns, info, keyframes = entry
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO media_info (path, size, mtime_ns, version, info, keyframes, used) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (path, size, mtime_ns, MEDIA_CACHE_VERSION, json.dumps(info, ensure_ascii=False),
+                 json.dumps(keyframes) if keyframes is not None else None, time.time())
+            )
+            conn.execute(
+                "DELETE FROM media_info WHERE path IN (SELECT path FROM media_info ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                (MEDIA_CACHE_MAX_ROWS,)
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"写入媒体信息缓存失败: {e}")
+    
+    def get(self, file_path, keyframes=False):
+        """返回 (媒体信息, 是否命中缓存)；keyframes 为 True 时附带关键帧索引（首次需要额外读取一遍数据包）"""
+        if not os.path.isfile(file_path):
+            raise ValueError(f"媒体文件不存在: {file_path}")
+        path = os.path.abspath(file_path)
+        stat = os.stat(path)
+        entry = self.lookup(path, stat.st_size, stat.st_mtime_ns)
+        cached = entry is not None and (not keyframes or entry[3] is not None)
+        
+        if cached:
+            self.hits += 1
+        else:
+            self.misses += 1
+            info = entry[2] if entry is not None else run_ffprobe(path)
+            keyframe_list = entry[3] if entry is not None else None
+            if keyframes and keyframe_list is None:
+                keyframe_list = probe_keyframes(path, info['video_stream']) if info.get('video_stream') is not None else []
+            entry = (stat.st_size, stat.st_mtime_ns, info, keyframe_list)
+            self.store(path, entry)
+        
+        media_info = dict(entry[2], path=path, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+        if keyframes:
+            media_info["keyframes_ms"] = entry[3]
+        return media_info, cached
+    
+    def stats(self):
+        return {
+            "db_path": self.db_path,
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+MEDIA_CACHE = None
+
+def resolve_cache_path(path):
+    """缓存文件路径：相对路径基于插件目录，并确保所在目录存在；留空表示不持久化"""
+    if not path:
+        return ""
+    if not os.path.isabs(path):
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    except OSError as e:
+        logger.warning(f"无法创建缓存目录 {os.path.dirname(path)}: {e}")
+    return path
+
+def get_media_cache():
+    """返回进程内唯一的媒体信息缓存"""
+    global MEDIA_CACHE
+    if MEDIA_CACHE is None:
+        MEDIA_CACHE = MediaProbeCache(resolve_cache_path(os.getenv('MEDIA_CACHE_DB', 'cache/media_cache.db')))
+    return MEDIA_CACHE
+
+def probe_media(file_path, keyframes=False):
+    """读取媒体信息（时长、各流编码、帧率，可选关键帧索引），优先使用缓存"""
+    return get_media_cache().get(file_path, keyframes)[0]
+
 def get_media_duration(file_path):
     """获取媒体文件的时长（毫秒）"""
     try:
-        cmd = [
-            'ffprobe',
-            '-v', 'quiet',
-            '-show_entries', 'format=duration',
-            '-of', 'csv=p=0',
-            file_path
-        ]
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
-        if result.returncode == 0:
-            duration_seconds = float(result.stdout.strip())
-            return int(duration_seconds * 1000)
-        return None
+        return probe_media(file_path)["duration_ms"]
     except Exception:
         return None
 
+def probe_video_stream(file_path):
+    """获取视频流的输出尺寸（已考虑旋转元数据）与时长（毫秒）"""
+    info = probe_media(file_path)
+    stream = next((s for s in info['streams'] if s['index'] == info.get('video_stream')), None)
+    if stream is None or not stream.get('width') or not stream.get('height'):
+        raise RuntimeError("文件中没有视频流")
+    width, height = int(stream['width']), int(stream['height'])
+    
+    # FFmpeg 默认按旋转元数据自动旋转画面，旋转90度时输出宽高互换
+    if abs(stream.get('rotation', 0)) % 180 == 90:
+        width, height = height, width
+    
+    return {
+        "width": width,
+        "height": height,
+        "duration_ms": info['duration_ms']
+    }
+
+
 def capture_frame(video_path, timestamp_ms, output_path=None, quality=None, format_type=None):
     """从视频中捕获指定时间点的帧"""
     
@@ -123,7 +451,7 @@ def capture_frame(video_path, timestamp_ms, output_path=None, quality=None, form
     
     # 执行命令
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+        result = subprocess.run(cmd, stdin=subprocess.DEVNULL, capture_output=True, text=True, timeout=30)
         if result.returncode != 0:
             raise RuntimeError(f"FFmpeg执行失败: {result.stderr}")
         
@@ -137,6 +465,270 @@ def capture_frame(video_path, timestamp_ms, output_path=None, quality=None, form
     except Exception as e:
         raise RuntimeError(f"截图过程中发生错误: {str(e)}")
 
+def parse_timestamps(timestamps):
+    """解析时间戳列表，支持数组、JSON数组字符串或逗号分隔的字符串"""
+    if isinstance(timestamps, str):
+        text = timestamps.strip()
+        if text.startswith('['):
+            try:
+                timestamps = json.loads(text)
+            except json.JSONDecodeError:
+                raise ValueError("timestampsMs参数必须是有效的JSON数组或逗号分隔的整数")
+        else:
+            timestamps = [part for part in text.replace('，', ',').split(',') if part.strip()]
+    if not isinstance(timestamps, list) or len(timestamps) == 0:
+        raise ValueError("timestampsMs必须是非空的时间戳列表")
+    try:
+        timestamps = [int(float(ts)) for ts in timestamps]
+    except (ValueError, TypeError):
+        raise ValueError("时间戳必须是正整数（毫秒）")
+    if any(ts < 0 for ts in timestamps):
+        raise ValueError("时间戳必须是正整数（毫秒）")
+    return timestamps
+
+# 相邻时间戳间隔超过该值（毫秒）时分开 seek，而不是把中间的内容全部解码
+CAPTURE_SEEK_GAP_MS = 5000
+
+def group_timestamps(timestamps_ms, gap_ms=CAPTURE_SEEK_GAP_MS):
+    """把有序时间戳按间隔分组，每组用一次 seek + 解码完成"""
+    groups = [[timestamps_ms[0]]]
+    for ts in timestamps_ms[1:]:
+        if ts - groups[-1][-1] > gap_ms:
+            groups.append([ts])
+        else:
+            groups[-1].append(ts)
+    return groups
+
+def decode_selected_frames(video_path, stream, seek_ms, span_seconds, select_expr, frame_cap, save_frame):
+    """从 seek_ms 开始解码并按 select_expr 选帧，原始帧通过管道传回后交给 save_frame 保存；
+    返回 (保存的路径列表, 每帧相对 seek 点的时间（秒）, 是否超时, 返回码, stderr 末尾)"""
+    # 构建FFmpeg命令：选帧后输出 rgb24 原始帧到管道，showinfo 在 stderr 中给出每帧的时间
+    cmd = ['ffmpeg', '-hide_banner', '-nostdin', '-nostats', '-ss', format_time_ms(seek_ms)]
+    if span_seconds is not None:
+        cmd += ['-t', f"{span_seconds:.3f}"]
+    cmd += [
+        '-i', video_path,
+        '-vf', f"select='{select_expr}',showinfo",
+        '-fps_mode', 'passthrough',
+        '-frames:v', str(frame_cap),
+        '-f', 'rawvideo',
+        '-pix_fmt', 'rgb24',
+        'pipe:1'
+    ]
+    
+    width, height = stream["width"], stream["height"]
+    frame_size = width * height * 3
+    frame_times = []  # 每个输出帧的时间（相对于 seek 点，秒）
+    stderr_lines = []
+    
+    process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    
+    def read_stderr():
+        for raw_line in process.stderr:
+            line = raw_line.decode('utf-8', errors='replace')
+            if 'showinfo' in line and 'pts_time:' in line:
+                try:
+                    frame_times.append(float(line.split('pts_time:', 1)[1].split()[0]))
+                except (ValueError, IndexError):
+                    pass
+            else:
+                stderr_lines.append(line)
+                del stderr_lines[:-50]
+    
+    timed_out = threading.Event()
+    
+    def kill_on_timeout():
+        timed_out.set()
+        process.kill()
+    
+    stderr_thread = threading.Thread(target=read_stderr, daemon=True)
+    stderr_thread.start()
+    timer = threading.Timer(120, kill_on_timeout)
+    timer.start()
+    
+    saved_paths = []
+    try:
+        # 边解码边编码：每读满一帧就保存
+        while len(saved_paths) < frame_cap:
+            data = bytearray()
+            while len(data) < frame_size:
+                chunk = process.stdout.read(frame_size - len(data))
+                if not chunk:
+                    break
+                data += chunk
+            if len(data) < frame_size:
+                break
+            frame = Image.frombuffer('RGB', (width, height), bytes(data), 'raw', 'RGB', 0, 1)
+            saved_paths.append(save_frame(frame))
+        process.stdout.close()
+        process.wait()
+    finally:
+        timer.cancel()
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        stderr_thread.join(timeout=5)
+    
+    # showinfo 给出的时间与输出帧一一对应时才使用
+    frame_times = frame_times[:len(saved_paths)]
+    if len(frame_times) != len(saved_paths):
+        frame_times = None
+    return saved_paths, frame_times, timed_out.is_set(), process.returncode, ''.join(stderr_lines[-10:])
+
+def capture_frames(video_path, timestamps_ms=None, interval_ms=None, scene_threshold=None,
+                   start_ms=None, end_ms=None, max_frames=None, output_dir=None,
+                   quality=None, format_type=None):
+    """用尽量少的 FFmpeg 解码截取多帧：按时间戳列表、固定间隔或场景切换选帧，
+    相距较远的时间戳分组各自 seek，原始帧通过管道传回后在 Python 中编码保存，返回每一帧的信息列表"""
+    
+    # 获取配置
+    config_quality = int(os.getenv('OUTPUT_QUALITY', '100'))
+    config_format = os.getenv('OUTPUT_FORMAT', 'jpg')
+    frame_limit = int(os.getenv('MAX_CAPTURE_FRAMES', '30'))
+    
+    quality = quality if quality is not None else config_quality
+    format_type = format_type if format_type is not None else config_format
+    
+    # 验证参数
+    if not os.path.exists(video_path):
+        raise FileNotFoundError(f"视频文件不存在: {video_path}")
+    
+    try:
+        quality = int(quality)
+    except (ValueError, TypeError):
+        raise ValueError("图片质量必须是1-100之间的整数")
+    if not 1 <= quality <= 100:
+        raise ValueError("图片质量必须在1-100之间")
+    
+    if format_type not in ['jpg', 'png']:
+        raise ValueError("输出格式必须是jpg或png")
+    
+    modes = [m for m in (timestamps_ms, interval_ms, scene_threshold) if m is not None]
+    if len(modes) != 1:
+        raise ValueError("timestampsMs、intervalMs和sceneThreshold必须且只能指定其中一个")
+    
+    try:
+        max_frames = int(max_frames) if max_frames is not None else min(10, frame_limit)
+        start_ms = int(start_ms) if start_ms is not None else 0
+        end_ms = int(end_ms) if end_ms is not None else None
+    except (ValueError, TypeError):
+        raise ValueError("maxFrames、startMs和endMs必须是整数")
+    if not 1 <= max_frames <= frame_limit:
+        raise ValueError(f"maxFrames必须在1-{frame_limit}之间")
+    if start_ms < 0:
+        raise ValueError("开始时间必须是非负整数")
+    if end_ms is not None and end_ms <= start_ms:
+        raise ValueError("结束时间必须大于开始时间")
+    
+    stream = probe_video_stream(video_path)
+    duration_ms = stream["duration_ms"]
+    
+    # 间隔模式转换为时间戳列表
+    if interval_ms is not None:
+        try:
+            interval_ms = int(interval_ms)
+        except (ValueError, TypeError):
+            raise ValueError("intervalMs必须是正整数（毫秒）")
+        if interval_ms <= 0:
+            raise ValueError("intervalMs必须是正整数（毫秒）")
+        stop_ms = min(end_ms, duration_ms) if end_ms is not None and duration_ms else (end_ms or duration_ms)
+        if stop_ms is None:
+            raise ValueError("无法获取视频时长，请指定endMs")
+        timestamps_ms = list(range(start_ms, stop_ms, interval_ms)[:max_frames])
+        if not timestamps_ms:
+            raise ValueError("指定的时间范围内没有可截取的帧")
+    
+    if timestamps_ms is not None:
+        timestamps_ms = sorted(set(parse_timestamps(timestamps_ms)))
+        if len(timestamps_ms) > frame_limit:
+            raise ValueError(f"一次最多截取{frame_limit}帧")
+        if duration_ms and timestamps_ms[0] >= duration_ms:
+            raise ValueError(f"时间戳超出视频长度（{duration_ms}ms）")
+        # 每组从第一个时间戳开始解码，到最后一个时间戳后停止；每个时间戳选中第一帧时间不早于它的帧
+        runs = []
+        for group in group_timestamps(timestamps_ms):
+            terms = []
+            for ts in group:
+                offset = (ts - group[0]) / 1000.0
+                terms.append(f"if(isnan(prev_t),gte(t,{offset:.3f}),gte(t,{offset:.3f})*lt(prev_t,{offset:.3f}))")
+            runs.append((group, f"gt({'+'.join(terms)},0)", (group[-1] - group[0]) / 1000.0 + 1.0, len(group)))
+    else:
+        try:
+            scene_threshold = float(scene_threshold)
+        except (ValueError, TypeError):
+            raise ValueError("sceneThreshold必须是0-1之间的数字")
+        if not 0 < scene_threshold < 1:
+            raise ValueError("sceneThreshold必须是0-1之间的数字")
+        span_seconds = (end_ms - start_ms) / 1000.0 if end_ms is not None else None
+        runs = [([start_ms], f"gt(scene,{scene_threshold})", span_seconds, max_frames)]
+    
+    # 输出目录与文件名前缀
+    if output_dir is None:
+        output_dir = os.path.join(os.getcwd(), "images")
+    os.makedirs(output_dir, exist_ok=True)
+    video_filename = os.path.splitext(os.path.basename(video_path))[0]
+    safe_filename = "".join(c for c in video_filename if c.isalnum() or c in (' ', '-', '_', '.')).rstrip()
+    # 毫秒时间戳加随机标记：同一视频的多次调用（常驻进程池中可能并行）不会写到同一个文件
+    current_time = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
+    call_token = uuid.uuid4().hex[:8]
+    saved_count = 0
+    
+    def save_frame(frame, seek_ms):
+        nonlocal saved_count
+        saved_count += 1
+        frame_path = os.path.join(output_dir, f"{safe_filename}_frames_{seek_ms}_{current_time}_{call_token}_{saved_count:02d}.{format_type}")
+        if format_type == 'jpg':
+            frame.save(frame_path, format='JPEG', quality=quality)
+        else:
+            frame.save(frame_path, format='PNG')
+        return frame_path
+    
+    frames = []
+    failure = None
+    for group, select_expr, span_seconds, frame_cap in runs:
+        seek_ms = group[0]
+        if timestamps_ms is not None and duration_ms and seek_ms >= duration_ms:
+            # 整组都晚于视频结尾，不必启动 FFmpeg
+            frames.extend({"requested_ms": ts, "frame_ms": None, "path": None} for ts in group)
+            continue
+        saved_paths, frame_times, timed_out, returncode, stderr_tail = decode_selected_frames(
+            video_path, stream, seek_ms, span_seconds, select_expr, frame_cap,
+            lambda frame: save_frame(frame, seek_ms))
+        if not saved_paths:
+            if timed_out:
+                failure = "截图操作超时"
+            elif returncode != 0:
+                failure = f"FFmpeg执行失败: {stderr_tail}"
+        
+        if timestamps_ms is not None:
+            for order, ts in enumerate(group):
+                if frame_times is not None:
+                    # 与选帧表达式相同：第一帧时间不早于该时间戳的帧；多个时间戳可能共用同一帧
+                    index = bisect.bisect_left(frame_times, round((ts - seek_ms) / 1000.0, 3) - 1e-6)
+                else:
+                    # 没有 showinfo 时间时按顺序对应请求的时间
+                    index = order
+                if index >= len(saved_paths):
+                    # 时间戳晚于视频最后一帧
+                    frames.append({"requested_ms": ts, "frame_ms": None, "path": None})
+                    continue
+                frames.append({
+                    "requested_ms": ts,
+                    "frame_ms": seek_ms + int(round(frame_times[index] * 1000)) if frame_times is not None else ts,
+                    "path": saved_paths[index]
+                })
+        else:
+            for index, frame_path in enumerate(saved_paths):
+                frames.append({
+                    "requested_ms": None,
+                    "frame_ms": seek_ms + int(round(frame_times[index] * 1000)) if frame_times is not None else None,
+                    "path": frame_path
+                })
+    
+    if saved_count == 0:
+        raise RuntimeError(failure or "指定的时间点或范围内没有截取到任何帧")
+    return frames
+
 def extract_video_clip(video_path, start_ms, end_ms, output_path=None, quality="medium"):
     """从视频中截取指定时间段的片段"""
     
@@ -206,7 +798,7 @@ def extract_video_clip(video_path, start_ms, end_ms, output_path=None, quality="
     
     # 执行命令
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
+        result = subprocess.run(cmd, stdin=subprocess.DEVNULL, capture_output=True, text=True, timeout=120)
         if result.returncode != 0:
             raise RuntimeError(f"FFmpeg执行失败: {result.stderr}")
         
@@ -280,7 +872,7 @@ def extract_audio_clip(audio_path, start_ms, end_ms, output_path=None, format_ty
     
     # 执行命令
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+        result = subprocess.run(cmd, stdin=subprocess.DEVNULL, capture_output=True, text=True, timeout=60)
         if result.returncode != 0:
             raise RuntimeError(f"FFmpeg执行失败: {result.stderr}")
         
@@ -335,7 +927,7 @@ def crop_image(image_path, x, y, width, height, output_path=None):
     
     try:
         # 打开图片
-        with Image.open(image_path) as img:
+        with IMAGE_CACHE.open(image_path) as img:
             img_width, img_height = img.size
             
             # 计算实际像素坐标
@@ -398,52 +990,306 @@ def get_color_rgb(color_input):
     
     return (255, 0, 0)  # 默认红色
 
-def get_system_font(font_size):
-    """获取系统可用字体，支持多语言文字渲染"""
-    # 系统字体搜索路径（按优先级排序）
-    font_paths = [
-        # macOS 系统字体
-        "/System/Library/Fonts/Hiragino Sans GB.ttc",  # 优先使用稳定的中文字体
-        "/System/Library/Fonts/PingFang.ttc",
-        "/System/Library/Fonts/STHeiti Light.ttc",
-        "/System/Library/Fonts/STHeiti Medium.ttc",
-        "/System/Library/Fonts/Arial Unicode MS.ttf",
-        "/System/Library/Fonts/Helvetica.ttc",
-        # Linux 系统字体
-        "/usr/share/fonts/truetype/noto/NotoSansCJK-Regular.ttc",  # 优先使用CJK字体
-        "/usr/share/fonts/truetype/noto/NotoSans-Regular.ttf",
-        "/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc",
-        "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
-        "/usr/share/fonts/truetype/arphic/ukai.ttc",
-        "/usr/share/fonts/truetype/arphic/uming.ttc",
-        "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
-        "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
-        # Windows 系统字体
-        "C:/Windows/Fonts/msyh.ttc",  # 优先使用微软雅黑
-        "C:/Windows/Fonts/simsun.ttc",
-        "C:/Windows/Fonts/simhei.ttf",
-        "C:/Windows/Fonts/arial.ttf",
-        "C:/Windows/Fonts/tahoma.ttf",
-        # 日文字体
-        "/System/Library/Fonts/Hiragino Kaku Gothic ProN.ttc",  # macOS
-        "C:/Windows/Fonts/msgothic.ttc",  # Windows
-        "/usr/share/fonts/truetype/takao-gothic/TakaoGothic.ttf",  # Linux
-        # 韩文字体
-        "/System/Library/Fonts/AppleSDGothicNeo.ttc",  # macOS
-        "C:/Windows/Fonts/malgun.ttf",  # Windows
-        "/usr/share/fonts/truetype/noto/NotoSansCJK-Regular.ttc"  # Linux
-    ]
-    
-    # 系统字体加载逻辑
-    for font_path in font_paths:
-        if os.path.exists(font_path):
+# 系统字体搜索路径（按优先级排序），同时也是逐字回退时的查找顺序
+FONT_PATHS = [
+    # macOS 系统字体
+    "/System/Library/Fonts/Hiragino Sans GB.ttc",  # 优先使用稳定的中文字体
+    "/System/Library/Fonts/PingFang.ttc",
+    "/System/Library/Fonts/STHeiti Light.ttc",
+    "/System/Library/Fonts/STHeiti Medium.ttc",
+    "/System/Library/Fonts/Arial Unicode MS.ttf",
+    "/System/Library/Fonts/Helvetica.ttc",
+    # Linux 系统字体
+    "/usr/share/fonts/truetype/noto/NotoSansCJK-Regular.ttc",  # 优先使用CJK字体
+    "/usr/share/fonts/truetype/noto/NotoSans-Regular.ttf",
+    "/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+    "/usr/share/fonts/truetype/arphic/ukai.ttc",
+    "/usr/share/fonts/truetype/arphic/uming.ttc",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
+    # Windows 系统字体
+    "C:/Windows/Fonts/msyh.ttc",  # 优先使用微软雅黑
+    "C:/Windows/Fonts/simsun.ttc",
+    "C:/Windows/Fonts/simhei.ttf",
+    "C:/Windows/Fonts/arial.ttf",
+    "C:/Windows/Fonts/tahoma.ttf",
+    # 日文字体
+    "/System/Library/Fonts/Hiragino Kaku Gothic ProN.ttc",  # macOS
+    "C:/Windows/Fonts/msgothic.ttc",  # Windows
+    "/usr/share/fonts/truetype/takao-gothic/TakaoGothic.ttf",  # Linux
+    # 韩文字体
+    "/System/Library/Fonts/AppleSDGothicNeo.ttc",  # macOS
+    "C:/Windows/Fonts/malgun.ttf",  # Windows
+    # 符号与 emoji 字体（只用于回退）
+    "C:/Windows/Fonts/seguiemj.ttf",
+    "C:/Windows/Fonts/seguisym.ttf",
+    "/System/Library/Fonts/Apple Color Emoji.ttc",
+    "/usr/share/fonts/truetype/noto/NotoColorEmoji.ttf",
+    "/usr/share/fonts/truetype/ancient-scripts/Symbola_hint.ttf",
+]
+
+def read_font_coverage(font_path, font_index=0):
+    """读取字体文件的 cmap 表，返回字体覆盖的 Unicode 区间列表 [[起始码位, 结束码位], ...]"""
+    with open(font_path, 'rb') as f:
+        def read(offset, size):
+            f.seek(offset)
+            chunk = f.read(size)
+            if len(chunk) < size:
+                raise ValueError("字体文件不完整")
+            return chunk
+        
+        # TTC 字体集合默认使用第一个字体，与 ImageFont.truetype 一致
+        base = 0
+        if read(0, 4) == b'ttcf':
+            num_fonts = struct.unpack('>I', read(8, 4))[0]
+            if font_index >= num_fonts:
+                raise ValueError(f"字体集合中没有第{font_index}个字体")
+            base = struct.unpack('>I', read(12 + 4 * font_index, 4))[0]
+        
+        num_tables = struct.unpack('>H', read(base + 4, 2))[0]
+        cmap_offset = None
+        for i in range(num_tables):
+            tag, _, offset, _ = struct.unpack('>4sIII', read(base + 12 + 16 * i, 16))
+            if tag == b'cmap':
+                cmap_offset = offset
+                break
+        if cmap_offset is None:
+            return []
+        
+        num_subtables = struct.unpack('>H', read(cmap_offset + 2, 2))[0]
+        subtables = {}
+        for i in range(num_subtables):
+            platform_id, encoding_id, offset = struct.unpack('>HHI', read(cmap_offset + 4 + 8 * i, 8))
+            subtables.setdefault((platform_id, encoding_id), cmap_offset + offset)
+        
+        # 优先使用完整 Unicode 子表（格式12），其次是 BMP 子表（格式4/6）
+        ranges = []
+        for key in [(3, 10), (0, 6), (0, 4), (3, 1), (0, 3), (0, 2), (0, 1), (0, 0)]:
+            if key not in subtables:
+                continue
+            offset = subtables[key]
+            table_format = struct.unpack('>H', read(offset, 2))[0]
+            
+            if table_format == 12:
+                num_groups = struct.unpack('>I', read(offset + 12, 4))[0]
+                for start, end, glyph in struct.iter_unpack('>III', read(offset + 16, 12 * num_groups)):
+                    if glyph == 0:
+                        start += 1  # 映射到 .notdef 的码位不算覆盖
+                    if start <= end:
+                        ranges.append([start, end])
+                break
+            
+            if table_format == 4:
+                seg_x2 = struct.unpack('>H', read(offset + 6, 2))[0]
+                seg_count = seg_x2 // 2
+                ends = struct.unpack(f'>{seg_count}H', read(offset + 14, seg_x2))
+                starts = struct.unpack(f'>{seg_count}H', read(offset + 16 + seg_x2, seg_x2))
+                deltas = struct.unpack(f'>{seg_count}h', read(offset + 16 + 2 * seg_x2, seg_x2))
+                range_offsets_at = offset + 16 + 3 * seg_x2
+                range_offsets = struct.unpack(f'>{seg_count}H', read(range_offsets_at, seg_x2))
+                
+                for i in range(seg_count):
+                    start, end, delta, range_offset = starts[i], ends[i], deltas[i], range_offsets[i]
+                    if start > end or start == 0xFFFF:
+                        continue
+                    if range_offset == 0:
+                        # 字形号 = 码位 + delta，只有恰好回绕到0的那个码位没有字形
+                        missing = (-delta) & 0xFFFF
+                        if start <= missing <= end:
+                            if start < missing:
+                                ranges.append([start, missing - 1])
+                            if missing < end:
+                                ranges.append([missing + 1, end])
+                        else:
+                            ranges.append([start, end])
+                        continue
+                    glyphs = struct.unpack(
+                        f'>{end - start + 1}H',
+                        read(range_offsets_at + 2 * i + range_offset, 2 * (end - start + 1))
+                    )
+                    for code, glyph in enumerate(glyphs, start):
+                        if glyph != 0 and (glyph + delta) & 0xFFFF != 0:
+                            ranges.append([code, code])
+                break
+            
+            if table_format == 6:
+                # 紧凑格式：从 first_code 开始的连续码位
+                first_code, entry_count = struct.unpack('>HH', read(offset + 6, 4))
+                glyphs = struct.unpack(f'>{entry_count}H', read(offset + 10, 2 * entry_count))
+                ranges.extend([code, code] for code, glyph in enumerate(glyphs, first_code) if glyph != 0)
+                break
+    
+    # 合并相邻区间
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+# 彩色位图 emoji 字体（CBDT/sbix）只有固定字号：NotoColorEmoji 为 109，Apple Color Emoji 为 20-160 中的若干档
+BITMAP_FONT_SIZES = (20, 32, 40, 48, 64, 96, 109, 160)
+
+class ScaledBitmapFont:
+    """按内置字号加载的位图字体，度量按目标字号缩放，绘制时先在内置字号下渲染再缩放贴图"""
+    
+    def __init__(self, font, font_size):
+        self.font = font
+        self.scale = font_size / font.size
+    
+    def getlength(self, text):
+        return self.font.getlength(text) * self.scale
+    
+    def getmetrics(self):
+        ascent, descent = self.font.getmetrics()
+        return int(round(ascent * self.scale)), int(round(descent * self.scale))
+    
+    def render(self, text, fill):
+        """返回 (RGBA 图层, 图层左上角相对于文字起点（上沿）的偏移)"""
+        left, top, right, bottom = self.font.getbbox(text)
+        layer = Image.new('RGBA', (max(1, right - left), max(1, bottom - top)), (0, 0, 0, 0))
+        ImageDraw.Draw(layer).text((-left, -top), text, fill=fill, font=self.font, embedded_color=True)
+        size = (max(1, int(round(layer.width * self.scale))), max(1, int(round(layer.height * self.scale))))
+        return layer.resize(size, Image.LANCZOS), (int(round(left * self.scale)), int(round(top * self.scale)))
+
+class FontRegistry:
+    """系统字体注册表：每个进程只探测一次字体文件并读取其 Unicode 覆盖范围（可持久化到文件），
+    按 (路径, 字号) 缓存 FreeTypeFont，并为文本中的每段字符选择能显示它的字体"""
+    
+    def __init__(self, font_paths, cache_file=""):
+        self.cache_file = cache_file
+        self.coverage = OrderedDict()  # 字体路径 -> (区间起点列表, 区间终点列表)，按优先级排列
+        self.fonts = {}  # (字体路径, 字号) -> FreeTypeFont，加载失败时为 None
+        self.char_fonts = {}  # 码位 -> 第一个覆盖它的字体路径
+        self.build(font_paths)
+    
+    def build(self, font_paths):
+        cached = self.load_cache()
+        entries = {}
+        for font_path in dict.fromkeys(font_paths):
+            try:
+                stat = os.stat(font_path)
+            except OSError:
+                continue
+            entry = cached.get(font_path)
+            if not entry or entry.get("size") != stat.st_size or entry.get("mtime") != stat.st_mtime_ns:
+                try:
+                    ranges = read_font_coverage(font_path)
+                except (OSError, ValueError, struct.error) as e:
+                    logger.info(f"字体覆盖范围读取失败 {os.path.basename(font_path)}: {e}")
+                    ranges = []
+                entry = {"size": stat.st_size, "mtime": stat.st_mtime_ns, "ranges": ranges}
+            entries[font_path] = entry
+            self.coverage[font_path] = ([r[0] for r in entry["ranges"]], [r[1] for r in entry["ranges"]])
+        if entries != cached:
+            self.save_cache(entries)
+    
+    def load_cache(self):
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return {}
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.info(f"字体注册表缓存读取失败，将重新扫描: {e}")
+            return {}
+    
+    def save_cache(self, entries):
+        if not self.cache_file:
+            return
+        try:
+            temp_path = f"{self.cache_file}.{os.getpid()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(entries, f)
+            os.replace(temp_path, self.cache_file)
+        except OSError as e:
+            logger.info(f"字体注册表缓存写入失败: {e}")
+    
+    def covers(self, font_path, code):
+        starts, ends = self.coverage[font_path]
+        i = bisect.bisect_right(starts, code) - 1
+        return i >= 0 and code <= ends[i]
+    
+    def get_font(self, font_path, font_size):
+        """按 (路径, 字号) 返回缓存的字体对象，加载失败返回 None；
+        只有固定字号的位图字体按最接近的内置字号加载，返回 ScaledBitmapFont"""
+        key = (font_path, font_size)
+        if key not in self.fonts:
             try:
-                # 直接加载字体
-                return ImageFont.truetype(font_path, font_size)
+                self.fonts[key] = ImageFont.truetype(font_path, font_size)
             except (OSError, IOError, ValueError) as e:
-                # 记录错误但继续尝试下一个字体
-                logger.info(f"字体加载失败 {os.path.basename(font_path)}: {e}")
+                self.fonts[key] = self.load_bitmap_font(font_path, font_size)
+                if self.fonts[key] is None:
+                    # 记录错误，之后直接跳过该字体
+                    logger.info(f"字体加载失败 {os.path.basename(font_path)}: {e}")
+        return self.fonts[key]
+    
+    def load_bitmap_font(self, font_path, font_size):
+        """依次尝试不小于目标字号的内置字号（缩小比放大清晰），再尝试更小的字号"""
+        larger = [size for size in BITMAP_FONT_SIZES if size >= font_size]
+        smaller = [size for size in reversed(BITMAP_FONT_SIZES) if size < font_size]
+        for size in larger + smaller:
+            try:
+                return ScaledBitmapFont(ImageFont.truetype(font_path, size), font_size)
+            except (OSError, IOError, ValueError):
                 continue
+        return None
+    
+    def primary_font(self, font_size):
+        """按优先级返回第一个能按原字号加载的字体 (路径, 字体)"""
+        for font_path in self.coverage:
+            font = self.get_font(font_path, font_size)
+            if font is not None and not isinstance(font, ScaledBitmapFont):
+                return font_path, font
+        return None, None
+    
+    def font_path_for(self, char):
+        """返回第一个覆盖该字符的字体路径，都不覆盖时返回 None"""
+        code = ord(char)
+        if code not in self.char_fonts:
+            self.char_fonts[code] = next((p for p in self.coverage if self.covers(p, code)), None)
+        return self.char_fonts[code]
+    
+    def split_runs(self, text, font_size):
+        """把文本切分为使用同一字体的连续片段，返回 [(片段文本, 字体)]
+        空白、组合符号和零宽连接符等跟随前一个字符的字体；没有字体覆盖的字符使用首选字体"""
+        primary_path, primary = self.primary_font(font_size)
+        if primary is None:
+            return [(text, None)]
+        
+        runs = []  # [[字体路径, [字符...]]]
+        # 先合成预组合字符（如 e + ◌́ → é），避免组合符号落在不支持它的字体里
+        for char in unicodedata.normalize('NFC', text):
+            category = unicodedata.category(char)
+            if char.isspace() or category[0] == 'M' or category in ('Cc', 'Cf'):
+                font_path = runs[-1][0] if runs else primary_path
+            else:
+                font_path = self.font_path_for(char)
+                if font_path is None or self.get_font(font_path, font_size) is None:
+                    font_path = primary_path
+            if runs and runs[-1][0] == font_path:
+                runs[-1][1].append(char)
+            else:
+                runs.append([font_path, [char]])
+        return [("".join(chars), self.get_font(font_path, font_size)) for font_path, chars in runs]
+
+FONT_REGISTRY = None
+
+def get_font_registry():
+    """返回进程内唯一的字体注册表，首次调用时构建"""
+    global FONT_REGISTRY
+    if FONT_REGISTRY is None:
+        cache_file = resolve_cache_path(os.getenv('FONT_REGISTRY_FILE', 'cache/font_registry.json'))
+        FONT_REGISTRY = FontRegistry(FONT_PATHS, cache_file)
+    return FONT_REGISTRY
+
+def get_system_font(font_size):
+    """获取系统可用字体，支持多语言文字渲染"""
+    _, font = get_font_registry().primary_font(font_size)
+    if font is not None:
+        return font
     
     # 如果都找不到，使用默认字体
     try:
@@ -452,11 +1298,70 @@ def get_system_font(font_size):
         logger.warning("无法加载任何字体，包括默认字体")
         return None
 
-def draw_text(draw, position, text, fill, font):
-    """统一的文本绘制函数"""
+def split_text_runs(text, font_size, font):
+    """按字符覆盖范围为文本分配字体；整段文本都能用同一字体显示时返回 [(text, font)]"""
+    runs = get_font_registry().split_runs(text, font_size)
+    if len(runs) <= 1 or any(run_font is None for _, run_font in runs):
+        return [(text, runs[0][1] if len(runs) == 1 and runs[0][1] is not None else font)]
+    return runs
+
+def layout_text_runs(runs):
+    """把字体片段按换行拆分为多行，每行为 [(文本, 字体)]"""
+    lines = [[]]
+    for run_text, run_font in runs:
+        for i, part in enumerate(run_text.split('\n')):
+            if i > 0:
+                lines.append([])
+            if part:
+                lines[-1].append((part, run_font))
+    return lines
+
+def measure_text_runs(draw, runs, spacing=4):
+    """计算文本片段的边界框，单一字体时与 draw.textbbox 一致"""
+    if len(runs) == 1 and not isinstance(runs[0][1], ScaledBitmapFont):
+        return draw.textbbox((0, 0), runs[0][0], font=runs[0][1])
+    
+    width, height = 0, 0
+    fallback_font = runs[0][1]
+    for line in layout_text_runs(runs):
+        fonts = [run_font for _, run_font in line] or [fallback_font]
+        width = max(width, sum(run_font.getlength(part) for part, run_font in line))
+        height += max(f.getmetrics()[0] for f in fonts) + max(f.getmetrics()[1] for f in fonts) + spacing
+    return (0, 0, int(math.ceil(width)), max(0, height - spacing))
+
+def draw_text_runs(draw, position, runs, fill, spacing=4):
+    """逐段绘制使用不同字体的文本，各段共用同一基线"""
+    if len(runs) == 1 and not isinstance(runs[0][1], ScaledBitmapFont):
+        return draw_text(draw, position, runs[0][0], fill, runs[0][1])
+    
+    x0, y = position
+    fallback_font = runs[0][1]
+    ok = True
+    for line in layout_text_runs(runs):
+        fonts = [run_font for _, run_font in line] or [fallback_font]
+        ascent = max(f.getmetrics()[0] for f in fonts)
+        descent = max(f.getmetrics()[1] for f in fonts)
+        x = x0
+        for part, run_font in line:
+            ok = draw_text(draw, (x, y + ascent), part, fill, run_font, anchor="ls") and ok
+            x += run_font.getlength(part)
+        y += ascent + descent + spacing
+    return ok
+
+def draw_text(draw, position, text, fill, font, anchor=None):
+    """统一的文本绘制函数，彩色字体（emoji）按字体自带的颜色绘制"""
     try:
-        # 统一的文本渲染方式
-        draw.text(position, text, fill=fill, font=font)
+        if isinstance(font, ScaledBitmapFont):
+            # anchor 只支持左上（默认）和左基线（"ls"）
+            layer, (dx, dy) = font.render(text, fill)
+            x, y = position
+            if anchor == "ls":
+                y -= font.getmetrics()[0]
+            draw._image.paste(layer, (int(x) + dx, int(y) + dy), layer)
+            return True
+        # 统一的文本渲染方式，embedded_color 只支持 RGB/RGBA 图像
+        draw.text(position, text, fill=fill, font=font, anchor=anchor,
+                  embedded_color=draw.mode in ('RGB', 'RGBA'))
         return True
     except Exception as e:
         logger.warning(f"文本渲染失败: {e}")
@@ -556,15 +1461,9 @@ def generate_output_path(input_path, operation_suffix, output_dir="images"):
     final_filename = f"{safe_filename}_{operation_suffix}_{current_time}{image_ext}"
     return os.path.join(full_output_dir, final_filename)
 
-def edit_image(image_path, edit_type, x=None, y=None, width=None, height=None, radius=None, 
-               text=None, color="red", font_size_ratio=None, stroke_width_ratio=None, 
-               text_position="center", arrow_end_x=None, arrow_end_y=None, 
-               scale_ratio=None, output_path=None):
-    """在图片指定区域绘制框、圆、箭头或添加文字注释，以及应用特效（按比例参数）"""
-    
-    # 验证参数
-    if not os.path.exists(image_path):
-        raise FileNotFoundError(f"图片文件不存在: {image_path}")
+def validate_edit_params(edit_type, x=None, y=None, width=None, height=None, radius=None,
+                         text=None, arrow_end_x=None, arrow_end_y=None, scale_ratio=None):
+    """验证单个编辑操作的参数，返回转换为数字后的参数"""
     
     if edit_type not in ['rectangle', 'circle', 'text', 'arrow', 'resolution_reduction', 'grayscale', 'crop_region']:
         raise ValueError("编辑类型必须是rectangle、circle、text、arrow、resolution_reduction、grayscale或crop_region")
@@ -582,10 +1481,6 @@ def edit_image(image_path, edit_type, x=None, y=None, width=None, height=None, r
         if not (0 <= x <= 1) or not (0 <= y <= 1):
             raise ValueError("坐标比例必须在0-1之间")
     
-    # 获取配置
-    default_font_size = int(os.getenv('DEFAULT_FONT_SIZE', '20'))
-    default_stroke_width = int(os.getenv('DEFAULT_STROKE_WIDTH', '2'))
-    
     # 验证特定类型的参数
     if edit_type == 'rectangle':
         if width is None or height is None:
@@ -648,11 +1543,162 @@ def edit_image(image_path, edit_type, x=None, y=None, width=None, height=None, r
         if x + width > 1 or y + height > 1:
             raise ValueError("截取区域超出图片边界")
     
+    return {
+        "x": x, "y": y,
+        "width": width, "height": height,
+        "radius": radius, "text": text,
+        "arrow_end_x": arrow_end_x, "arrow_end_y": arrow_end_y,
+        "scale_ratio": scale_ratio
+    }
+
+def apply_edit(img, edit_type, x=None, y=None, width=None, height=None, radius=None,
+               text=None, color="red", font_size_ratio=None, stroke_width_ratio=None,
+               text_position="center", arrow_end_x=None, arrow_end_y=None, scale_ratio=None):
+    """在内存中的图片上应用单个编辑操作（参数需先经过validate_edit_params），返回编辑后的图片
+    特效类操作返回新图片，绘制类操作直接在传入的图片上绘制"""
+    
+    # 获取配置
+    default_font_size = int(os.getenv('DEFAULT_FONT_SIZE', '20'))
+    default_stroke_width = int(os.getenv('DEFAULT_STROKE_WIDTH', '2'))
+    
+    img_width, img_height = img.size
+    
+    # 特效类编辑（分辨率下降、黑白、区域截取）
+    if edit_type == 'resolution_reduction':
+        return apply_resolution_reduction(img, scale_ratio)
+    if edit_type == 'grayscale':
+        return apply_grayscale_effect(img)
+    if edit_type == 'crop_region':
+        return crop_image_region(img, x, y, width, height)
+    
+    draw = ImageDraw.Draw(img)
+    
+    # 获取颜色
+    color_rgb = get_color_rgb(color)
+    
+    # 根据比例值计算实际大小（如果未指定）
+    if stroke_width_ratio is None:
+        if edit_type == 'text':
+            stroke_width = default_stroke_width
+        else:
+            stroke_width = calculate_smart_stroke_width(img_width, img_height)
+    else:
+        # 根据比例和图片对角线长度计算线条粗细
+        diagonal = math.sqrt(img_width ** 2 + img_height ** 2)
+        stroke_width = max(1, int(diagonal * stroke_width_ratio))
+    
+    if font_size_ratio is None:
+        if edit_type == 'text':
+            font_size = calculate_smart_font_size(img_width, img_height)
+        else:
+            font_size = default_font_size
+    else:
+        # 根据比例和图片较小边计算字体大小
+        min_dimension = min(img_width, img_height)
+        font_size = max(12, int(min_dimension * font_size_ratio))
+    
+    if edit_type == 'rectangle':
+        # 计算实际像素坐标
+        left = int(x * img_width)
+        top = int(y * img_height)
+        right = int((x + width) * img_width)
+        bottom = int((y + height) * img_height)
+        
+        # 绘制矩形
+        draw.rectangle([left, top, right, bottom], outline=color_rgb, width=stroke_width)
+    
+    elif edit_type == 'circle':
+        # 计算实际像素坐标
+        center_x = int(x * img_width)
+        center_y = int(y * img_height)
+        radius_px = int(radius * min(img_width, img_height))
+        
+        # 绘制圆形
+        left = center_x - radius_px
+        top = center_y - radius_px
+        right = center_x + radius_px
+        bottom = center_y + radius_px
+        draw.ellipse([left, top, right, bottom], outline=color_rgb, width=stroke_width)
+    
+    elif edit_type == 'text':
+        # 计算实际像素坐标
+        pos_x = int(x * img_width)
+        pos_y = int(y * img_height)
+        
+        # 获取支持多语言的字体，首选字体缺字时逐段回退到覆盖这些字符的字体
+        font = get_system_font(font_size)  # 使用系统字体
+        if font is None:
+            font = ImageFont.load_default()
+        runs = split_text_runs(text, font_size, font)
+        
+        # 根据text_position调整文字位置
+        if text_position != "center":
+            try:
+                # 获取文字边界框来计算偏移
+                bbox = measure_text_runs(draw, runs)
+                text_width = bbox[2] - bbox[0]
+                text_height = bbox[3] - bbox[1]
+                
+                if text_position == "top_left":
+                    pass  # 不需要调整
+                elif text_position == "top_center":
+                    pos_x -= text_width // 2
+                elif text_position == "top_right":
+                    pos_x -= text_width
+                elif text_position == "center_left":
+                    pos_y -= text_height // 2
+                elif text_position == "center":
+                    pos_x -= text_width // 2
+                    pos_y -= text_height // 2
+                elif text_position == "center_right":
+                    pos_x -= text_width
+                    pos_y -= text_height // 2
+                elif text_position == "bottom_left":
+                    pos_y -= text_height
+                elif text_position == "bottom_center":
+                    pos_x -= text_width // 2
+                    pos_y -= text_height
+                elif text_position == "bottom_right":
+                    pos_x -= text_width
+                    pos_y -= text_height
+            except:
+                pass  # 如果计算失败，使用原始位置
+        
+        # 添加文字
+        draw_text_runs(draw, (pos_x, pos_y), runs, color_rgb)
+    
+    elif edit_type == 'arrow':
+        # 计算实际像素坐标
+        start_x = int(x * img_width)
+        start_y = int(y * img_height)
+        end_x = int(arrow_end_x * img_width)
+        end_y = int(arrow_end_y * img_height)
+        
+        # 绘制箭头
+        draw_arrow(draw, start_x, start_y, end_x, end_y, color_rgb, stroke_width)
+    
+    return img
+
+def edit_image(image_path, edit_type, x=None, y=None, width=None, height=None, radius=None, 
+               text=None, color="red", font_size_ratio=None, stroke_width_ratio=None, 
+               text_position="center", arrow_end_x=None, arrow_end_y=None, 
+               scale_ratio=None, output_path=None):
+    """在图片指定区域绘制框、圆、箭头或添加文字注释，以及应用特效（按比例参数）"""
+    
+    # 验证参数
+    if not os.path.exists(image_path):
+        raise FileNotFoundError(f"图片文件不存在: {image_path}")
+    
+    edit_params = validate_edit_params(
+        edit_type, x=x, y=y, width=width, height=height, radius=radius, text=text,
+        arrow_end_x=arrow_end_x, arrow_end_y=arrow_end_y, scale_ratio=scale_ratio
+    )
+    
     # 如果没有指定输出路径，自动生成（使用严格命名规则）
     if output_path is None:
         operation_suffix = edit_type
         if edit_type == 'resolution_reduction':
-            operation_suffix = f"resolution_{int(scale_ratio*100)}pct"
+            operation_suffix = f"resolution_{int(edit_params['scale_ratio']*100)}pct"
         output_path = generate_output_path(image_path, operation_suffix)
     
     # 确保输出目录存在
@@ -662,123 +1708,14 @@ def edit_image(image_path, edit_type, x=None, y=None, width=None, height=None, r
     
     try:
         # 打开图片
-        with Image.open(image_path) as img:
-            img_width, img_height = img.size
-            
-            # 先应用特效类编辑（分辨率下降、黑白、区域截取）
-            if edit_type == 'resolution_reduction':
-                edit_img = apply_resolution_reduction(img, scale_ratio)
-            elif edit_type == 'grayscale':
-                edit_img = apply_grayscale_effect(img)
-            elif edit_type == 'crop_region':
-                edit_img = crop_image_region(img, x, y, width, height)
-            else:
-                # 对于绘制类编辑，创建可编辑的副本
-                edit_img = img.copy()
-                draw = ImageDraw.Draw(edit_img)
-                
-                # 获取颜色
-                color_rgb = get_color_rgb(color)
-                
-                # 根据比例值计算实际大小（如果未指定）
-                if stroke_width_ratio is None:
-                    if edit_type == 'text':
-                        stroke_width = default_stroke_width
-                    else:
-                        stroke_width = calculate_smart_stroke_width(img_width, img_height)
-                else:
-                    # 根据比例和图片对角线长度计算线条粗细
-                    diagonal = math.sqrt(img_width ** 2 + img_height ** 2)
-                    stroke_width = max(1, int(diagonal * stroke_width_ratio))
-                
-                if font_size_ratio is None:
-                    if edit_type == 'text':
-                        font_size = calculate_smart_font_size(img_width, img_height)
-                    else:
-                        font_size = default_font_size
-                else:
-                    # 根据比例和图片较小边计算字体大小
-                    min_dimension = min(img_width, img_height)
-                    font_size = max(12, int(min_dimension * font_size_ratio))
-                
-                if edit_type == 'rectangle':
-                    # 计算实际像素坐标
-                    left = int(x * img_width)
-                    top = int(y * img_height)
-                    right = int((x + width) * img_width)
-                    bottom = int((y + height) * img_height)
-                    
-                    # 绘制矩形
-                    draw.rectangle([left, top, right, bottom], outline=color_rgb, width=stroke_width)
-                
-                elif edit_type == 'circle':
-                    # 计算实际像素坐标
-                    center_x = int(x * img_width)
-                    center_y = int(y * img_height)
-                    radius_px = int(radius * min(img_width, img_height))
-                    
-                    # 绘制圆形
-                    left = center_x - radius_px
-                    top = center_y - radius_px
-                    right = center_x + radius_px
-                    bottom = center_y + radius_px
-                    draw.ellipse([left, top, right, bottom], outline=color_rgb, width=stroke_width)
-                
-                elif edit_type == 'text':
-                    # 计算实际像素坐标
-                    pos_x = int(x * img_width)
-                    pos_y = int(y * img_height)
-                    
-                    # 获取支持多语言的字体
-                    font = get_system_font(font_size)  # 使用系统字体
-                    if font is None:
-                        font = ImageFont.load_default()
-                    
-                    # 根据text_position调整文字位置
-                    if text_position != "center":
-                        try:
-                            # 获取文字边界框来计算偏移
-                            bbox = draw.textbbox((0, 0), text, font=font)
-                            text_width = bbox[2] - bbox[0]
-                            text_height = bbox[3] - bbox[1]
-                            
-                            if text_position == "top_left":
-                                pass  # 不需要调整
-                            elif text_position == "top_center":
-                                pos_x -= text_width // 2
-                            elif text_position == "top_right":
-                                pos_x -= text_width
-                            elif text_position == "center_left":
-                                pos_y -= text_height // 2
-                            elif text_position == "center":
-                                pos_x -= text_width // 2
-                                pos_y -= text_height // 2
-                            elif text_position == "center_right":
-                                pos_x -= text_width
-                                pos_y -= text_height // 2
-                            elif text_position == "bottom_left":
-                                pos_y -= text_height
-                            elif text_position == "bottom_center":
-                                pos_x -= text_width // 2
-                                pos_y -= text_height
-                            elif text_position == "bottom_right":
-                                pos_x -= text_width
-                                pos_y -= text_height
-                        except:
-                            pass  # 如果计算失败，使用原始位置
-                    
-                    # 添加文字
-                    draw_text(draw, (pos_x, pos_y), text, color_rgb, font)
-                
-                elif edit_type == 'arrow':
-                    # 计算实际像素坐标
-                    start_x = int(x * img_width)
-                    start_y = int(y * img_height)
-                    end_x = int(arrow_end_x * img_width)
-                    end_y = int(arrow_end_y * img_height)
-                    
-                    # 绘制箭头
-                    draw_arrow(draw, start_x, start_y, end_x, end_y, color_rgb, stroke_width)
+        with IMAGE_CACHE.open(image_path) as img:
+            edit_img = apply_edit(
+                img, edit_type, color=color,
+                font_size_ratio=font_size_ratio,
+                stroke_width_ratio=stroke_width_ratio,
+                text_position=text_position,
+                **edit_params
+            )
             
             # 保存图片
             edit_img.save(output_path, quality=95)
@@ -803,7 +1740,8 @@ def encode_image_to_base64(image_path):
         raise RuntimeError(f"图片编码失败: {str(e)}")
 
 def batch_edit_image(image_path, edits, output_path=None):
-    """批量编辑图片：逐步应用多个编辑操作（特效类操作会改变图片，绘制类操作会添加元素）"""
+    """批量编辑图片：只解码一次，在内存中依次应用多个编辑操作，最后只编码保存一次
+    （特效类操作会改变图片，绘制类操作会添加元素），返回 (输出路径, 各步骤耗时)"""
     
     # 验证参数
     if not os.path.exists(image_path):
@@ -821,74 +1759,69 @@ def batch_edit_image(image_path, edits, output_path=None):
     if output_dir and not os.path.exists(output_dir):
         os.makedirs(output_dir, exist_ok=True)
     
+    timings = {"decode_ms": 0.0, "steps": [], "encode_ms": 0.0, "total_ms": 0.0}
+    
     try:
-        # 打开原始图片
-        current_image_path = image_path
-        temp_files = []  # 用于跟踪临时文件
+        total_start = time.perf_counter()
         
-        # 逐步应用每个编辑操作
-        for i, edit in enumerate(edits):
-            try:
-                # 验证必要参数
-                if 'editType' not in edit:
-                    raise ValueError(f"编辑操作{i+1}缺少必要参数: editType")
-                
-                edit_type = edit['editType']
-                
-                # 对于特效类操作，验证坐标参数（除了黑白特效）
-                if edit_type in ['rectangle', 'circle', 'text', 'arrow', 'crop_region']:
-                    if 'x' not in edit or 'y' not in edit:
-                        raise ValueError(f"编辑操作{i+1}缺少必要参数: x, y")
-                
-                # 为中间步骤生成临时输出路径
-                if i == len(edits) - 1:
-                    # 最后一步使用最终输出路径
-                    step_output_path = output_path
-                else:
-                    # 中间步骤使用临时文件
-                    temp_suffix = f"temp_step_{i+1}_{edit_type}"
-                    step_output_path = generate_output_path(current_image_path, temp_suffix)
-                    temp_files.append(step_output_path)
-                
-                # 调用edit_image函数应用单个编辑
-                current_image_path = edit_image(
-                    image_path=current_image_path,
-                    edit_type=edit_type,
-                    x=edit.get('x'),
-                    y=edit.get('y'),
-                    width=edit.get('width'),
-                    height=edit.get('height'),
-                    radius=edit.get('radius'),
-                    text=edit.get('text'),
-                    color=edit.get('color', 'red'),
-                    font_size_ratio=edit.get('fontSize'),
-                    stroke_width_ratio=edit.get('strokeWidth'),
-                    text_position=edit.get('textPosition', 'center'),
-                    arrow_end_x=edit.get('arrowEndX'),
-                    arrow_end_y=edit.get('arrowEndY'),
-                    scale_ratio=edit.get('scaleRatio'),
-                    output_path=step_output_path
-                )
-                
-            except Exception as e:
-                # 清理临时文件
-                for temp_file in temp_files:
-                    try:
-                        if os.path.exists(temp_file):
-                            os.remove(temp_file)
-                    except:
-                        pass
-                raise RuntimeError(f"处理编辑操作{i+1}时发生错误: {str(e)}")
-        
-        # 清理中间临时文件（保留最终结果）
-        for temp_file in temp_files:
-            try:
-                if os.path.exists(temp_file) and temp_file != output_path:
-                    os.remove(temp_file)
-            except:
-                pass
+        # 打开原始图片，只解码这一次
+        with IMAGE_CACHE.open(image_path) as img:
+            img.load()
+            timings["decode_ms"] = round((time.perf_counter() - total_start) * 1000, 2)
+            current_image = img
+            
+            # 逐步应用每个编辑操作，中间结果只保留在内存中
+            for i, edit in enumerate(edits):
+                try:
+                    # 验证必要参数
+                    if 'editType' not in edit:
+                        raise ValueError(f"编辑操作{i+1}缺少必要参数: editType")
+                    
+                    edit_type = edit['editType']
+                    
+                    # 对于特效类操作，验证坐标参数（除了黑白特效）
+                    if edit_type in ['rectangle', 'circle', 'text', 'arrow', 'crop_region']:
+                        if 'x' not in edit or 'y' not in edit:
+                            raise ValueError(f"编辑操作{i+1}缺少必要参数: x, y")
+                    
+                    edit_params = validate_edit_params(
+                        edit_type,
+                        x=edit.get('x'),
+                        y=edit.get('y'),
+                        width=edit.get('width'),
+                        height=edit.get('height'),
+                        radius=edit.get('radius'),
+                        text=edit.get('text'),
+                        arrow_end_x=edit.get('arrowEndX'),
+                        arrow_end_y=edit.get('arrowEndY'),
+                        scale_ratio=edit.get('scaleRatio')
+                    )
+                    
+                    step_start = time.perf_counter()
+                    current_image = apply_edit(
+                        current_image, edit_type,
+                        color=edit.get('color', 'red'),
+                        font_size_ratio=edit.get('fontSize'),
+                        stroke_width_ratio=edit.get('strokeWidth'),
+                        text_position=edit.get('textPosition', 'center'),
+                        **edit_params
+                    )
+                    timings["steps"].append({
+                        "step": i + 1,
+                        "editType": edit_type,
+                        "ms": round((time.perf_counter() - step_start) * 1000, 2)
+                    })
+                    
+                except Exception as e:
+                    raise RuntimeError(f"处理编辑操作{i+1}时发生错误: {str(e)}")
+            
+            # 所有操作完成后只编码保存一次
+            encode_start = time.perf_counter()
+            current_image.save(output_path, quality=95)
+            timings["encode_ms"] = round((time.perf_counter() - encode_start) * 1000, 2)
         
-        return output_path
+        timings["total_ms"] = round((time.perf_counter() - total_start) * 1000, 2)
+        return output_path, timings
         
     except Exception as e:
         raise RuntimeError(f"批量编辑过程中发生错误: {str(e)}")
@@ -934,443 +1867,610 @@ def combined_capture(video_path, timestamp_ms, edit_type, x=None, y=None, width=
     except Exception as e:
         raise RuntimeError(f"组合操作过程中发生错误: {str(e)}")
 
-def main():
-    """主函数"""
-    try:
-        # 读取输入
-        input_data = sys.stdin.readline().strip()
-        if not input_data:
-            raise ValueError("未收到输入数据")
+def run_command(params):
+    """执行一条命令，返回结果字典；出错时抛出异常（单次调用与常驻工作进程共用）"""
+    if not isinstance(params, dict):
+        raise ValueError("输入数据格式无效")
+    
+    # 检查必要参数
+    if 'command' not in params:
+        raise ValueError("缺少必要参数: command")
+    
+    command = params['command']
+    
+    # 检查依赖
+    deps_ok, deps_msg = check_dependencies()
+    if not deps_ok:
+        raise RuntimeError(f"依赖检查失败: {deps_msg}")
+    
+    result = None
+    
+    if command == 'CaptureFrame':
+        # 视频截图
+        if 'videoPath' not in params or 'timestampMs' not in params:
+            raise ValueError("CaptureFrame需要videoPath和timestampMs参数")
+        
+        screenshot_path = capture_frame(
+            video_path=params['videoPath'],
+            timestamp_ms=params['timestampMs'],
+            output_path=params.get('outputPath'),
+            quality=params.get('quality'),
+            format_type=params.get('format')
+        )
+        
+        abs_path = os.path.abspath(screenshot_path)
         
-        # 解析JSON
         try:
-            params = json.loads(input_data)
-        except json.JSONDecodeError:
-            raise ValueError("输入数据格式无效")
+            base64_image = encode_image_to_base64(screenshot_path)
+            image_content = {
+                "type": "image_url",
+                "image_url": {"url": base64_image}
+            }
+        except Exception:
+            image_content = None
         
-        # 检查必要参数
-        if 'command' not in params:
-            raise ValueError("缺少必要参数: command")
+        result = {
+            "content": [
+                {
+                    "type": "text",
+                    "text": f"视频截图成功！\n- 视频文件: {params['videoPath']}\n- 时间点: {params['timestampMs']}ms\n- 输出路径: {abs_path}\n- 图片质量: 最高品质\n\n如无特殊指示，默认请在接下来的对话中直接用图片地址将此图渲染在聊天气泡中的合适位置"
+                }
+            ]
+        }
         
-        command = params['command']
+        if image_content:
+            result["content"].append(image_content)
         
-        # 检查依赖
-        deps_ok, deps_msg = check_dependencies()
-        if not deps_ok:
-            raise RuntimeError(f"依赖检查失败: {deps_msg}")
+        result["image_path"] = abs_path
+        result["relative_path"] = screenshot_path
+    
+    elif command == 'CaptureFrames':
+        # 视频多帧截图（相近时间点共用一次解码）
+        if 'videoPath' not in params:
+            raise ValueError("CaptureFrames需要videoPath参数")
+        if not any(key in params for key in ('timestampsMs', 'intervalMs', 'sceneThreshold')):
+            raise ValueError("CaptureFrames需要timestampsMs、intervalMs或sceneThreshold参数")
         
-        result = None
+        frames = capture_frames(
+            video_path=params['videoPath'],
+            timestamps_ms=params.get('timestampsMs'),
+            interval_ms=params.get('intervalMs'),
+            scene_threshold=params.get('sceneThreshold'),
+            start_ms=params.get('startMs'),
+            end_ms=params.get('endMs'),
+            max_frames=params.get('maxFrames'),
+            output_dir=params.get('outputDir'),
+            quality=params.get('quality'),
+            format_type=params.get('format')
+        )
         
-        if command == 'CaptureFrame':
-            # 视频截图
-            if 'videoPath' not in params or 'timestampMs' not in params:
-                raise ValueError("CaptureFrame需要videoPath和timestampMs参数")
-            
-            screenshot_path = capture_frame(
-                video_path=params['videoPath'],
-                timestamp_ms=params['timestampMs'],
-                output_path=params.get('outputPath'),
-                quality=params.get('quality'),
-                format_type=params.get('format')
-            )
-            
-            abs_path = os.path.abspath(screenshot_path)
-            
-            try:
-                base64_image = encode_image_to_base64(screenshot_path)
-                image_content = {
-                    "type": "image_url",
-                    "image_url": {"url": base64_image}
-                }
-            except Exception:
-                image_content = None
-            
-            result = {
-                "content": [
-                    {
-                        "type": "text",
-                        "text": f"视频截图成功！\n- 视频文件: {params['videoPath']}\n- 时间点: {params['timestampMs']}ms\n- 输出路径: {abs_path}\n- 图片质量: 最高品质\n\n如无特殊指示，默认请在接下来的对话中直接用图片地址将此图渲染在聊天气泡中的合适位置"
-                    }
-                ]
-            }
-            
-            if image_content:
-                result["content"].append(image_content)
-            
-            result["image_path"] = abs_path
-            result["relative_path"] = screenshot_path
-        
-        elif command == 'ExtractVideoClip':
-            # 视频片段截取
-            required_params = ['videoPath', 'startMs', 'endMs']
-            for param in required_params:
-                if param not in params:
-                    raise ValueError(f"ExtractVideoClip需要{param}参数")
-            
-            # 处理数值参数的类型转换
-            start_ms = int(params['startMs'])
-            end_ms = int(params['endMs'])
-            
-            clip_path = extract_video_clip(
-                video_path=params['videoPath'],
-                start_ms=start_ms,
-                end_ms=end_ms,
-                output_path=params.get('outputPath'),
-                quality=params.get('quality', 'medium')
-            )
-            
-            abs_path = os.path.abspath(clip_path)
-            duration = end_ms - start_ms
-            
-            result = {
-                "content": [
-                    {
-                        "type": "text", 
-                        "text": f"视频片段截取成功！\n- 原视频文件: {params['videoPath']}\n- 开始时间: {start_ms}ms\n- 结束时间: {end_ms}ms\n- 片段时长: {duration}ms\n- 输出路径: {abs_path}\n- 质量: {params.get('quality', 'medium')}"
+        # 每个文件只编码一次，多个时间戳共用同一帧时复用
+        image_contents = {}
+        frame_lines = []
+        for i, frame in enumerate(frames):
+            if frame['path'] is None:
+                frame['image_path'] = None
+                frame_lines.append(f"  {i+1}. 请求 {frame['requested_ms']}ms: 超出视频范围，未截取")
+                continue
+            abs_path = os.path.abspath(frame['path'])
+            frame['image_path'] = abs_path
+            if frame['requested_ms'] is not None:
+                frame_lines.append(f"  {i+1}. 请求 {frame['requested_ms']}ms → 实际 {frame['frame_ms']}ms: {abs_path}")
+            else:
+                frame_lines.append(f"  {i+1}. {frame['frame_ms']}ms: {abs_path}")
+            if abs_path not in image_contents:
+                try:
+                    image_contents[abs_path] = {
+                        "type": "image_url",
+                        "image_url": {"url": encode_image_to_base64(frame['path'])}
                     }
-                ]
+                except Exception:
+                    image_contents[abs_path] = None
+        
+        result = {
+            "content": [
+                {
+                    "type": "text",
+                    "text": f"视频多帧截图成功！\n- 视频文件: {params['videoPath']}\n- 截取帧数: {len(image_contents)}\n- 各帧:\n" + "\n".join(frame_lines) + "\n\n如无特殊指示，默认请在接下来的对话中直接用图片地址将这些图渲染在聊天气泡中的合适位置"
+                }
+            ]
+        }
+        
+        result["content"].extend(content for content in image_contents.values() if content)
+        
+        result["frames"] = [
+            {"requested_ms": f['requested_ms'], "frame_ms": f['frame_ms'], "image_path": f['image_path'], "relative_path": f['path']}
+            for f in frames
+        ]
+        result["image_paths"] = list(image_contents)
+    
+    elif command == 'ProbeMedia':
+        # 读取媒体信息（优先使用缓存）
+        media_path = params.get('mediaPath') or params.get('videoPath') or params.get('audioPath')
+        if not media_path:
+            raise ValueError("ProbeMedia需要mediaPath参数")
+        with_keyframes = str(params.get('keyframes', False)).lower() in ('true', '1', 'yes')
+        
+        media_info, cached = get_media_cache().get(media_path, keyframes=with_keyframes)
+        
+        stream_lines = []
+        for stream in media_info['streams']:
+            if stream.get('codec_type') == 'video':
+                description = f"{stream.get('width')}x{stream.get('height')}"
+                if stream.get('frame_rate'):
+                    description += f" @ {stream['frame_rate']}fps"
+                if stream.get('rotation'):
+                    description += f"，旋转 {stream['rotation']}°"
+                if stream.get('attached_pic'):
+                    description += "（封面图）"
+            elif stream.get('codec_type') == 'audio':
+                description = f"{stream.get('sample_rate')}Hz，{stream.get('channels')}声道"
+            else:
+                description = ""
+            stream_lines.append(f"  #{stream.get('index')} {stream.get('codec_type')} / {stream.get('codec_name')} {description}".rstrip())
+        
+        duration_ms = media_info['duration_ms']
+        text = (
+            f"媒体信息：\n- 文件: {media_info['path']}\n"
+            f"- 格式: {media_info.get('format_name')}\n"
+            f"- 时长: {f'{duration_ms}ms ({format_time_ms(duration_ms)})' if duration_ms is not None else '未知'}\n"
+            f"- 帧率: {media_info.get('frame_rate') or '未知'}\n"
+            f"- 流:\n" + "\n".join(stream_lines)
+        )
+        if with_keyframes:
+            keyframes_ms = media_info['keyframes_ms']
+            preview = ", ".join(str(t) for t in keyframes_ms[:20]) + (" ..." if len(keyframes_ms) > 20 else "")
+            text += f"\n- 关键帧: {len(keyframes_ms)} 个" + (f"（ms）: {preview}" if keyframes_ms else "")
+        text += f"\n- 来自缓存: {'是' if cached else '否'}"
+        
+        result = {
+            "content": [
+                {
+                    "type": "text",
+                    "text": text
+                }
+            ],
+            "media_info": media_info,
+            "cached": cached
+        }
+    
+    elif command == 'ExtractVideoClip':
+        # 视频片段截取
+        required_params = ['videoPath', 'startMs', 'endMs']
+        for param in required_params:
+            if param not in params:
+                raise ValueError(f"ExtractVideoClip需要{param}参数")
+        
+        # 处理数值参数的类型转换
+        start_ms = int(params['startMs'])
+        end_ms = int(params['endMs'])
+        
+        clip_path = extract_video_clip(
+            video_path=params['videoPath'],
+            start_ms=start_ms,
+            end_ms=end_ms,
+            output_path=params.get('outputPath'),
+            quality=params.get('quality', 'medium')
+        )
+        
+        abs_path = os.path.abspath(clip_path)
+        duration = end_ms - start_ms
+        
+        result = {
+            "content": [
+                {
+                    "type": "text", 
+                    "text": f"视频片段截取成功！\n- 原视频文件: {params['videoPath']}\n- 开始时间: {start_ms}ms\n- 结束时间: {end_ms}ms\n- 片段时长: {duration}ms\n- 输出路径: {abs_path}\n- 质量: {params.get('quality', 'medium')}"
+                }
+            ]
+        }
+        
+        result["video_path"] = abs_path
+        result["relative_path"] = clip_path
+    
+    elif command == 'ExtractAudioClip':
+        # 音频片段截取
+        required_params = ['audioPath', 'startMs', 'endMs']
+        for param in required_params:
+            if param not in params:
+                raise ValueError(f"ExtractAudioClip需要{param}参数")
+        
+        # 处理数值参数的类型转换
+        start_ms = int(params['startMs'])
+        end_ms = int(params['endMs'])
+        
+        clip_path = extract_audio_clip(
+            audio_path=params['audioPath'],
+            start_ms=start_ms,
+            end_ms=end_ms,
+            output_path=params.get('outputPath'),
+            format_type=params.get('format', 'mp3')
+        )
+        
+        abs_path = os.path.abspath(clip_path)
+        duration = end_ms - start_ms
+        
+        result = {
+            "content": [
+                {
+                    "type": "text",
+                    "text": f"音频片段截取成功！\n- 原音频文件: {params['audioPath']}\n- 开始时间: {start_ms}ms\n- 结束时间: {end_ms}ms\n- 片段时长: {duration}ms\n- 输出路径: {abs_path}\n- 格式: {params.get('format', 'mp3')}"
+                }
+            ]
+        }
+        
+        result["audio_path"] = abs_path
+        result["relative_path"] = clip_path
+    
+    elif command == 'CropImage':
+        # 图像区域截取
+        required_params = ['imagePath', 'x', 'y', 'width', 'height']
+        for param in required_params:
+            if param not in params:
+                raise ValueError(f"CropImage需要{param}参数")
+        
+        cropped_path = crop_image(
+            image_path=params['imagePath'],
+            x=float(params['x']),
+            y=float(params['y']),
+            width=float(params['width']),
+            height=float(params['height']),
+            output_path=params.get('outputPath')
+        )
+        
+        abs_path = os.path.abspath(cropped_path)
+        
+        try:
+            base64_image = encode_image_to_base64(cropped_path)
+            image_content = {
+                "type": "image_url",
+                "image_url": {"url": base64_image}
             }
+        except Exception:
+            image_content = None
+        
+        result = {
+            "content": [
+                {
+                    "type": "text",
+                    "text": f"图像区域截取成功！\n- 原图片文件: {params['imagePath']}\n- 截取区域: ({params['x']}, {params['y']}) - ({params['x']+params['width']}, {params['y']+params['height']})\n- 输出路径: {abs_path}"
+                }
+            ]
+        }
+        
+        if image_content:
+            result["content"].append(image_content)
+        
+        result["image_path"] = abs_path
+        result["relative_path"] = cropped_path
+    
+    elif command == 'EditImage':
+        # 图像编辑
+        required_params = ['imagePath', 'editType']
+        for param in required_params:
+            if param not in params:
+                raise ValueError(f"EditImage需要{param}参数")
+        
+        # 处理数值参数的类型转换
+        font_size_ratio = params.get('fontSize')
+        if font_size_ratio is not None:
+            font_size_ratio = float(font_size_ratio)
+        
+        stroke_width_ratio = params.get('strokeWidth')
+        if stroke_width_ratio is not None:
+            stroke_width_ratio = float(stroke_width_ratio)
+        
+        # 处理坐标参数（对于需要坐标的编辑类型）
+        x = params.get('x')
+        if x is not None:
+            x = float(x)
             
-            result["video_path"] = abs_path
-            result["relative_path"] = clip_path
-        
-        elif command == 'ExtractAudioClip':
-            # 音频片段截取
-            required_params = ['audioPath', 'startMs', 'endMs']
-            for param in required_params:
-                if param not in params:
-                    raise ValueError(f"ExtractAudioClip需要{param}参数")
+        y = params.get('y')
+        if y is not None:
+            y = float(y)
+        
+        width = params.get('width')
+        if width is not None:
+            width = float(width)
             
-            # 处理数值参数的类型转换
-            start_ms = int(params['startMs'])
-            end_ms = int(params['endMs'])
+        height = params.get('height')
+        if height is not None:
+            height = float(height)
             
-            clip_path = extract_audio_clip(
-                audio_path=params['audioPath'],
-                start_ms=start_ms,
-                end_ms=end_ms,
-                output_path=params.get('outputPath'),
-                format_type=params.get('format', 'mp3')
-            )
+        radius = params.get('radius')
+        if radius is not None:
+            radius = float(radius)
             
-            abs_path = os.path.abspath(clip_path)
-            duration = end_ms - start_ms
+        arrow_end_x = params.get('arrowEndX')
+        if arrow_end_x is not None:
+            arrow_end_x = float(arrow_end_x)
             
-            result = {
-                "content": [
-                    {
-                        "type": "text",
-                        "text": f"音频片段截取成功！\n- 原音频文件: {params['audioPath']}\n- 开始时间: {start_ms}ms\n- 结束时间: {end_ms}ms\n- 片段时长: {duration}ms\n- 输出路径: {abs_path}\n- 格式: {params.get('format', 'mp3')}"
-                    }
-                ]
+        arrow_end_y = params.get('arrowEndY')
+        if arrow_end_y is not None:
+            arrow_end_y = float(arrow_end_y)
+        
+        scale_ratio = params.get('scaleRatio')
+        if scale_ratio is not None:
+            scale_ratio = float(scale_ratio)
+        
+        edited_path = edit_image(
+            image_path=params['imagePath'],
+            edit_type=params['editType'],
+            x=x,
+            y=y,
+            width=width,
+            height=height,
+            radius=radius,
+            text=params.get('text'),
+            color=params.get('color', 'red'),
+            font_size_ratio=font_size_ratio,
+            stroke_width_ratio=stroke_width_ratio,
+            text_position=params.get('textPosition', 'center'),
+            arrow_end_x=arrow_end_x,
+            arrow_end_y=arrow_end_y,
+            scale_ratio=scale_ratio,
+            output_path=params.get('outputPath')
+        )
+        
+        abs_path = os.path.abspath(edited_path)
+        
+        try:
+            base64_image = encode_image_to_base64(edited_path)
+            image_content = {
+                "type": "image_url",
+                "image_url": {"url": base64_image}
             }
-            
-            result["audio_path"] = abs_path
-            result["relative_path"] = clip_path
-        
-        elif command == 'CropImage':
-            # 图像区域截取
-            required_params = ['imagePath', 'x', 'y', 'width', 'height']
-            for param in required_params:
-                if param not in params:
-                    raise ValueError(f"CropImage需要{param}参数")
-            
-            cropped_path = crop_image(
-                image_path=params['imagePath'],
-                x=float(params['x']),
-                y=float(params['y']),
-                width=float(params['width']),
-                height=float(params['height']),
-                output_path=params.get('outputPath')
-            )
-            
-            abs_path = os.path.abspath(cropped_path)
-            
-            try:
-                base64_image = encode_image_to_base64(cropped_path)
-                image_content = {
-                    "type": "image_url",
-                    "image_url": {"url": base64_image}
+        except Exception:
+            image_content = None
+        
+        edit_desc = f"编辑类型: {params['editType']}"
+        if params['editType'] == 'text' and params.get('text'):
+            edit_desc += f", 文字: {params['text']}"
+        elif params['editType'] == 'resolution_reduction' and params.get('scaleRatio'):
+            edit_desc += f", 分辨率比例: {params['scaleRatio']}"
+        if params.get('color'):
+            edit_desc += f", 颜色: {params.get('color', 'red')}"
+        
+        # 构建位置信息
+        position_info = ""
+        if x is not None and y is not None:
+            position_info = f"编辑位置: ({x}, {y})"
+        
+        result = {
+            "content": [
+                {
+                    "type": "text",
+                    "text": f"图像编辑成功！\n- 原图片文件: {params['imagePath']}\n- {edit_desc}\n- {position_info}\n- 输出路径: {abs_path}"
                 }
-            except Exception:
-                image_content = None
-            
-            result = {
-                "content": [
-                    {
-                        "type": "text",
-                        "text": f"图像区域截取成功！\n- 原图片文件: {params['imagePath']}\n- 截取区域: ({params['x']}, {params['y']}) - ({params['x']+params['width']}, {params['y']+params['height']})\n- 输出路径: {abs_path}"
-                    }
-                ]
-            }
-            
-            if image_content:
-                result["content"].append(image_content)
-            
-            result["image_path"] = abs_path
-            result["relative_path"] = cropped_path
-        
-        elif command == 'EditImage':
-            # 图像编辑
-            required_params = ['imagePath', 'editType']
-            for param in required_params:
-                if param not in params:
-                    raise ValueError(f"EditImage需要{param}参数")
-            
-            # 处理数值参数的类型转换
-            font_size_ratio = params.get('fontSize')
-            if font_size_ratio is not None:
-                font_size_ratio = float(font_size_ratio)
-            
-            stroke_width_ratio = params.get('strokeWidth')
-            if stroke_width_ratio is not None:
-                stroke_width_ratio = float(stroke_width_ratio)
-            
-            # 处理坐标参数（对于需要坐标的编辑类型）
-            x = params.get('x')
-            if x is not None:
-                x = float(x)
-                
-            y = params.get('y')
-            if y is not None:
-                y = float(y)
-            
-            width = params.get('width')
-            if width is not None:
-                width = float(width)
-                
-            height = params.get('height')
-            if height is not None:
-                height = float(height)
-                
-            radius = params.get('radius')
-            if radius is not None:
-                radius = float(radius)
-                
-            arrow_end_x = params.get('arrowEndX')
-            if arrow_end_x is not None:
-                arrow_end_x = float(arrow_end_x)
-                
-            arrow_end_y = params.get('arrowEndY')
-            if arrow_end_y is not None:
-                arrow_end_y = float(arrow_end_y)
-            
-            scale_ratio = params.get('scaleRatio')
-            if scale_ratio is not None:
-                scale_ratio = float(scale_ratio)
-            
-            edited_path = edit_image(
-                image_path=params['imagePath'],
-                edit_type=params['editType'],
-                x=x,
-                y=y,
-                width=width,
-                height=height,
-                radius=radius,
-                text=params.get('text'),
-                color=params.get('color', 'red'),
-                font_size_ratio=font_size_ratio,
-                stroke_width_ratio=stroke_width_ratio,
-                text_position=params.get('textPosition', 'center'),
-                arrow_end_x=arrow_end_x,
-                arrow_end_y=arrow_end_y,
-                scale_ratio=scale_ratio,
-                output_path=params.get('outputPath')
-            )
-            
-            abs_path = os.path.abspath(edited_path)
-            
+            ]
+        }
+        
+        if image_content:
+            result["content"].append(image_content)
+        
+        result["image_path"] = abs_path
+        result["relative_path"] = edited_path
+    
+    elif command == 'BatchEditImage':
+        # 批量图像编辑
+        required_params = ['imagePath', 'edits']
+        for param in required_params:
+            if param not in params:
+                raise ValueError(f"BatchEditImage需要{param}参数")
+        
+        # 解析edits参数
+        edits = params['edits']
+        if isinstance(edits, str):
             try:
-                base64_image = encode_image_to_base64(edited_path)
-                image_content = {
-                    "type": "image_url",
-                    "image_url": {"url": base64_image}
-                }
-            except Exception:
-                image_content = None
-            
-            edit_desc = f"编辑类型: {params['editType']}"
-            if params['editType'] == 'text' and params.get('text'):
-                edit_desc += f", 文字: {params['text']}"
-            elif params['editType'] == 'resolution_reduction' and params.get('scaleRatio'):
-                edit_desc += f", 分辨率比例: {params['scaleRatio']}"
-            if params.get('color'):
-                edit_desc += f", 颜色: {params.get('color', 'red')}"
-            
-            # 构建位置信息
-            position_info = ""
-            if x is not None and y is not None:
-                position_info = f"编辑位置: ({x}, {y})"
-            
-            result = {
-                "content": [
-                    {
-                        "type": "text",
-                        "text": f"图像编辑成功！\n- 原图片文件: {params['imagePath']}\n- {edit_desc}\n- {position_info}\n- 输出路径: {abs_path}"
-                    }
-                ]
+                edits = json.loads(edits)
+            except json.JSONDecodeError:
+                raise ValueError("edits参数必须是有效的JSON数组")
+        
+        if not isinstance(edits, list) or len(edits) == 0:
+            raise ValueError("编辑列表必须是非空数组")
+        
+        edited_path, timings = batch_edit_image(
+            image_path=params['imagePath'],
+            edits=edits,
+            output_path=params.get('outputPath')
+        )
+        
+        abs_path = os.path.abspath(edited_path)
+        
+        try:
+            base64_image = encode_image_to_base64(edited_path)
+            image_content = {
+                "type": "image_url",
+                "image_url": {"url": base64_image}
             }
-            
-            if image_content:
-                result["content"].append(image_content)
-            
-            result["image_path"] = abs_path
-            result["relative_path"] = edited_path
-        
-        elif command == 'BatchEditImage':
-            # 批量图像编辑
-            required_params = ['imagePath', 'edits']
-            for param in required_params:
-                if param not in params:
-                    raise ValueError(f"BatchEditImage需要{param}参数")
-            
-            # 解析edits参数
-            edits = params['edits']
-            if isinstance(edits, str):
-                try:
-                    edits = json.loads(edits)
-                except json.JSONDecodeError:
-                    raise ValueError("edits参数必须是有效的JSON数组")
-            
-            if not isinstance(edits, list) or len(edits) == 0:
-                raise ValueError("编辑列表必须是非空数组")
-            
-            edited_path = batch_edit_image(
-                image_path=params['imagePath'],
-                edits=edits,
-                output_path=params.get('outputPath')
-            )
-            
-            abs_path = os.path.abspath(edited_path)
-            
-            try:
-                base64_image = encode_image_to_base64(edited_path)
-                image_content = {
-                    "type": "image_url",
-                    "image_url": {"url": base64_image}
+        except Exception:
+            image_content = None
+        
+        edit_count = len(edits)
+        
+        # 各步骤耗时
+        step_timings = "、".join(f"{step['step']}.{step['editType']} {step['ms']}ms" for step in timings["steps"])
+        timing_desc = f"解码 {timings['decode_ms']}ms，{step_timings}，编码 {timings['encode_ms']}ms，总计 {timings['total_ms']}ms"
+        
+        result = {
+            "content": [
+                {
+                    "type": "text",
+                    "text": f"批量图像编辑成功！\n- 原图片文件: {params['imagePath']}\n- 编辑操作数量: {edit_count}\n- 处理耗时: {timing_desc}\n- 输出路径: {abs_path}"
                 }
-            except Exception:
-                image_content = None
-            
-            edit_count = len(params['edits'])
-            
-            result = {
-                "content": [
-                    {
-                        "type": "text",
-                        "text": f"批量图像编辑成功！\n- 原图片文件: {params['imagePath']}\n- 编辑操作数量: {edit_count}\n- 输出路径: {abs_path}"
-                    }
-                ]
-            }
-            
-            if image_content:
-                result["content"].append(image_content)
-            
-            result["image_path"] = abs_path
-            result["relative_path"] = edited_path
-        
-        elif command == 'CombinedCapture':
-            # 组合功能：视频截图+图像编辑
-            required_params = ['videoPath', 'timestampMs', 'editType']
-            for param in required_params:
-                if param not in params:
-                    raise ValueError(f"CombinedCapture需要{param}参数")
-            
-            # 处理数值参数的类型转换
-            font_size_ratio = params.get('fontSize')
-            if font_size_ratio is not None:
-                font_size_ratio = float(font_size_ratio)
-            
-            stroke_width_ratio = params.get('strokeWidth')
-            if stroke_width_ratio is not None:
-                stroke_width_ratio = float(stroke_width_ratio)
-            
-            # 处理坐标参数
-            x = params.get('x')
-            if x is not None:
-                x = float(x)
-                
-            y = params.get('y')
-            if y is not None:
-                y = float(y)
+            ]
+        }
+        
+        if image_content:
+            result["content"].append(image_content)
+        
+        result["image_path"] = abs_path
+        result["relative_path"] = edited_path
+        result["timings"] = timings
+    
+    elif command == 'CombinedCapture':
+        # 组合功能：视频截图+图像编辑
+        required_params = ['videoPath', 'timestampMs', 'editType']
+        for param in required_params:
+            if param not in params:
+                raise ValueError(f"CombinedCapture需要{param}参数")
+        
+        # 处理数值参数的类型转换
+        font_size_ratio = params.get('fontSize')
+        if font_size_ratio is not None:
+            font_size_ratio = float(font_size_ratio)
+        
+        stroke_width_ratio = params.get('strokeWidth')
+        if stroke_width_ratio is not None:
+            stroke_width_ratio = float(stroke_width_ratio)
+        
+        # 处理坐标参数
+        x = params.get('x')
+        if x is not None:
+            x = float(x)
             
-            width = params.get('width')
-            if width is not None:
-                width = float(width)
-                
-            height = params.get('height')
-            if height is not None:
-                height = float(height)
-                
-            radius = params.get('radius')
-            if radius is not None:
-                radius = float(radius)
-                
-            arrow_end_x = params.get('arrowEndX')
-            if arrow_end_x is not None:
-                arrow_end_x = float(arrow_end_x)
-                
-            arrow_end_y = params.get('arrowEndY')
-            if arrow_end_y is not None:
-                arrow_end_y = float(arrow_end_y)
+        y = params.get('y')
+        if y is not None:
+            y = float(y)
+        
+        width = params.get('width')
+        if width is not None:
+            width = float(width)
             
-            scale_ratio = params.get('scaleRatio')
-            if scale_ratio is not None:
-                scale_ratio = float(scale_ratio)
+        height = params.get('height')
+        if height is not None:
+            height = float(height)
             
-            combined_path = combined_capture(
-                video_path=params['videoPath'],
-                timestamp_ms=int(params['timestampMs']),
-                edit_type=params['editType'],
-                x=x,
-                y=y,
-                width=width,
-                height=height,
-                radius=radius,
-                text=params.get('text'),
-                color=params.get('color', 'red'),
-                font_size_ratio=font_size_ratio,
-                stroke_width_ratio=stroke_width_ratio,
-                text_position=params.get('textPosition', 'center'),
-                arrow_end_x=arrow_end_x,
-                arrow_end_y=arrow_end_y,
-                scale_ratio=scale_ratio,
-                output_path=params.get('outputPath')
-            )
+        radius = params.get('radius')
+        if radius is not None:
+            radius = float(radius)
             
-            abs_path = os.path.abspath(combined_path)
+        arrow_end_x = params.get('arrowEndX')
+        if arrow_end_x is not None:
+            arrow_end_x = float(arrow_end_x)
             
-            try:
-                base64_image = encode_image_to_base64(combined_path)
-                image_content = {
-                    "type": "image_url",
-                    "image_url": {"url": base64_image}
+        arrow_end_y = params.get('arrowEndY')
+        if arrow_end_y is not None:
+            arrow_end_y = float(arrow_end_y)
+        
+        scale_ratio = params.get('scaleRatio')
+        if scale_ratio is not None:
+            scale_ratio = float(scale_ratio)
+        
+        combined_path = combined_capture(
+            video_path=params['videoPath'],
+            timestamp_ms=int(params['timestampMs']),
+            edit_type=params['editType'],
+            x=x,
+            y=y,
+            width=width,
+            height=height,
+            radius=radius,
+            text=params.get('text'),
+            color=params.get('color', 'red'),
+            font_size_ratio=font_size_ratio,
+            stroke_width_ratio=stroke_width_ratio,
+            text_position=params.get('textPosition', 'center'),
+            arrow_end_x=arrow_end_x,
+            arrow_end_y=arrow_end_y,
+            scale_ratio=scale_ratio,
+            output_path=params.get('outputPath')
+        )
+        
+        abs_path = os.path.abspath(combined_path)
+        
+        try:
+            base64_image = encode_image_to_base64(combined_path)
+            image_content = {
+                "type": "image_url",
+                "image_url": {"url": base64_image}
+            }
+        except Exception:
+            image_content = None
+        
+        edit_desc = f"编辑类型: {params['editType']}"
+        if params['editType'] == 'text' and params.get('text'):
+            edit_desc += f", 文字: {params['text']}"
+        edit_desc += f", 颜色: {params.get('color', 'red')}"
+        
+        result = {
+            "content": [
+                {
+                    "type": "text",
+                    "text": f"组合操作成功！\n- 视频文件: {params['videoPath']}\n- 截图时间: {params['timestampMs']}ms\n- {edit_desc}\n- 编辑位置: ({params['x']}, {params['y']})\n- 输出路径: {abs_path}"
                 }
-            except Exception:
-                image_content = None
+            ]
+        }
+        
+        if image_content:
+            result["content"].append(image_content)
+        
+        result["image_path"] = abs_path
+        result["relative_path"] = combined_path
+    
+    else:
+        raise ValueError(f"不支持的命令: {command}")
+    
+    return result
+
+def serve_worker():
+    """常驻工作进程：从stdin逐行读取JSON请求（NDJSON），每个请求输出一行JSON结果，stdin关闭时退出
+    字体、依赖检查和已解码图片在请求之间保持缓存；请求中的requestId会原样附带在响应中"""
+    IMAGE_CACHE.max_bytes = int(os.getenv('WORKER_IMAGE_CACHE_MB', '256')) * 1024 * 1024
+    logger.info(f"MediaShot 工作进程已启动 (PID: {os.getpid()})")
+    
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        
+        request_id = None
+        try:
+            try:
+                params = json.loads(line)
+            except json.JSONDecodeError:
+                raise ValueError("输入数据格式无效")
             
-            edit_desc = f"编辑类型: {params['editType']}"
-            if params['editType'] == 'text' and params.get('text'):
-                edit_desc += f", 文字: {params['text']}"
-            edit_desc += f", 颜色: {params.get('color', 'red')}"
+            if isinstance(params, dict):
+                request_id = params.pop('requestId', None)
             
-            result = {
-                "content": [
-                    {
-                        "type": "text",
-                        "text": f"组合操作成功！\n- 视频文件: {params['videoPath']}\n- 截图时间: {params['timestampMs']}ms\n- {edit_desc}\n- 编辑位置: ({params['x']}, {params['y']})\n- 输出路径: {abs_path}"
-                    }
-                ]
+            response = {
+                "status": "success",
+                "result": run_command(params)
+            }
+        except Exception as e:
+            response = {
+                "status": "error",
+                "error": str(e)
             }
-            
-            if image_content:
-                result["content"].append(image_content)
-            
-            result["image_path"] = abs_path
-            result["relative_path"] = combined_path
         
-        else:
-            raise ValueError(f"不支持的命令: {command}")
+        if request_id is not None:
+            response["requestId"] = request_id
+        
+        sys.stdout.write(json.dumps(response, ensure_ascii=False) + "\n")
+        sys.stdout.flush()
+    
+    logger.info(f"MediaShot 工作进程退出，图片缓存: {IMAGE_CACHE.stats()}，媒体信息缓存: {get_media_cache().stats()}")
+
+def main():
+    """主函数"""
+    if '--worker' in sys.argv[1:]:
+        serve_worker()
+        return
+    
+    try:
+        # 读取输入
+        input_data = sys.stdin.readline().strip()
+        if not input_data:
+            raise ValueError("未收到输入数据")
+        
+        # 解析JSON
+        try:
+            params = json.loads(input_data)
+        except json.JSONDecodeError:
+            raise ValueError("输入数据格式无效")
+        
+        result = run_command(params)
         
         # 输出结果
         print(json.dumps({